@@ -43,14 +43,37 @@ def config():
     table.add_row("APP_VERSION", settings.APP_VERSION)
     table.add_row("DATABASE_URL", settings.DATABASE_URL)
     table.add_row("RABBITMQ_URL", settings.RABBITMQ_URL)
+    table.add_row("QUEUE_BACKEND", settings.QUEUE_BACKEND)
     table.add_row("SEARCH_QUERY", settings.SEARCH_QUERY)
     table.add_row("SEARCH_AREAS", str(settings.SEARCH_AREAS))
     table.add_row("HH_ACCESS_TOKEN", "Установлен" if settings.HH_ACCESS_TOKEN else "Отсутствует")
     table.add_row("HH_RESUME_ID", settings.HH_RESUME_ID or "Отсутствует")
     table.add_row("DEEPSEEK_API_KEY", "Установлен" if settings.DEEPSEEK_API_KEY else "Отсутствует")
+    table.add_row("ACCOUNTS_FILE", settings.ACCOUNTS_FILE or "Не задан")
     
     console.print(table)
 
+    from src.core.accounts import accounts
+
+    accounts_table = Table(title="Аккаунты HH")
+    accounts_table.add_column("Аккаунт", style="cyan")
+    accounts_table.add_column("Токен")
+    accounts_table.add_column("Резюме")
+    accounts_table.add_column("Лимиты (час / сутки)")
+    accounts_table.add_column("Вес", justify="right")
+    accounts_table.add_column("Очередь писем")
+    for account in accounts.all():
+        accounts_table.add_row(
+            account.id,
+            "Установлен" if account.hh_access_token else "Отсутствует",
+            account.resume_id or "Отсутствует",
+            f"{settings.REQUESTS_PER_HOUR if account.requests_per_hour is None else account.requests_per_hour} / "
+            f"{settings.REQUESTS_PER_DAY if account.requests_per_day is None else account.requests_per_day}",
+            f"{account.weight:g}",
+            account.letter_queue,
+        )
+    console.print(accounts_table)
+
 
 @app.command()
 def worker(
@@ -68,6 +91,23 @@ def worker(
         typer.echo("Доступные типы: vacancy, sender")
 
 
+@app.command("run-all")
+def run_all(
+    backend: str = typer.Option("memory", "--backend", help="Бэкенд очередей: memory или rabbitmq")
+):
+    """Запуск поиска, обработки и отправки в одном процессе"""
+    from src.services.queue_manager import QUEUE_BACKENDS
+
+    if backend not in QUEUE_BACKENDS:
+        typer.echo(f"Неизвестный бэкенд очередей: {backend}")
+        typer.echo(f"Доступные: {', '.join(QUEUE_BACKENDS)}")
+        raise typer.Exit(code=1)
+
+    settings.QUEUE_BACKEND = backend
+    from src.workers.pipeline import run_pipeline
+    asyncio.run(run_pipeline())
+
+
 @app.command()
 def search():
     """Поиск новых вакансий"""
@@ -88,31 +128,65 @@ def search():
 def status():
     """Показать статус системы"""
     from src.core.database import db
-    from src.services.queue_manager import RabbitMQManager
+    from src.services.queue_manager import create_queue_manager
+    from src.services.amqp_pool import amqp_pool
+    from src.core.accounts import letter_queue
     
     async def get_status():
-        await db.create_tables()
-        
-        # Статистика БД
-        vacancies = await db.get_all_vacancies()
-        unprocessed = await db.get_unprocessed_vacancies()
-        with_letters = await db.get_vacancies_with_cover_letters()
+        try:
+            await db.create_tables()
+            
+            # Статистика БД
+            vacancies = await db.get_all_vacancies()
+            unprocessed = await db.get_unprocessed_vacancies()
+            with_letters = await db.get_vacancies_with_cover_letters()
+            duplicates = await db.get_duplicate_stats()
+            llm_usage = await db.get_llm_usage_stats()
+            negotiations = await db.get_negotiation_stats()
+            breakers = await db.get_breaker_states()
+            reviews = await db.get_letter_review_stats()
+            account_letters = await db.get_account_letter_stats()
+        finally:
+            await db.engine.dispose()
         applied = [v for v in vacancies if v.applied]
+        expired = [v for v in vacancies if v.letter_expired_at]
         
-        # Статистика очередей
-        rabbitmq = RabbitMQManager()
+        # Статистика очередей: очереди memory живут только внутри процесса run-all
         queue_stats = {}
-        if await rabbitmq.connect():
-            queue_stats = await rabbitmq.get_queue_stats()
-            await rabbitmq.close()
+        if settings.QUEUE_BACKEND == "memory":
+            broker = 'в процессе run-all'
+        else:
+            queue_manager = create_queue_manager()
+            broker = 'недоступен'
+            if await queue_manager.connect(max_retries=1):
+                if await queue_manager.health_check():
+                    broker = 'OK'
+                queue_stats = await queue_manager.get_queue_stats()
+                await queue_manager.close()
+                await amqp_pool.close()
         
         return {
             'vacancies_total': len(vacancies),
             'vacancies_unprocessed': len(unprocessed),
             'vacancies_with_letters': len(with_letters),
             'vacancies_applied': len(applied),
+            'letters_expired': len(expired),
+            'broker': broker,
             'queue_vacancies': queue_stats.get(settings.QUEUE_VACANCIES, 0),
-            'queue_letters': queue_stats.get(settings.QUEUE_COVER_LETTERS, 0)
+            'queue_letters': queue_stats.get(settings.QUEUE_COVER_LETTERS, 0),
+            'duplicates_letters': duplicates.get('cover_letter', 0),
+            'duplicates_sends': duplicates.get('send', 0),
+            'letters_llm': llm_usage.get('llm', {}).get('letters', 0),
+            'letters_cache': llm_usage.get('cache', {}).get('letters', 0),
+            'letters_template': llm_usage.get('template', {}).get('letters', 0),
+            'llm_tokens': sum(u['prompt_tokens'] + u['completion_tokens'] for u in llm_usage.values()),
+            'llm_cost': sum(u['cost'] for u in llm_usage.values()),
+            'negotiations': negotiations,
+            'breakers': breakers,
+            'reviews': reviews,
+            'account_letters': account_letters,
+            'account_queues': {account_id: queue_stats.get(letter_queue(account_id), 0)
+                               for account_id in account_letters}
         }
     
     stats = asyncio.run(get_status())
@@ -130,12 +204,223 @@ def status():
     table.add_row("Необработанных", str(stats['vacancies_unprocessed']))
     table.add_row("С письмами", str(stats['vacancies_with_letters']))
     table.add_row("Отправленных", str(stats['vacancies_applied']))
+    table.add_row("Просроченных писем", str(stats['letters_expired']))
+    table.add_row(f"Брокер ({settings.QUEUE_BACKEND})", stats['broker'])
     table.add_row("Очередь вакансий", str(stats['queue_vacancies']))
     table.add_row("Очередь писем", str(stats['queue_letters']))
+    table.add_row("Подавлено повторов (письма)", str(stats['duplicates_letters']))
+    table.add_row("Подавлено повторов (отклики)", str(stats['duplicates_sends']))
+    table.add_row("Письма LLM / кэш / шаблон",
+                  f"{stats['letters_llm']} / {stats['letters_cache']} / {stats['letters_template']}")
+    table.add_row("Токены DeepSeek", str(stats['llm_tokens']))
+    table.add_row("Стоимость DeepSeek", f"${stats['llm_cost']:.4f}")
+    for breaker in stats['breakers']:
+        state = breaker.state
+        if breaker.state != 'closed' and breaker.reason:
+            state += f" ({breaker.reason})"
+        table.add_row(f"Предохранитель HH ({breaker.role})", f"{state}, размыканий: {breaker.trips}")
+    if stats['negotiations']:
+        table.add_row("Отклики на HH по статусам",
+                      ", ".join(f"{state}: {count}" for state, count in sorted(stats['negotiations'].items())))
+    if stats['reviews']:
+        table.add_row("Письма на проверке по статусам",
+                      ", ".join(f"{status}: {count}" for status, count in sorted(stats['reviews'].items())))
+    for account_id, counts in sorted(stats['account_letters'].items()):
+        queued = stats['account_queues'][account_id]
+        table.add_row(f"Аккаунт {account_id}",
+                      ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+                      + f"; в очереди: {queued}")
     
     console.print(table)
 
 
+@app.command()
+def review(
+    approve: Optional[str] = typer.Option(None, "--approve", help="hh_id через запятую или all"),
+    reject: Optional[str] = typer.Option(None, "--reject", help="hh_id через запятую или all"),
+    limit: int = typer.Option(settings.REVIEW_PAGE_SIZE, "--limit", help="Писем в списке"),
+    show_letters: bool = typer.Option(False, "--letters", help="Показать тексты писем"),
+):
+    """Письма интерактивного режима: список ожидающих, одобрение и отклонение пачкой"""
+    from src.core.database import db
+    from src.services.review_queue import REVIEW_PENDING, REVIEW_APPROVED, REVIEW_REJECTED
+
+    def parse_ids(value, pending_ids):
+        if value is None:
+            return []
+        if value.strip().lower() == "all":
+            return pending_ids
+        return [vacancy_id.strip() for vacancy_id in value.split(",") if vacancy_id.strip()]
+
+    async def run():
+        await db.create_tables()
+        try:
+            pending = await db.get_letter_reviews((REVIEW_PENDING,), limit)
+            pending_ids = [letter.vacancy_id for letter in pending]
+            # Воркер отправки заметит решения при следующей проверке (REVIEW_POLL_INTERVAL)
+            approved = rejected = 0
+            if approve is not None:
+                approved = await db.set_letter_review_status(
+                    parse_ids(approve, pending_ids), REVIEW_APPROVED, from_statuses=(REVIEW_PENDING,))
+            if reject is not None:
+                rejected = await db.set_letter_review_status(
+                    parse_ids(reject, pending_ids), REVIEW_REJECTED, from_statuses=(REVIEW_PENDING,))
+            return pending, approved, rejected
+        finally:
+            await db.engine.dispose()
+
+    pending, approved, rejected = asyncio.run(run())
+    if approve is not None or reject is not None:
+        typer.echo(f"Одобрено: {approved}, отклонено: {rejected}")
+        return
+
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
+    table = Table(title=f"Письма на проверке: {len(pending)}")
+    table.add_column("hh_id", style="cyan")
+    table.add_column("Компания")
+    table.add_column("Вакансия")
+    table.add_column("Релевантность", style="green")
+    for letter in pending:
+        relevance = f"{letter.relevance:.2f}" if letter.relevance is not None else "-"
+        table.add_row(letter.vacancy_id, letter.company or "", letter.vacancy_name or "", relevance)
+    console.print(table)
+
+    if show_letters:
+        for letter in pending:
+            console.rule(f"{letter.vacancy_id} {letter.company or ''} - {letter.url or ''}")
+            console.print(letter.cover_letter or "", markup=False)
+
+
+@app.command()
+def plan(
+    hours: float = typer.Option(settings.PLAN_HORIZON_HOURS, "--hours", help="Горизонт плана в часах"),
+    limit: int = typer.Option(50, "--limit", help="Строк плана в таблице"),
+):
+    """План отправки: какие письма и когда уйдут в пределах лимитов и рабочих часов"""
+    from src.core.database import db
+    from src.services.rate_limiter import create_rate_limiter
+    from src.services.send_planner import send_planner
+
+    async def run():
+        await db.create_tables()
+        try:
+            rate_limiter = create_rate_limiter()
+            await rate_limiter.load()
+            await send_planner.load_employers()
+            candidates = await send_planner.candidates()
+            return candidates, send_planner.plan(candidates, rate_limiter, horizon_hours=hours)
+        finally:
+            await db.engine.dispose()
+
+    candidates, planned = asyncio.run(run())
+
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
+    table = Table(title=f"План отправки на {hours:g} ч ({settings.PLAN_TIMEZONE})")
+    table.add_column("Время", style="cyan")
+    table.add_column("hh_id")
+    table.add_column("Компания")
+    table.add_column("Вакансия")
+    table.add_column("Оценка", style="green")
+    table.add_column("match / salary / fresh / employer")
+    for send in planned[:limit]:
+        parts = send.components
+        table.add_row(send_planner.working_hours.format(send.at), send.candidate.vacancy_id,
+                      send.candidate.company, send.candidate.vacancy_name, f"{send.score:.3f}",
+                      f"{parts['match']:.2f} / {parts['salary']:.2f} / {parts['freshness']:.2f} / {parts['employer']:.2f}")
+    console.print(table)
+    typer.echo(f"В плане: {len(planned)} из {len(candidates)} писем, вне горизонта: {len(candidates) - len(planned)}")
+    if settings.SENDER_STRATEGY != "plan":
+        typer.echo("Отправитель исполняет план при SENDER_STRATEGY=plan")
+
+
+@app.command("dedup-backfill")
+def dedup_backfill(
+    batch_size: int = typer.Option(500, "--batch-size", help="Вакансий за один запрос к БД")
+):
+    """Посчитать MinHash-сигнатуры для старых вакансий и пометить перепубликации"""
+    from src.core.database import db
+    from src.services.near_duplicates import near_duplicate_index
+
+    async def run():
+        await db.create_tables()
+        try:
+            return await near_duplicate_index.backfill(batch_size)
+        finally:
+            await db.engine.dispose()
+
+    processed, duplicates = asyncio.run(run())
+    typer.echo(f"Обработано вакансий: {processed}, найдено перепубликаций: {duplicates}")
+
+
+@app.command()
+def reprocess(
+    filters: list[str] = typer.Option([], "--filter", "-f",
+                                      help="ключ=значение: applied, processed, letter, duplicate, source, "
+                                           "min_relevance, max_relevance, since, until, keyword"),
+    letters: bool = typer.Option(True, "--letters/--no-letters", help="Генерировать письма заново"),
+    llm: bool = typer.Option(settings.DEEPSEEK_USE_LLM, "--llm/--no-llm", help="Письма через DeepSeek или по шаблону"),
+    enqueue: bool = typer.Option(False, "--enqueue", help="Отправить новые письма в очередь откликов"),
+    concurrency: int = typer.Option(0, "--concurrency", help="Параллельных генераций (0 - как у воркера)"),
+    batch_size: int = typer.Option(500, "--batch-size", help="Вакансий за один запрос к БД"),
+    checkpoint: Optional[str] = typer.Option(None, "--checkpoint", help="Имя чекпоинта (по умолчанию - по фильтру)"),
+    restart: bool = typer.Option(False, "--restart", help="Начать заново, не продолжая с чекпоинта"),
+):
+    """Переобработать сохраненные вакансии: релевантность и письма без запросов к HH"""
+    from src.core.database import db
+    from src.services.amqp_pool import amqp_pool
+    from src.services.cpu_pool import cpu_pool
+    from src.services.reprocessor import Reprocessor, ReprocessFilter
+    from rich.progress import Progress, BarColumn, MofNCompleteColumn, TimeRemainingColumn
+
+    try:
+        vacancy_filter = ReprocessFilter.parse(filters)
+    except ValueError as e:
+        typer.echo(f"Ошибка: {e}")
+        raise typer.Exit(1)
+
+    if enqueue and settings.QUEUE_BACKEND == "memory":
+        typer.echo("Ошибка: --enqueue требует QUEUE_BACKEND=rabbitmq (очередь в памяти живет только в run-all)")
+        raise typer.Exit(1)
+
+    async def run():
+        await db.create_tables()
+        reprocessor = Reprocessor(batch_size=batch_size, concurrency=concurrency or None,
+                                  letters=letters, enqueue=enqueue)
+        settings.DEEPSEEK_USE_LLM = llm
+        if reprocessor.processor is not None:
+            if enqueue and not await reprocessor.processor.queue_manager.connect():
+                raise RuntimeError("Не удалось подключиться к брокеру очередей")
+
+        try:
+            with Progress("[progress.description]{task.description}", BarColumn(), MofNCompleteColumn(),
+                          "{task.fields[rate]:.0f} вак/с", TimeRemainingColumn()) as progress:
+                task = progress.add_task("Переобработка", total=None, rate=0.0)
+
+                def on_progress(stats):
+                    progress.update(task, total=stats.total, completed=stats.scanned, rate=stats.rate)
+
+                return await reprocessor.run(vacancy_filter, checkpoint=checkpoint, restart=restart,
+                                             on_progress=on_progress)
+        finally:
+            if reprocessor.processor is not None:
+                await reprocessor.processor.deepseek.close()
+                await reprocessor.processor.queue_manager.close()
+            await amqp_pool.close()
+            cpu_pool.shutdown()
+            await db.engine.dispose()
+
+    stats = asyncio.run(run())
+    typer.echo(f"Обработано: {stats.scanned} за {stats.elapsed:.1f} с ({stats.rate:.0f} вак/с)")
+    typer.echo(f"Писем: {stats.letters}, не Python: {stats.not_python}, "
+               f"низкая релевантность: {stats.low_relevance}, в очередь: {stats.enqueued}, ошибок: {stats.errors}")
+
+
 @app.command()
 def auth():
     """Настройка авторизации HH.ru"""
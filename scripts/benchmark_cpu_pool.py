@@ -0,0 +1,69 @@
+"""
+Бенчмарк CPU-обработки текста: на месте против пула процессов
+
+Корпус - описания вакансий из БД (если она доступна и не пуста),
+иначе синтетические описания. Считаются признаки compute_vacancy_features:
+хешированные термы для релевантности и MinHash-сигнатуры.
+"""
+
+import asyncio
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.services.cpu_pool import CpuPool, default_workers
+from src.services.text_features import compute_vacancy_features
+
+SYNTHETIC_SIZE = 2000
+
+
+def synthetic_corpus():
+    words = ("python fastapi django postgresql rabbitmq docker kubernetes asyncio redis celery "
+             "микросервисы разработка команда задачи требования опыт тестирование код ревью").split()
+    return [
+        {'name': f'Python разработчик {i}', 'skills': 'Python, SQL',
+         'description': '<p>' + ' '.join(words[(i * 7 + j) % len(words)] for j in range(400)) + '</p>'}
+        for i in range(SYNTHETIC_SIZE)
+    ]
+
+
+async def load_corpus():
+    from src.core.database import db
+    try:
+        vacancies = await db.get_all_vacancies()
+    except Exception as e:
+        print(f"БД недоступна ({e}), синтетический корпус")
+        return synthetic_corpus()
+    finally:
+        await db.engine.dispose()
+    if not vacancies:
+        print("В БД нет вакансий, синтетический корпус")
+        return synthetic_corpus()
+    return [{'name': v.name, 'skills': v.skills, 'description': v.description} for v in vacancies]
+
+
+async def main():
+    corpus = await load_corpus()
+    print(f"Вакансий: {len(corpus)}, процессов: {default_workers()}, пачка: {settings.CPU_POOL_BATCH_SIZE}")
+
+    start = time.perf_counter()
+    compute_vacancy_features(corpus)
+    inline_time = time.perf_counter() - start
+    print(f"{'На месте':<14} {inline_time:>8.2f} с {len(corpus) / inline_time:>10.0f} вак/с")
+
+    pool = CpuPool()
+    try:
+        await pool.map(compute_vacancy_features, corpus[:settings.CPU_POOL_MIN_ITEMS * pool.workers])  # прогрев
+        start = time.perf_counter()
+        await pool.map(compute_vacancy_features, corpus)
+        pool_time = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+    print(f"{'Пул процессов':<14} {pool_time:>8.2f} с {len(corpus) / pool_time:>10.0f} вак/с "
+          f"(x{inline_time / pool_time:.1f})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
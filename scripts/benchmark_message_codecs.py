@@ -0,0 +1,72 @@
+"""
+Бенчмарк кодеков сообщений: размер и скорость кодирования/декодирования
+
+Сравнивает прежний формат (json.dumps + utf-8) с вариантами encode_payload:
+JSON (orjson, если установлен), msgpack и сжатие zstd.
+"""
+
+import json
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.services import messages
+from src.services.messages import VacancyMessage, decode_payload, encode_payload, from_payload, to_payload
+
+ITERATIONS = 5000
+
+SAMPLE = {
+    'hh_id': '98765432', 'name': 'Senior Python Developer', 'company': 'ООО Ромашка',
+    'salary_from': 250000.0, 'salary_to': 350000.0, 'salary_currency': 'RUR',
+    'experience': 'От 3 до 6 лет', 'employment': 'Полная занятость',
+    'description': ('Мы ищем опытного Python-разработчика для развития высоконагруженных '
+                    'сервисов на FastAPI, PostgreSQL и RabbitMQ. ') * 40,
+    'skills': 'Python, FastAPI, PostgreSQL, RabbitMQ, Docker, Kubernetes',
+    'url': 'https://hh.ru/vacancy/98765432',
+}
+
+
+def measure(name, encode, decode):
+    body = encode()
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        encode()
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        decode(body)
+    decode_time = time.perf_counter() - start
+
+    print(f"{name:<22} {len(body):>8} байт {ITERATIONS / encode_time:>12.0f} enc/с {ITERATIONS / decode_time:>12.0f} dec/с")
+
+
+def main():
+    payload = to_payload(from_payload(VacancyMessage, SAMPLE))
+    print(f"orjson: {messages.orjson is not None}, msgpack: {messages.msgpack is not None}, "
+          f"zstandard: {messages.zstandard is not None}")
+    print(f"{'Формат':<22} {'Размер':>13} {'Кодирование':>16} {'Декодирование':>16}")
+
+    measure("json (прежний)",
+            lambda: json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+            lambda body: json.loads(body.decode('utf-8')))
+
+    variants = [("json", 0), ("json+zstd", 1), ("msgpack", 0), ("msgpack+zstd", 1)]
+    for name, threshold in variants:
+        codec = name.split('+')[0]
+        if codec == "msgpack" and messages.msgpack is None:
+            continue
+        if threshold and messages.zstandard is None:
+            continue
+        settings.MESSAGE_CODEC = codec
+        settings.MESSAGE_COMPRESSION_THRESHOLD = threshold
+        _, content_type, content_encoding = encode_payload(payload)
+        measure(name,
+                lambda: encode_payload(payload)[0],
+                lambda body: decode_payload(body, content_type, content_encoding))
+
+
+if __name__ == "__main__":
+    main()
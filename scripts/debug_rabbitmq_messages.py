@@ -9,6 +9,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from src.core.logger import get_logger
 from src.services.queue_manager import RabbitMQManager
+from src.services.messages import decode_payload, MessageSchemaError
 from src.core.config import settings
 
 logger = get_logger(__name__)
@@ -34,20 +35,13 @@ async def inspect_messages():
                 logger.info("Диагностика сообщения:")
                 logger.info(f"📦 Размер: {len(message.body)} байт")
 
-                # Пробуем разные кодировки
-                encodings = ['utf-8', 'latin-1', 'cp1251', 'ascii']
-                for encoding in encodings:
-                    try:
-                        decoded = message.body.decode(encoding)
-                        logger.info(f"Успешно декодировано как {encoding}: {decoded[:100]}...")
-
-                        # Пробуем распарсить как JSON
-                        import json
-                        data = json.loads(decoded)
-                        logger.info(f"JSON данные: {list(data.keys())}")
-                        break
-                    except (UnicodeDecodeError, json.JSONDecodeError) as e:
-                        logger.info(f"Не удалось декодировать как {encoding}: {e}")
+                logger.info(f"content_type: {message.content_type}, content_encoding: {message.content_encoding}")
+
+                try:
+                    data = decode_payload(message.body, message.content_type, message.content_encoding)
+                    logger.info(f"Версия схемы: {data.get('v', 0)}, поля: {list(data.keys())}")
+                except MessageSchemaError as e:
+                    logger.info(f"Не удалось декодировать: {e}")
 
                 # Подтверждаем сообщение чтобы оно осталось в очереди
                 await message.ack()
@@ -1,109 +1,355 @@
 # src/api/deepseek_client.py
 import aiohttp
+import asyncio
 import json
-import random
-from typing import Optional
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 from src.core.config import settings
 from src.core.logger import get_logger
+from src.core.text import search_text_of
+from src.core.letter_templates import LetterChoice, encode_choice, letter_templates
 
 logger = get_logger(__name__)
 
+SOURCE_LLM = "llm"
+SOURCE_TEMPLATE = "template"
+
+# Общая часть промпта: в пакетном режиме оплачивается один раз на пакет
+SYSTEM_PROMPT = (
+    "Ты пишешь сопроводительные письма на русском языке от имени Python backend-разработчика. "
+    "Кандидат разработал HH Job Bot - микросервисную платформу на Python (HH.ru API, RabbitMQ, "
+    "SQLAlchemy, PostgreSQL, Docker, DeepSeek API) для автоматизации поиска работы. "
+    "Пиши 120-180 слов, по делу, без выдуманных фактов, без подписи и контактов."
+)
+
+
+@dataclass
+class LetterGeneration:
+    """Результат генерации письма с учетом токенов и стоимости"""
+    text: str
+    source: str  # llm, template (запасной вариант) или cache (см. letter_cache)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0  # USD
+    duration: float = 0.0  # секунд
+    variant: str = ''  # Вариант шаблона (для писем по шаблону, см. letter_templates)
+    choice: Optional[LetterChoice] = None  # Ссылка на шаблон: в БД и очередь идет она, а не текст
+
+    @property
+    def letter_template(self) -> Optional[str]:
+        """Компактная ссылка на шаблон для БД и очереди; None - письмо хранится текстом"""
+        return encode_choice(self.choice) if self.choice is not None else None
+
+
+def letter_signature(contacts: Optional[Dict[str, str]] = None) -> str:
+    """Подпись письма LLM: контакты из настроек или contacts (аккаунт)"""
+    contacts = contacts or {}
+    return (
+        f"С уважением,\n{contacts.get('contact_name', settings.CONTACT_NAME)}\n"
+        f"Телефон: {contacts.get('contact_phone', settings.CONTACT_PHONE)}\n"
+        f"Telegram: {contacts.get('contact_telegram', settings.CONTACT_TELEGRAM)}\n"
+        f"GitHub: {contacts.get('contact_github', settings.CONTACT_GITHUB)}"
+    )
+
+
+def resign_letter(text: str, contacts: Dict[str, str]) -> str:
+    """Письмо LLM с подписью другого аккаунта (текст письма общий на все аккаунты)"""
+    default = letter_signature()
+    if not text.endswith(default):
+        return text
+    return text[:len(text) - len(default)] + letter_signature(contacts)
+
+
+class DeepSeekError(Exception):
+    """Ошибка запроса генерации к DeepSeek API"""
+
 
 class DeepSeekClient:
-    """Клиент для генерации сопроводительных писем через DeepSeek API"""
+    """Клиент для генерации сопроводительных писем через DeepSeek API
+
+    Одна aiohttp-сессия на процесс (пул соединений) и семафор на
+    DEEPSEEK_MAX_CONCURRENCY запросов: параллельные сообщения воркера
+    не превышают квоту провайдера. Ответ читается потоком (SSE), при любой
+    ошибке или таймауте письмо собирается по шаблону.
+    """
 
-    def __init__(self):
-        self.api_key = settings.DEEPSEEK_API_KEY
-        self.api_url = settings.DEEPSEEK_API_URL
+    def __init__(self, api_url: Optional[str] = None, api_key: Optional[str] = None,
+                 max_concurrency: Optional[int] = None):
+        self.api_key = settings.DEEPSEEK_API_KEY if api_key is None else api_key
+        self.api_url = api_url or settings.DEEPSEEK_API_URL
+        self.max_concurrency = max_concurrency or settings.DEEPSEEK_MAX_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Накопительная статистика процесса
+        self.llm_letters = 0
+        self.fallback_letters = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_cost = 0.0
+        self.batch_requests = 0
+
+    @property
+    def llm_enabled(self) -> bool:
+        return settings.DEEPSEEK_USE_LLM and bool(self.api_key)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия: соединения к API переиспользуются между письмами"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(
+                    total=settings.DEEPSEEK_TOTAL_TIMEOUT,
+                    connect=settings.DEEPSEEK_CONNECT_TIMEOUT,
+                    sock_read=settings.DEEPSEEK_READ_TIMEOUT,
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Закрывает сессию (при остановке воркера)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def generate_cover_letter(self, vacancy_data: dict) -> Optional[str]:
         """Генерирует сопроводительное письмо только для Python-вакансий"""
+        generation = await self.generate(vacancy_data)
+        return generation.text if generation else None
+
+    async def generate(self, vacancy_data: dict) -> Optional[LetterGeneration]:
+        """Генерирует письмо через LLM, при ошибке - по шаблону. None - вакансия не подходит"""
         # Проверяем, подходит ли вакансия (только Python-разработка)
         if not self._is_python_vacancy(vacancy_data):
             logger.info(f"Пропуск не-Python вакансии: {vacancy_data['name']}")
             return None
 
         logger.info(f"Генерация письма для Python-вакансии: {vacancy_data['name']}")
-        return self._generate_python_letter(vacancy_data)
 
-    def _is_python_vacancy(self, vacancy_data: dict) -> bool:
-        """Проверяет, является ли вакансия Python-разработкой"""
-        name = vacancy_data['name'].lower()
-        description = vacancy_data.get('description', '').lower()
-        skills = vacancy_data.get('skills', '').lower()
+        if self.llm_enabled:
+            try:
+                generation = await self._generate_llm_letter(vacancy_data)
+                logger.info(
+                    f"Письмо от LLM за {generation.duration:.1f} с: "
+                    f"{generation.prompt_tokens}+{generation.completion_tokens} токенов, ${generation.cost:.5f}"
+                )
+                return generation
+            except (DeepSeekError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Генерация через DeepSeek не удалась ({e!r}), используется шаблон")
 
-        # Проверяем наличие ключевых слов в названии, описании или навыках
-        text_to_check = f"{name} {description} {skills}"
+        return self._template_letter(*letter_templates.render(vacancy_data))
 
-        return any(keyword in text_to_check for keyword in settings.PYTHON_KEYWORDS)
+    async def generate_batch(self, vacancies: List[dict]) -> List[Optional[LetterGeneration]]:
+        """Письма для нескольких вакансий одним запросом к LLM (порядок результатов = порядок вакансий)
 
-    def _generate_python_letter(self, vacancy_data: dict) -> str:
-        """Генерирует письмо для Python-вакансий по шаблону"""
-        company = vacancy_data['company']
-        vacancy_name = vacancy_data['name']
+        Общая часть промпта (system, о кандидате) оплачивается один раз на пакет.
+        Вакансии, для которых модель не вернула письмо, генерируются по одной.
+        """
+        results: List[Optional[LetterGeneration]] = [None] * len(vacancies)
+        suitable = []
+        for index, vacancy_data in enumerate(vacancies):
+            if self._is_python_vacancy(vacancy_data):
+                suitable.append(index)
+            else:
+                logger.info(f"Пропуск не-Python вакансии: {vacancy_data['name']}")
 
-        # Создаем персонализированную часть о привлекательности вакансии
-        attraction_part = self._get_attraction_part(vacancy_data)
+        if len(suitable) < 2 or not self.llm_enabled:
+            for index in suitable:
+                results[index] = await self.generate(vacancies[index])
+            return results
 
-        letter = f"""
-        Уважаемые команда {company}!
+        logger.info(f"Пакетная генерация писем: {len(suitable)} вакансий одним запросом")
+        letters = {}
+        try:
+            text, usage, duration = await self._complete(
+                self._build_batch_messages([vacancies[index] for index in suitable]),
+                max_tokens=min(settings.DEEPSEEK_MAX_TOKENS * len(suitable), settings.DEEPSEEK_BATCH_MAX_TOKENS),
+                json_mode=True,
+            )
+            letters = self._parse_batch_letters(text, len(suitable))
+        except (DeepSeekError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Пакетная генерация не удалась ({e!r}), письма генерируются по одной")
 
-        С большим интересом изучил вакансию «{vacancy_name}». Меня особенно привлекло {attraction_part}.
+        if letters:
+            # Токены делим между письмами: вход поровну, выход пропорционально длине
+            positions = list(letters)
+            prompt_shares = self._split_tokens(int(usage.get('prompt_tokens', 0)), [1] * len(positions))
+            completion_shares = self._split_tokens(int(usage.get('completion_tokens', 0)),
+                                                   [len(letters[position]) for position in positions])
+            self.batch_requests += 1
+            for position, prompt_share, completion_share in zip(positions, prompt_shares, completion_shares):
+                results[suitable[position]] = self._record_llm_letter(
+                    letters[position], prompt_share, completion_share, duration
+                )
 
-        В рамках поиска новых карьерных возможностей я разработал автономную систему для анализа рынка труда — HH Job Bot.
+        missing = [index for index in suitable if results[index] is None]
+        fallbacks = await asyncio.gather(*(self.generate(vacancies[index]) for index in missing))
+        for index, generation in zip(missing, fallbacks):
+            results[index] = generation
+        return results
 
-        Проект представляет собой микросервисную платформу на Python, которая:
-        • Интегрируется с HH.ru API для интеллектуального поиска вакансий
-        • Управляет очередями задач через RabbitMQ  
-        • Автоматизирует взаимодействие с работодателями с соблюдением лимитов платформы
-        • Использует LLM (DeepSeek) для адаптации сопроводительных писем
+    def _vacancy_brief(self, vacancy_data: dict) -> dict:
+        return {
+            'company': vacancy_data.get('company', ''),
+            'name': vacancy_data['name'],
+            'experience': vacancy_data.get('experience', ''),
+            'skills': vacancy_data.get('skills', ''),
+            'description': (vacancy_data.get('description') or '')[:settings.DEEPSEEK_MAX_DESCRIPTION_CHARS],
+        }
 
-        Технологический стек: Python, FastAPI, SQLAlchemy, PostgreSQL, RabbitMQ, Docker, DeepSeek API.
+    def _build_messages(self, vacancy_data: dict) -> list:
+        """Промпт: кандидат и проект в system, вакансия в user"""
+        brief = self._vacancy_brief(vacancy_data)
+        user = (
+            f"Компания: {brief['company']}\n"
+            f"Вакансия: {brief['name']}\n"
+            f"Опыт: {brief['experience']}\n"
+            f"Навыки: {brief['skills']}\n"
+            f"Описание: {brief['description']}"
+        )
+        return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user}]
 
-        Для меня этот проект — демонстрация подхода к решению сложных задач через автоматизацию и системное мышление. Именно такой вклад я хотел бы вносить в вашу команду.
+    def _build_batch_messages(self, vacancies: List[dict]) -> list:
+        """Промпт пакета: вакансии JSON-массивом с id, ответ - JSON {"letters": [{"id", "text"}]}"""
+        system = (
+            f"{SYSTEM_PROMPT} Тебе дан JSON-массив вакансий с полем id. Напиши отдельное письмо "
+            'для каждой и ответь только JSON-объектом {"letters": [{"id": <id>, "text": "<письмо>"}]}.'
+        )
+        briefs = [{'id': index, **self._vacancy_brief(vacancy_data)} for index, vacancy_data in enumerate(vacancies)]
+        user = "Вакансии:\n" + json.dumps(briefs, ensure_ascii=False)
+        return [{"role": "system", "content": system}, {"role": "user", "content": user}]
 
-        Буду рад обсудить, как мои навыки могут быть полезны вашей компании.
+    @staticmethod
+    def _split_tokens(total: int, weights: List[int]) -> List[int]:
+        """Делит токены пакета по весам так, чтобы сумма долей совпала с total"""
+        weight_sum = sum(weights) or 1
+        shares = [total * weight // weight_sum for weight in weights]
+        shares[-1] += total - sum(shares)
+        return shares
 
-        С уважением,
-        {settings.CONTACT_NAME}
-        Телефон: {settings.CONTACT_PHONE}
-        Telegram: {settings.CONTACT_TELEGRAM}
-        GitHub: {settings.CONTACT_GITHUB}
+    @staticmethod
+    def _parse_batch_letters(text: str, count: int) -> Dict[int, str]:
+        """Письма из JSON-ответа пакета: {позиция: текст}; неизвестные id и пустые письма пропускаются"""
+        try:
+            letters = json.loads(text).get('letters') or []
+        except (json.JSONDecodeError, AttributeError) as e:
+            raise DeepSeekError(f"Некорректный JSON пакетного ответа: {e}") from e
 
-        P.S. Этот отклик был отправлен с помощью моего бота — готов рассказать о технической реализации и показать код!
-        """
+        parsed = {}
+        for item in letters:
+            if not isinstance(item, dict):
+                continue
+            position, letter = item.get('id'), str(item.get('text') or '').strip()
+            if isinstance(position, int) and 0 <= position < count and letter:
+                parsed[position] = letter
+        return parsed
+
+    def _signature(self) -> str:
+        return letter_signature()
+
+    def _record_llm_letter(self, body: str, prompt_tokens: int, completion_tokens: int,
+                           duration: float) -> LetterGeneration:
+        """Письмо LLM с подписью, стоимостью и учетом в статистике процесса"""
+        cost = (prompt_tokens * settings.DEEPSEEK_PRICE_INPUT_PER_1M
+                + completion_tokens * settings.DEEPSEEK_PRICE_OUTPUT_PER_1M) / 1_000_000
+
+        self.llm_letters += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.total_cost += cost
+
+        return LetterGeneration(
+            text=f"{body}\n\n{self._signature()}",
+            source=SOURCE_LLM,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=cost,
+            duration=duration,
+        )
+
+    async def _generate_llm_letter(self, vacancy_data: dict) -> LetterGeneration:
+        """Письмо для одной вакансии, токены - из финального чанка usage"""
+        body, usage, duration = await self._complete(
+            self._build_messages(vacancy_data), max_tokens=settings.DEEPSEEK_MAX_TOKENS
+        )
+        return self._record_llm_letter(
+            body, int(usage.get('prompt_tokens', 0)), int(usage.get('completion_tokens', 0)), duration
+        )
+
+    async def _complete(self, messages: list, max_tokens: int,
+                        json_mode: bool = False) -> Tuple[str, dict, float]:
+        """Потоковый запрос к chat/completions: (текст, usage, длительность)"""
+        data = {
+            "model": settings.DEEPSEEK_MODEL,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": settings.DEEPSEEK_TEMPERATURE,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if json_mode:
+            data["response_format"] = {"type": "json_object"}
+
+        async with self._semaphore:
+            started = time.monotonic()
+            parts = []
+            usage = {}
+
+            async with self._get_session().post(self.api_url, json=data) as response:
+                if response.status != 200:
+                    raise DeepSeekError(f"HTTP {response.status}: {(await response.text())[:200]}")
+
+                # SSE: строки вида "data: {...}", поток завершается "data: [DONE]"
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = line[len("data:"):].strip()
+                    if chunk == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(chunk)
+                    except json.JSONDecodeError as e:
+                        raise DeepSeekError(f"Некорректный чанк потока: {e}") from e
 
-        return letter.strip()
-
-    def _get_attraction_part(self, vacancy_data: dict) -> str:
-        """Создает персонализированную часть о том, что привлекло в вакансии"""
-        name = vacancy_data['name'].lower()
-        description = vacancy_data.get('description', '').lower()
-        company = vacancy_data['company']
-
-        attraction_options = [
-            "возможность работать с современным стеком Python",
-            "шанс присоединиться к сильной команде для решения интересных задач",
-            "перспектива участия в разработке масштабных проектов",
-            "возможность углубленного изучения backend-разработки",
-            "перспектива работы над высоконагруженными системами",
-            f"ваш продукт и возможность внести вклад в его развитие",
-            "современный технологический стек и подходы к разработке"
-        ]
-
-        # Пробуем найти более релевантный вариант на основе описания
-        if 'fastapi' in description:
-            return "работа с FastAPI и современными асинхронными фреймворками"
-        elif 'django' in description:
-            return "использование Django для создания надежных веб-приложений"
-        elif 'postgresql' in description or 'баз' in description:
-            return "работа с базами данных и оптимизация запросов"
-        elif 'микросервис' in description:
-            return "архитектура микросервисов и распределенных систем"
-        elif 'api' in description:
-            return "разработка и проектирование API"
-        else:
-            return random.choice(attraction_options)
+                    for choice in event.get('choices') or []:
+                        content = (choice.get('delta') or {}).get('content')
+                        if content:
+                            parts.append(content)
+                    if event.get('usage'):
+                        usage = event['usage']
+
+            duration = time.monotonic() - started
+
+        text = "".join(parts).strip()
+        if not text:
+            raise DeepSeekError("Пустой ответ модели")
+        return text, usage, duration
+
+    def _is_python_vacancy(self, vacancy_data: dict) -> bool:
+        """Проверяет, является ли вакансия Python-разработкой"""
+        # Токены названия, навыков и описания посчитаны при приеме вакансии
+        text_to_check = search_text_of(vacancy_data)
+
+        return any(keyword in text_to_check for keyword in settings.PYTHON_KEYWORDS)
+
+    def _template_letter(self, choice: LetterChoice, text: str) -> LetterGeneration:
+        self.fallback_letters += 1
+        return LetterGeneration(text=text, source=SOURCE_TEMPLATE, variant=choice.variant, choice=choice)
+
+    def generate_templates(self, vacancies: List[dict]) -> List[Optional[LetterGeneration]]:
+        """Шаблонные письма пакетом, без LLM (порядок результатов = порядок вакансий)"""
+        suitable = [index for index, vacancy_data in enumerate(vacancies) if self._is_python_vacancy(vacancy_data)]
+        results: List[Optional[LetterGeneration]] = [None] * len(vacancies)
+        rendered = letter_templates.render_batch([vacancies[index] for index in suitable])
+        for index, (choice, text) in zip(suitable, rendered):
+            results[index] = self._template_letter(choice, text)
+        return results
 
     async def test_connection(self) -> bool:
         """Тестирует подключение к DeepSeek API"""
@@ -111,26 +357,21 @@ class DeepSeekClient:
             logger.error("DEEPSEEK_API_KEY не установлен")
             return False
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
         data = {
-            "model": "deepseek-chat",
+            "model": settings.DEEPSEEK_MODEL,
             "messages": [{"role": "user", "content": "Тестовое сообщение"}],
             "max_tokens": 10
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status in [200, 401]:  # 401 тоже ок - значит ключ работает
-                        logger.info("Подключение к DeepSeek API успешно")
-                        return True
-                    else:
-                        logger.error(f"Ошибка подключения: {response.status}")
-                        return False
+            # Та же сессия и модель, что и для писем: проверяются реальные настройки
+            async with self._get_session().post(self.api_url, json=data) as response:
+                if response.status in [200, 401]:  # 401 тоже ок - значит ключ работает
+                    logger.info("Подключение к DeepSeek API успешно")
+                    return True
+                else:
+                    logger.error(f"Ошибка подключения: {response.status}")
+                    return False
         except Exception as e:
             logger.error(f"Ошибка тестирования подключения: {e}")
             return False
\ No newline at end of file
@@ -1,14 +1,26 @@
 # src/api/hh_client.py
 import aiohttp
 import asyncio
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any, Tuple
 from src.core.config import settings
+from src.core.circuit_breaker import hh_breaker
 from src.core.logger import get_logger
 
 logger = get_logger(__name__)
 
 
+def parse_hh_time(value: Optional[str]) -> Optional[datetime]:
+    """Время HH ('2024-05-01T12:00:00+0300') -> naive UTC, как остальные колонки DateTime"""
+    if not value:
+        return None
+    try:
+        moment = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        return None
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 class HHClient:
     """Клиент для работы с API HH.ru"""
 
@@ -19,7 +31,17 @@ class HHClient:
 
     async def _make_request(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
         """Асинхронный метод для выполнения запросов с обработкой ошибок"""
+        status, data = await self._fetch(url, params)
+        if status is not None and status != 200:
+            logger.error(f"HTTP {status} для {url}")
+        return data
+
+    async def _fetch(self, url: str, params: Optional[Dict] = None) -> Tuple[Optional[int], Optional[Dict]]:
+        """GET с ограничением параллельности: (HTTP статус или None при сетевой ошибке, JSON при 200)"""
         async with self.semaphore:
+            if not hh_breaker.allow_request():
+                logger.warning(f"Предохранитель HH разомкнут, запрос к {url} пропущен")
+                return None, None
             await asyncio.sleep(self.request_delay)
 
             try:
@@ -29,17 +51,17 @@ class HHClient:
                         logger.info("=" * 50)
                         logger.info(f"Параметры поиска: {params}")
                         logger.info("=" * 50)
+                        body = await response.text() if response.status == 403 else ''
+                        hh_breaker.record_response(response.status, body, response.headers.get('Retry-After'))
                         if response.status == 200:
-                            return await response.json()
-                        else:
-                            logger.error(f"HTTP {response.status} для {url}")
-                            return None
+                            return response.status, await response.json()
+                        return response.status, None
             except aiohttp.ClientError as e:
                 logger.error(f"Ошибка при запросе к {url}: {e}")
-                return None
+                return None, None
             except asyncio.TimeoutError:
                 logger.error(f"Таймаут при запросе к {url}")
-                return None
+                return None, None
 
     async def search_vacancies(self, custom_params: Optional[Dict] = None) -> Optional[Dict]:
         """Поиск вакансий по заданным параметрам"""
@@ -76,6 +98,15 @@ class HHClient:
         url = f"{self.base_url}/{vacancy_id}"
         return await self._make_request(url)
 
+    async def get_vacancy_state(self, vacancy_id: str) -> Optional[bool]:
+        """Открыта ли вакансия: True/False (в архиве или удалена), None - не удалось узнать"""
+        status, details = await self._fetch(f"{self.base_url}/{vacancy_id}")
+        if status in (404, 410):
+            return False
+        if details is None:
+            return None
+        return not details.get('archived', False)
+
     async def get_complete_vacancy_data(self, vacancy_list_item: Dict) -> Optional[Dict]:
         """Получает полные данные вакансии по ID из списка"""
         vacancy_id = vacancy_list_item['id']
@@ -145,7 +176,8 @@ class HHClient:
             'employment': raw_vacancy.get('employment', {}).get('name', ''),
             'description': description,
             'skills': skills,
-            'url': f"https://hh.ru/vacancy/{raw_vacancy['id']}"
+            'url': f"https://hh.ru/vacancy/{raw_vacancy['id']}",
+            'published_at': parse_hh_time(raw_vacancy.get('published_at'))
         }
 
     async def test_connection(self) -> bool:
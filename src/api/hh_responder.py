@@ -1,28 +1,40 @@
 import aiohttp
-from typing import Optional
+from typing import Dict, Optional
 from src.core.config import settings
+from src.core.circuit_breaker import hh_breaker, is_auth_error, is_captcha
 from src.core.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Итог send_application
+APPLY_SENT = "sent"
+APPLY_FAILED = "failed"
+APPLY_THROTTLED = "throttled"  # HH ограничивает запросы (429, капча, предохранитель) - повторить позже
+
 
 class HHResponder:
     """Клиент для отправки откликов на HH.ru"""
 
-    def __init__(self):
-        self.access_token = settings.HH_ACCESS_TOKEN
-        self.resume_id = settings.HH_RESUME_ID
+    def __init__(self, access_token: Optional[str] = None, resume_id: Optional[str] = None):
+        # По умолчанию - основной аккаунт; дополнительные передают свои (см. src/core/accounts.py)
+        self.access_token = settings.HH_ACCESS_TOKEN if access_token is None else access_token
+        self.resume_id = settings.HH_RESUME_ID if resume_id is None else resume_id
         self.base_url = "https://api.hh.ru"
 
-    async def send_application(self, vacancy_id: str, cover_letter: str) -> bool:
-        """Отправляет отклик на вакансию через официальное API HH.ru"""
+    async def send_application(self, vacancy_id: str, cover_letter: str) -> str:
+        """Отправляет отклик на вакансию через официальное API HH.ru; итог - APPLY_*"""
         if not self.access_token:
             logger.error("HH_ACCESS_TOKEN не установлен в .env")
-            return False
+            return APPLY_FAILED
 
         if not self.resume_id:
             logger.error("HH_RESUME_ID не установлен в .env")
-            return False
+            return APPLY_FAILED
+
+        # В half-open пробный запрос мог уже уйти (например, проверка вакансии)
+        if not hh_breaker.allow_request():
+            logger.warning(f"Предохранитель HH не пропускает запрос, отклик на {vacancy_id} отложен")
+            return APPLY_THROTTLED
 
         url = f"{self.base_url}/negotiations"
 
@@ -48,26 +60,34 @@ class HHResponder:
 
                     response_text = await response.text()
                     logger.debug(f"Статус ответа: {response.status}, Тело: {response_text}")
+                    hh_breaker.record_response(response.status, response_text,
+                                               response.headers.get('Retry-After'))
 
                     if response.status == 201:
                         logger.info(f"Отклик успешно отправлен на вакансию {vacancy_id}")
-                        return True
-                    elif response.status == 403:
-                        logger.error(f"Ошибка доступа (403): {response_text}")
-                        return False
+                        return APPLY_SENT
                     elif response.status == 429:
                         logger.warning("Превышен лимит запросов к API HH.ru")
-                        return False
+                        return APPLY_THROTTLED
+                    elif response.status == 403 and is_captcha(response_text):
+                        logger.warning(f"HH требует капчу, отклик на {vacancy_id} отложен")
+                        return APPLY_THROTTLED
+                    elif response.status == 401 or (response.status == 403 and is_auth_error(response_text)):
+                        logger.error(f"Токен аккаунта (резюме {self.resume_id}) недействителен: {response_text}")
+                        return APPLY_FAILED
+                    elif response.status == 403:
+                        logger.error(f"Ошибка доступа (403): {response_text}")
+                        return APPLY_FAILED
                     else:
                         logger.error(f"Ошибка {response.status}: {response_text}")
-                        return False
+                        return APPLY_FAILED
 
         except aiohttp.ClientError as e:
             logger.error(f"Ошибка сети: {e}")
-            return False
+            return APPLY_FAILED
         except Exception as e:
             logger.error(f"Неожиданная ошибка: {e}")
-            return False
+            return APPLY_FAILED
 
     async def check_application_status(self, vacancy_id: str) -> Optional[str]:
         """Проверяет, был ли уже отправлен отклик на вакансию"""
@@ -98,6 +118,37 @@ class HHResponder:
             logger.error(f"Ошибка проверки статуса: {e}")
             return None
 
+    async def get_negotiations_page(self, page: int = 0, per_page: int = 100) -> Optional[Dict]:
+        """Страница списка откликов соискателя, сначала недавно измененные"""
+        if not self.access_token:
+            logger.error("HH_ACCESS_TOKEN не установлен в .env")
+            return None
+
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "User-Agent": f"{settings.APP_NAME}/{settings.APP_VERSION} ({settings.CONTACT_EMAIL})",
+        }
+        params = {"page": page, "per_page": per_page, "order_by": "updated_at", "order": "desc"}
+        if not hh_breaker.allow_request():
+            logger.warning("Предохранитель HH разомкнут, синхронизация откликов отложена")
+            return None
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{self.base_url}/negotiations", headers=headers,
+                                       params=params) as response:
+                    if response.status == 200:
+                        hh_breaker.record_success()
+                        return await response.json()
+                    response_text = await response.text()
+                    hh_breaker.record_response(response.status, response_text, response.headers.get('Retry-After'))
+                    logger.error(f"Ошибка загрузки откликов {response.status}: {response_text}")
+                    return None
+
+        except Exception as e:
+            logger.error(f"Ошибка загрузки откликов: {e}")
+            return None
+
     async def test_connection(self) -> bool:
         """Тестирует подключение к API HH.ru"""
         if not self.access_token:
@@ -0,0 +1,205 @@
+"""Аккаунты HH: чьи резюме получают отклики
+
+Поиск, загрузка вакансий и генерация писем общие на всех; каждый аккаунт -
+свой токен, резюме, лимиты откликов, фильтры вакансий и своя очередь писем
+на отправку. Основной аккаунт (DEFAULT_ACCOUNT) задается как раньше -
+HH_ACCESS_TOKEN, HH_RESUME_ID и лимиты из настроек, - его состояние хранится
+в таблице vacancies. Дополнительные аккаунты описываются в ACCOUNTS_FILE:
+
+    [{"id": "anna", "hh_access_token_env": "HH_TOKEN_ANNA", "resume_id": "...",
+      "weight": 2, "requests_per_hour": 10, "keywords": ["django"],
+      "exclude_keywords": ["1с"], "min_relevance": 0.1,
+      "contacts": {"contact_name": "Анна", "contact_telegram": "@anna"}}]
+
+Токен лучше задавать через переменную окружения (hh_access_token_env),
+чтобы не хранить его в файле.
+"""
+
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+from src.core.config import settings
+from src.core.letter_templates import CONTACT_FIELDS
+from src.core.logger import get_logger
+from src.core.text import fold_case, search_text_of
+
+logger = get_logger(__name__)
+
+DEFAULT_ACCOUNT = "default"
+ACCOUNT_ID_RE = re.compile(r'^[a-z0-9_-]{1,40}$')  # Входит в имена очередей и ключи идемпотентности
+
+
+class AccountError(ValueError):
+    """Файл аккаунтов некорректен"""
+
+
+def letter_queue(account_id: Optional[str] = None) -> str:
+    """Очередь писем аккаунта на отправку; None - основной (QUEUE_COVER_LETTERS)"""
+    if account_id is None or account_id == DEFAULT_ACCOUNT:
+        return settings.QUEUE_COVER_LETTERS
+    return f"{settings.QUEUE_COVER_LETTERS}.{account_id}"
+
+
+def is_letter_queue(queue_name: str) -> bool:
+    return queue_name == settings.QUEUE_COVER_LETTERS or queue_name.startswith(f"{settings.QUEUE_COVER_LETTERS}.")
+
+
+@dataclass
+class Account:
+    id: str
+    hh_access_token: str = ''
+    resume_id: str = ''
+    weight: float = 1.0  # Доля в общем канале отправки (FairShare)
+    requests_per_hour: Optional[int] = None  # None - REQUESTS_PER_HOUR
+    requests_per_day: Optional[int] = None  # None - REQUESTS_PER_DAY
+    min_interval: Optional[float] = None  # None - APPLY_MIN_INTERVAL
+    keywords: List[str] = field(default_factory=list)  # Хотя бы одно слово в вакансии (пусто - любые)
+    exclude_keywords: List[str] = field(default_factory=list)
+    min_relevance: Optional[float] = None  # Строже общего RELEVANCE_MIN_SCORE
+    contacts: Dict[str, str] = field(default_factory=dict)  # contact_* для подписи и шаблонов
+
+    @property
+    def is_default(self) -> bool:
+        return self.id == DEFAULT_ACCOUNT
+
+    @property
+    def ledger_id(self) -> Optional[str]:
+        """Аккаунт в таблицах откликов: None - основной (таблица vacancies)"""
+        return None if self.is_default else self.id
+
+    @property
+    def letter_queue(self) -> str:
+        return letter_queue(self.id)
+
+    def send_key(self, vacancy_id: str) -> str:
+        """Ключ идемпотентности отправки: отклики разных аккаунтов на одну вакансию независимы"""
+        vacancy_id = str(vacancy_id).strip()
+        return vacancy_id if self.is_default else f"{self.id}:{vacancy_id}"
+
+    def contact_values(self) -> Dict[str, str]:
+        """Контакты для подписи письма: заданные у аккаунта поверх CONTACT_*"""
+        values = {name: getattr(settings, name.upper()) for name in CONTACT_FIELDS}
+        values.update(self.contacts)
+        return values
+
+    def matches(self, vacancy_data: dict) -> bool:
+        """Подходит ли вакансия аккаунту по ключевым словам и релевантности"""
+        relevance = vacancy_data.get('relevance')
+        if self.min_relevance is not None and relevance is not None and relevance < self.min_relevance:
+            return False
+        if not self.keywords and not self.exclude_keywords:
+            return True
+        words = set(search_text_of(vacancy_data).split())
+        if self.exclude_keywords and words & set(self.exclude_keywords):
+            return False
+        return not self.keywords or bool(words & set(self.keywords))
+
+
+def _account(item: dict) -> Account:
+    account_id = str(item['id'])
+    if not ACCOUNT_ID_RE.match(account_id):
+        raise AccountError(f"Некорректный id аккаунта '{account_id}': нужны a-z, 0-9, _ и -, до 40 символов")
+    unknown = set(item) - set(Account.__dataclass_fields__) - {'hh_access_token_env'}
+    if unknown:
+        raise AccountError(f"Аккаунт '{account_id}': неизвестные поля {', '.join(sorted(unknown))}")
+    unknown_contacts = set(item.get('contacts') or {}) - set(CONTACT_FIELDS)
+    if unknown_contacts:
+        raise AccountError(f"Аккаунт '{account_id}': неизвестные контакты {', '.join(sorted(unknown_contacts))}")
+
+    token = item.get('hh_access_token') or os.getenv(item.get('hh_access_token_env') or '', '')
+    account = Account(
+        id=account_id,
+        hh_access_token=token,
+        resume_id=str(item.get('resume_id') or ''),
+        weight=float(item.get('weight', 1.0)),
+        requests_per_hour=item.get('requests_per_hour'),
+        requests_per_day=item.get('requests_per_day'),
+        min_interval=item.get('min_interval'),
+        # Сравнение - по токенам search_text (нижний регистр, ё = е)
+        keywords=[fold_case(word) for word in item.get('keywords') or ()],
+        exclude_keywords=[fold_case(word) for word in item.get('exclude_keywords') or ()],
+        min_relevance=item.get('min_relevance'),
+        contacts=dict(item.get('contacts') or {}),
+    )
+    if account.weight <= 0:
+        raise AccountError(f"Аккаунт '{account_id}': weight должен быть больше 0")
+    return account
+
+
+def default_account() -> Account:
+    """Основной аккаунт из HH_ACCESS_TOKEN / HH_RESUME_ID"""
+    return Account(id=DEFAULT_ACCOUNT, hh_access_token=settings.HH_ACCESS_TOKEN, resume_id=settings.HH_RESUME_ID)
+
+
+def load_accounts(path: Optional[str] = None) -> List[Account]:
+    """Аккаунты из файла; основной - первым, если у него есть токен или других аккаунтов нет
+
+    Запись с id "default" в файле дополняет основной аккаунт (фильтры, вес, контакты).
+    """
+    path = settings.ACCOUNTS_FILE if path is None else path
+    items = []
+    if path:
+        try:
+            items = json.loads(Path(path).read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError) as e:
+            raise AccountError(f"{path}: {e!r}") from e
+        if not isinstance(items, list):
+            raise AccountError(f"{path}: ожидается JSON-массив аккаунтов")
+
+    try:
+        loaded = [_account(item) for item in items]
+    except AccountError:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        raise AccountError(f"{path}: {e!r}") from e
+
+    ids = [account.id for account in loaded]
+    if len(ids) != len(set(ids)):
+        raise AccountError(f"{path}: повторяющиеся id аккаунтов")
+
+    default = default_account()
+    for account in loaded:
+        if account.is_default:
+            account.hh_access_token = account.hh_access_token or default.hh_access_token
+            account.resume_id = account.resume_id or default.resume_id
+            default = account
+    others = [account for account in loaded if not account.is_default]
+    if default.hh_access_token or not others:
+        return [default] + others
+    return others
+
+
+class AccountRegistry:
+    """Аккаунты процесса; файл читается при первом обращении"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._accounts: Optional[Dict[str, Account]] = None
+
+    def all(self) -> List[Account]:
+        if self._accounts is None:
+            self._accounts = {account.id: account for account in load_accounts(self.path)}
+            logger.info(f"Аккаунты HH: {', '.join(self._accounts)}")
+        return list(self._accounts.values())
+
+    def get(self, account_id: Optional[str]) -> Optional[Account]:
+        """Аккаунт по id из сообщения; None - основной"""
+        self.all()
+        return self._accounts.get(account_id or DEFAULT_ACCOUNT)
+
+    def has_default(self) -> bool:
+        return self.get(DEFAULT_ACCOUNT) is not None
+
+    def letter_queues(self) -> List[str]:
+        return [account.letter_queue for account in self.all()]
+
+    def matching(self, vacancy_data: dict) -> List[Account]:
+        """Аккаунты, которым подходит вакансия"""
+        return [account for account in self.all() if account.matches(vacancy_data)]
+
+
+# Глобальный экземпляр
+accounts = AccountRegistry()
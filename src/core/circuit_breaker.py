@@ -0,0 +1,185 @@
+"""Предохранитель запросов к HH.ru
+
+Общий на процесс: его кормят ответы и HHClient (поиск), и HHResponder
+(отклики). 429 и капча размыкают цепь сразу, подряд идущие 403 без ответа API
+(антибот-страница) - после HH_BREAKER_FAILURE_THRESHOLD; 403 с ошибками API
+(already_applied, test_required, архивная вакансия) - отказ по существу, не троттлинг.
+Ошибки авторизации (401, 403 oauth) относятся к токену одного аккаунта и на
+общую цепь не влияют: недействительный токен не останавливает остальные аккаунты. Разомкнутая цепь не пропускает запросы
+HH_BREAKER_OPEN_SECONDS (или сколько просит Retry-After), затем один пробный
+запрос (half-open): успех замыкает цепь, ошибка размыкает ее на вдвое больший
+срок, но не дольше HH_BREAKER_MAX_OPEN_SECONDS.
+"""
+
+import asyncio
+import json
+import time
+from typing import Callable, Dict, List, Optional
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+CAPTCHA_MARKERS = ("captcha",)
+AUTH_ERROR_TYPES = ("oauth", "bad_authorization")
+
+
+class CircuitBreaker:
+    """Состояния closed/open/half-open по ответам HH"""
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None,
+                 open_seconds: Optional[float] = None, max_open_seconds: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.HH_BREAKER_FAILURE_THRESHOLD
+        self.open_seconds = open_seconds or settings.HH_BREAKER_OPEN_SECONDS
+        self.max_open_seconds = max_open_seconds or settings.HH_BREAKER_MAX_OPEN_SECONDS
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._open_for = self.open_seconds
+        self._probe_started: Optional[float] = None
+        self.trips = 0
+        self.last_reason = ''
+        self._listeners: List[Callable[['CircuitBreaker'], None]] = []
+        self._opened = asyncio.Event()
+
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() >= self._open_until:
+            self._transition(STATE_HALF_OPEN)
+        return self._state
+
+    def remaining(self) -> float:
+        """Секунд до пробного запроса (0 - цепь не разомкнута)"""
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def add_listener(self, listener: Callable[['CircuitBreaker'], None]) -> None:
+        """listener(breaker) вызывается при каждой смене состояния"""
+        self._listeners.append(listener)
+
+    def _transition(self, state: str, force: bool = False) -> None:
+        if state == self._state and not force:
+            return
+        self._state = state
+        if state == STATE_OPEN:
+            self._opened.set()
+        else:
+            self._opened.clear()
+        log = logger.warning if state == STATE_OPEN else logger.info
+        log(f"Предохранитель {self.name}: {state}" + (f" ({self.last_reason})" if state == STATE_OPEN else ""))
+        for listener in self._listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика предохранителя {self.name}: {e}")
+
+    def allow_request(self) -> bool:
+        """Можно ли обращаться к HH; в half-open пропускает один пробный запрос"""
+        state = self.state
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_OPEN:
+            return False
+        now = time.monotonic()
+        # Пробный запрос без ответа (ошибка сети, отмена) не должен держать цепь вечно
+        if self._probe_started is None or now - self._probe_started > self.open_seconds:
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probe_started = None
+        if self._state != STATE_CLOSED:
+            self._open_for = self.open_seconds
+            self._transition(STATE_CLOSED)
+
+    def record_failure(self, reason: str, immediate: bool = False, retry_after: Optional[float] = None) -> None:
+        """Ошибка, говорящая о троттлинге; immediate - разомкнуть без накопления"""
+        self._failures += 1
+        self.last_reason = reason
+        if self.state == STATE_HALF_OPEN:
+            # Пробный запрос не прошел - следующая пауза длиннее
+            self._open_for = min(self._open_for * 2, self.max_open_seconds)
+        elif not immediate and self._failures < self.failure_threshold:
+            return
+        self._trip(retry_after)
+
+    def _trip(self, retry_after: Optional[float]) -> None:
+        duration = max(self._open_for, retry_after or 0.0)
+        self._open_until = time.monotonic() + min(duration, self.max_open_seconds)
+        self._probe_started = None
+        self.trips += 1
+        # Повторное размыкание из open продлевает срок - слушатели узнают новый
+        self._transition(STATE_OPEN, force=True)
+
+    def record_response(self, status: Optional[int], body: str = '',
+                        retry_after: Optional[str] = None) -> None:
+        """Учитывает HTTP-ответ HH; None (ошибка сети) и 5xx на состояние не влияют"""
+        if status is None or status >= 500:
+            return
+        if status == 401 or (status == 403 and is_auth_error(body)):
+            # Токен одного аккаунта: пробный запрос завершен, следующий запрос станет новым пробным
+            self._probe_started = None
+            return
+        if status == 429:
+            self.record_failure("429 Too Many Requests", immediate=True, retry_after=_seconds(retry_after))
+        elif status == 403 and is_captcha(body):
+            self.record_failure("403 captcha_required", immediate=True)
+        elif status == 403 and _api_errors(body):
+            # HH ответил на запрос по существу - запросы проходят
+            self.record_success()
+        elif status == 403:
+            self.record_failure("403 Forbidden")
+        else:
+            self.record_success()
+
+    async def wait_open(self) -> None:
+        """Ждет размыкания цепи"""
+        await self._opened.wait()
+
+    def get_stats(self) -> Dict:
+        return {
+            'name': self.name,
+            'state': self.state,
+            'failures': self._failures,
+            'trips': self.trips,
+            'open_remaining': round(self.remaining(), 1),
+            'last_reason': self.last_reason,
+        }
+
+
+def is_captcha(body: Optional[str]) -> bool:
+    """403 с требованием капчи"""
+    return any(marker in (body or '').lower() for marker in CAPTCHA_MARKERS)
+
+
+def is_auth_error(body: Optional[str]) -> bool:
+    """403 из-за токена (отозван, истек, недействителен)"""
+    return any(error.get('type') in AUTH_ERROR_TYPES for error in _api_errors(body))
+
+
+def _api_errors(body: Optional[str]) -> List[Dict]:
+    """errors из JSON-ответа API HH; пусто - ответ не от API"""
+    try:
+        errors = json.loads(body or '').get('errors')
+    except (ValueError, AttributeError):
+        return []
+    return [error for error in errors if isinstance(error, dict)] if isinstance(errors, list) else []
+
+
+def _seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None  # Retry-After в виде даты HH не присылает; пауза по умолчанию
+
+
+# Глобальный экземпляр
+hh_breaker = CircuitBreaker("hh")
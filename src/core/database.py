@@ -1,8 +1,12 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy import select
-from src.core.models import Base, Vacancy
+from sqlalchemy import select, update, delete, func, inspect, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from src.core.models import (Base, Vacancy, ProcessedMessage, IdfTerm, ReprocessCheckpoint,
+                             RateLimitBucket, SendLease, Negotiation, CircuitBreakerState, LetterReview,
+                             AccountLetter)
 from src.core.config import settings
 from src.core.logger import get_logger
 
@@ -10,8 +14,8 @@ logger = get_logger(__name__)
 
 
 class Database:
-    def __init__(self):
-        self.engine = create_async_engine(settings.DATABASE_URL, echo=True)
+    def __init__(self, database_url=None):
+        self.engine = create_async_engine(database_url or settings.DATABASE_URL, echo=True)
         self.async_session = async_sessionmaker(
             self.engine,
             class_=AsyncSession,
@@ -22,10 +26,34 @@ class Database:
         """Создает таблицы при первом запуске"""
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(self._add_missing_columns)
         logger.info("Таблицы БД созданы")
 
-    async def save_vacancy(self, vacancy_data):
-        """Сохраняет вакансию если её ещё нет"""
+    @staticmethod
+    def _add_missing_columns(conn):
+        """Добавляет в существующие таблицы новые колонки моделей
+
+        create_all не меняет уже созданные таблицы, а миграций в проекте нет.
+        Новые колонки должны быть nullable: старые строки получат NULL.
+        """
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                logger.info(f"Добавлена колонка {table.name}.{column.name}")
+
+    async def save_vacancy(self, vacancy_data, minhash=None, duplicate_of=None):
+        """Сохраняет вакансию если её ещё нет
+
+        minhash - сигнатура для поиска перепубликаций, duplicate_of - hh_id оригинала:
+        перепубликация сохраняется обработанной, письмо для нее не генерируется.
+        """
         async with self.async_session() as session:
             try:
                 # Проверяем есть ли уже такая вакансия
@@ -40,6 +68,10 @@ class Database:
 
                 # Создаем новую вакансию
                 vacancy = Vacancy(**vacancy_data)
+                vacancy.minhash = minhash
+                if duplicate_of:
+                    vacancy.duplicate_of = duplicate_of
+                    vacancy.processed = True
                 session.add(vacancy)
                 await session.commit()
                 await session.refresh(vacancy)
@@ -59,8 +91,8 @@ class Database:
             )
             return result.scalar_one_or_none()
 
-    async def mark_cover_letter_generated(self, vacancy_id, cover_letter_text):
-        """Помечает что письмо сгенерировано и сохраняет текст"""
+    async def mark_cover_letter_generated(self, vacancy_id, cover_letter_text, generation=None):
+        """Помечает что письмо сгенерировано и сохраняет текст (и расход токенов, если передан)"""
         async with self.async_session() as session:
             try:
                 result = await session.execute(
@@ -72,7 +104,18 @@ class Database:
                     vacancy.processed = True
                     vacancy.cover_letter_generated = True
                     vacancy.cover_letter = cover_letter_text
+                    vacancy.letter_template = None
                     vacancy.cover_letter_generated_at = datetime.utcnow()
+                    if generation is not None and generation.choice is not None:
+                        # Шаблонное письмо: вместо ~1.5 КБ текста - ссылка на шаблон
+                        vacancy.cover_letter = None
+                        vacancy.letter_template = generation.letter_template
+                    if generation is not None:
+                        vacancy.letter_source = generation.source
+                        vacancy.letter_variant = generation.variant or None
+                        vacancy.llm_prompt_tokens = generation.prompt_tokens
+                        vacancy.llm_completion_tokens = generation.completion_tokens
+                        vacancy.llm_cost = generation.cost
                     await session.commit()
                     logger.info(f"Письмо сохранено для ID: {vacancy_id}")
                     return True
@@ -100,12 +143,304 @@ class Database:
             )
             return result.scalars().all()
 
+    async def get_pending_cover_letters(self):
+        """Получает вакансии с письмами, отклик на которые еще не отправлен"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(Vacancy).where(
+                    Vacancy.cover_letter_generated == True,
+                    Vacancy.applied == False,
+                    Vacancy.archived_at.is_(None),
+                    Vacancy.letter_expired_at.is_(None)
+                )
+            )
+            return result.scalars().all()
+
     async def get_all_vacancies(self):
         """Получает все вакансии"""
         async with self.async_session() as session:
             result = await session.execute(select(Vacancy))
             return result.scalars().all()
 
+    @staticmethod
+    def _applied_since(since, account_id=None):
+        """(applied_at, hh_id) откликов аккаунта начиная с since; None - основной аккаунт"""
+        if account_id is None:
+            return (select(Vacancy.applied_at, Vacancy.hh_id)
+                    .where(Vacancy.applied == True, Vacancy.applied_at >= since))
+        return (select(AccountLetter.applied_at, AccountLetter.vacancy_id)
+                .where(AccountLetter.account_id == account_id, AccountLetter.status == 'sent',
+                       AccountLetter.applied_at >= since))
+
+    @staticmethod
+    def _negotiations_of(account_id=None):
+        """Условие на отклики аккаунта в negotiations"""
+        return Negotiation.account_id.is_(None) if account_id is None else Negotiation.account_id == account_id
+
+    async def get_applied_times(self, since, account_id=None):
+        """Время отправленных откликов аккаунта начиная с since (для журнала ограничителя)"""
+        async with self.async_session() as session:
+            result = await session.execute(self._applied_since(since, account_id))
+            return sorted(applied_at for applied_at, _ in result.all())
+
+    async def upsert_negotiations(self, rows):
+        """Сохраняет отклики из /negotiations (новые добавляются, известные обновляются)"""
+        if not rows:
+            return 0
+        dialect_insert = postgresql.insert if self.engine.dialect.name == 'postgresql' else sqlite.insert
+
+        async with self.async_session() as session:
+            # Порциями: у SQLite ограничено число параметров в одном запросе
+            for start in range(0, len(rows), 100):
+                statement = dialect_insert(Negotiation).values(rows[start:start + 100])
+                statement = statement.on_conflict_do_update(
+                    index_elements=[Negotiation.id],
+                    set_={column: statement.excluded[column]
+                          for column in ('account_id', 'vacancy_id', 'vacancy_name', 'company', 'state',
+                                         'updated_at', 'synced_at')},
+                )
+                await session.execute(statement)
+            await session.commit()
+        return len(rows)
+
+    async def get_last_negotiation_update(self, account_id=None):
+        """Время последнего изменения среди сохраненных откликов аккаунта (None - синхронизации не было)"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(func.max(Negotiation.updated_at)).where(self._negotiations_of(account_id))
+            )
+            return result.scalar_one()
+
+    async def get_applied_vacancy_ids(self, account_id=None):
+        """hh_id вакансий, на которые у аккаунта уже есть отклик: отправленные ботом и найденные в /negotiations"""
+        async with self.async_session() as session:
+            negotiated = await session.execute(
+                select(Negotiation.vacancy_id)
+                .where(Negotiation.vacancy_id.is_not(None), self._negotiations_of(account_id))
+            )
+            if account_id is None:
+                applied = await session.execute(select(Vacancy.hh_id).where(Vacancy.applied == True))
+            else:
+                applied = await session.execute(
+                    select(AccountLetter.vacancy_id)
+                    .where(AccountLetter.account_id == account_id, AccountLetter.status == 'sent')
+                )
+            return set(negotiated.scalars().all()) | set(applied.scalars().all())
+
+    async def mark_applied_from_negotiations(self, account_id=None):
+        """Помечает отправленными письма вакансий с откликом аккаунта на HH (например, сделанным вручную)"""
+        negotiated = select(Negotiation.vacancy_id).where(Negotiation.vacancy_id.is_not(None),
+                                                          self._negotiations_of(account_id))
+        async with self.async_session() as session:
+            if account_id is None:
+                created_at = (
+                    select(func.min(Negotiation.created_at))
+                    .where(Negotiation.vacancy_id == Vacancy.hh_id, self._negotiations_of())
+                    .scalar_subquery()
+                )
+                statement = (
+                    update(Vacancy)
+                    .where(Vacancy.applied == False, Vacancy.hh_id.in_(negotiated))
+                    .values(applied=True, applied_at=created_at)
+                )
+            else:
+                created_at = (
+                    select(func.min(Negotiation.created_at))
+                    .where(Negotiation.vacancy_id == AccountLetter.vacancy_id, self._negotiations_of(account_id))
+                    .scalar_subquery()
+                )
+                statement = (
+                    update(AccountLetter)
+                    .where(AccountLetter.account_id == account_id, AccountLetter.status != 'sent',
+                           AccountLetter.vacancy_id.in_(negotiated))
+                    .values(status='sent', applied_at=created_at)
+                )
+            result = await session.execute(statement.execution_options(synchronize_session=False))
+            await session.commit()
+            return result.rowcount
+
+    async def get_negotiation_stats(self):
+        """Число откликов на HH по статусам"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(Negotiation.state, func.count(Negotiation.id)).group_by(Negotiation.state)
+            )
+            return {state or 'unknown': count for state, count in result.all()}
+
+    async def get_employer_response_stats(self, positive_states):
+        """Отклики по работодателям: company -> (всего, с состоянием из positive_states)"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(
+                    Negotiation.company,
+                    func.count(Negotiation.id),
+                    func.sum(case((Negotiation.state.in_(list(positive_states)), 1), else_=0)),
+                )
+                .where(Negotiation.company.is_not(None))
+                .group_by(Negotiation.company)
+            )
+            return {company: (total, positive or 0) for company, total, positive in result.all()}
+
+    async def add_letter_review(self, row):
+        """Ставит письмо на проверку; повторная доставка обновляет только еще не решенное письмо"""
+        dialect_insert = postgresql.insert if self.engine.dialect.name == 'postgresql' else sqlite.insert
+
+        async with self.async_session() as session:
+            statement = dialect_insert(LetterReview).values(status='pending', created_at=datetime.utcnow(), **row)
+            statement = statement.on_conflict_do_update(
+                index_elements=[LetterReview.vacancy_id],
+                set_={column: statement.excluded[column]
+                      for column in ('vacancy_name', 'company', 'url', 'relevance', 'cover_letter', 'letter_template')},
+                where=LetterReview.status == 'pending',
+            )
+            await session.execute(statement)
+            await session.commit()
+
+    async def get_letter_reviews(self, statuses, limit=None):
+        """Письма с указанными статусами, сначала самые релевантные"""
+        async with self.async_session() as session:
+            query = (
+                select(LetterReview)
+                .where(LetterReview.status.in_(list(statuses)))
+                .order_by(LetterReview.relevance.desc().nulls_last(), LetterReview.created_at)
+            )
+            if limit:
+                query = query.limit(limit)
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    async def set_letter_review_status(self, vacancy_ids, status, from_statuses=None):
+        """Меняет статус писем (from_statuses - только из этих статусов); число измененных"""
+        conditions = [LetterReview.vacancy_id.in_([str(vacancy_id) for vacancy_id in vacancy_ids])]
+        if from_statuses:
+            conditions.append(LetterReview.status.in_(list(from_statuses)))
+        values = {'status': status}
+        if status in ('approved', 'rejected'):
+            values['decided_at'] = datetime.utcnow()
+
+        async with self.async_session() as session:
+            try:
+                result = await session.execute(update(LetterReview).where(*conditions).values(**values))
+                await session.commit()
+                return result.rowcount
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка изменения статуса писем: {e}")
+                return 0
+
+    async def get_letter_review_stats(self):
+        """Число писем на проверке по статусам"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(LetterReview.status, func.count(LetterReview.vacancy_id)).group_by(LetterReview.status)
+            )
+            return dict(result.all())
+
+    async def save_breaker_state(self, state_id, **values):
+        """Записывает состояние предохранителя воркера"""
+        async with self.async_session() as session:
+            try:
+                await session.merge(CircuitBreakerState(id=state_id, updated_at=datetime.utcnow(), **values))
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка записи состояния предохранителя: {e}")
+
+    async def get_breaker_states(self):
+        """Состояния предохранителей по воркерам"""
+        async with self.async_session() as session:
+            result = await session.execute(select(CircuitBreakerState).order_by(CircuitBreakerState.id))
+            return result.scalars().all()
+
+    async def ensure_rate_limit_bucket(self, name, since, account_id=None):
+        """Создает общий бюджет откликов, если его нет
+
+        Новый бюджет заполняется временем откликов аккаунта (vacancies.applied_at
+        или account_letters.applied_at), чтобы переход на общий ограничитель не
+        обнулял уже израсходованный лимит.
+        """
+        async with self.async_session() as session:
+            if await session.get(RateLimitBucket, name) is not None:
+                return False
+            try:
+                session.add(RateLimitBucket(name=name))
+                applied = await session.execute(self._applied_since(since, account_id))
+                session.add_all(SendLease(bucket=name, leased_at=applied_at, holder='backfill', vacancy_id=hh_id)
+                                for applied_at, hh_id in applied.all())
+                await session.commit()
+                logger.info(f"Создан общий бюджет откликов '{name}'")
+                return True
+            except IntegrityError:
+                await session.rollback()  # Бюджет одновременно создала другая реплика
+                return False
+
+    async def get_send_lease_times(self, name, since):
+        """Время выданных слотов бюджета начиная с since"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(SendLease.leased_at)
+                .where(SendLease.bucket == name, SendLease.leased_at >= since)
+                .order_by(SendLease.leased_at)
+            )
+            return list(result.scalars().all())
+
+    async def lease_send_slot(self, name, now, since, can_send, holder=None, vacancy_id=None):
+        """Атомарно проверяет окна бюджета и выдает слот отправки
+
+        can_send(stamps) получает время слотов за окно (после since) и решает,
+        можно ли отправлять в now. Возвращает id слота, 0 - окна заполнены,
+        None - бюджет занят другой репликой или ошибка БД (повторить позже).
+
+        PostgreSQL: строка бюджета берется SELECT ... FOR UPDATE SKIP LOCKED,
+        реплики не ждут друг друга на блокировке. SQLite (один узел): UPDATE
+        строки бюджета в начале транзакции захватывает блокировку записи БД,
+        остальные ждут ее в пределах busy timeout.
+        """
+        async with self.async_session() as session:
+            try:
+                async with session.begin():
+                    if self.engine.dialect.name == 'postgresql':
+                        locked = await session.execute(
+                            select(RateLimitBucket.name)
+                            .where(RateLimitBucket.name == name)
+                            .with_for_update(skip_locked=True)
+                        )
+                        if locked.scalar_one_or_none() is None:
+                            return None
+                    else:
+                        await session.execute(
+                            update(RateLimitBucket).where(RateLimitBucket.name == name).values(updated_at=now)
+                        )
+
+                    await session.execute(
+                        delete(SendLease).where(SendLease.bucket == name, SendLease.leased_at < since)
+                    )
+                    stamps = await session.execute(
+                        select(SendLease.leased_at).where(SendLease.bucket == name).order_by(SendLease.leased_at)
+                    )
+                    if not can_send(list(stamps.scalars().all())):
+                        return 0
+
+                    lease = SendLease(bucket=name, leased_at=now, holder=holder, vacancy_id=vacancy_id)
+                    session.add(lease)
+                    await session.flush()
+                    return lease.id
+            except Exception as e:
+                logger.error(f"Ошибка выдачи слота отправки '{name}': {e}")
+                return None
+
+    async def delete_send_lease(self, lease_id):
+        """Возвращает слот в бюджет: отклик так и не был отправлен"""
+        async with self.async_session() as session:
+            try:
+                await session.execute(delete(SendLease).where(SendLease.id == lease_id))
+                await session.commit()
+                return True
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка возврата слота отправки: {e}")
+                return False
+
     async def mark_as_applied(self, vacancy_id):
         """Помечает вакансию как отправленную"""
         async with self.async_session() as session:
@@ -127,6 +462,392 @@ class Database:
                 logger.error(f"Ошибка отметки отправки: {e}")
                 return False
 
+    async def mark_vacancies_archived(self, hh_ids):
+        """Отмечает вакансии закрытыми на HH (архив или удалены)"""
+        async with self.async_session() as session:
+            try:
+                result = await session.execute(
+                    update(Vacancy)
+                    .where(Vacancy.hh_id.in_(list(hh_ids)), Vacancy.archived_at.is_(None))
+                    .values(archived_at=datetime.utcnow())
+                )
+                await session.commit()
+                return result.rowcount
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка отметки закрытых вакансий: {e}")
+                return 0
+
+    async def mark_letters_expired(self, hh_ids, account_id=None):
+        """Отмечает письма аккаунта просроченными: в очереди отправки и на проверке они больше не нужны"""
+        hh_ids = list(hh_ids)
+        if account_id is not None:
+            return await self.set_account_letter_status(account_id, hh_ids, 'expired', from_statuses=('queued',))
+        async with self.async_session() as session:
+            try:
+                result = await session.execute(
+                    update(Vacancy)
+                    .where(Vacancy.hh_id.in_(hh_ids), Vacancy.applied == False, Vacancy.letter_expired_at.is_(None))
+                    .values(letter_expired_at=datetime.utcnow())
+                )
+                await session.execute(
+                    update(LetterReview)
+                    .where(LetterReview.vacancy_id.in_(hh_ids), LetterReview.status.in_(('pending', 'approved')))
+                    .values(status='expired')
+                )
+                await session.commit()
+                return result.rowcount
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка отметки просроченных писем: {e}")
+                return 0
+
+    async def expire_stale_letters(self, cutoff):
+        """Отмечает просроченными неотправленные письма вакансий, опубликованных раньше cutoff"""
+        published = func.coalesce(Vacancy.published_at, Vacancy.created_at)
+        async with self.async_session() as session:
+            try:
+                result = await session.execute(
+                    update(Vacancy)
+                    .where(Vacancy.cover_letter_generated == True, Vacancy.applied == False,
+                           Vacancy.letter_expired_at.is_(None), published < cutoff)
+                    .values(letter_expired_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+                await session.execute(
+                    update(LetterReview)
+                    .where(LetterReview.status.in_(('pending', 'approved')),
+                           LetterReview.vacancy_id.in_(
+                               select(Vacancy.hh_id).where(Vacancy.letter_expired_at.is_not(None))))
+                    .values(status='expired')
+                    .execution_options(synchronize_session=False)
+                )
+                # Письма дополнительных аккаунтов: по возрасту вакансии, независимо от отклика основного
+                accounts_result = await session.execute(
+                    update(AccountLetter)
+                    .where(AccountLetter.status == 'queued',
+                           AccountLetter.vacancy_id.in_(select(Vacancy.hh_id).where(published < cutoff)))
+                    .values(status='expired')
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                return result.rowcount + accounts_result.rowcount
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка отметки просроченных писем: {e}")
+                return 0
+
+    async def add_account_letters(self, account_id, hh_ids):
+        """Записывает письма, поставленные в очередь аккаунта; уже известные не меняются"""
+        rows = [{'account_id': account_id, 'vacancy_id': str(hh_id).strip(), 'status': 'queued',
+                 'queued_at': datetime.utcnow()} for hh_id in hh_ids]
+        if not rows:
+            return 0
+        dialect_insert = postgresql.insert if self.engine.dialect.name == 'postgresql' else sqlite.insert
+        async with self.async_session() as session:
+            statement = dialect_insert(AccountLetter).values(rows).on_conflict_do_nothing(
+                index_elements=[AccountLetter.account_id, AccountLetter.vacancy_id])
+            result = await session.execute(statement)
+            await session.commit()
+            return result.rowcount
+
+    async def set_account_letter_status(self, account_id, hh_ids, status, from_statuses=None):
+        """Меняет статус писем аккаунта (sent - с временем отклика); число измененных"""
+        hh_ids = [str(hh_id).strip() for hh_id in hh_ids]
+        if not hh_ids:
+            return 0
+        values = {'status': status}
+        if status == 'sent':
+            values['applied_at'] = datetime.utcnow()
+        conditions = [AccountLetter.account_id == account_id, AccountLetter.vacancy_id.in_(hh_ids)]
+        if from_statuses is not None:
+            conditions.append(AccountLetter.status.in_(list(from_statuses)))
+        async with self.async_session() as session:
+            try:
+                result = await session.execute(update(AccountLetter).where(*conditions).values(**values))
+                await session.commit()
+                return result.rowcount
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка смены статуса писем аккаунта {account_id}: {e}")
+                return 0
+
+    async def get_pending_account_letters(self):
+        """Письма дополнительных аккаунтов в очереди: (account_id, вакансия с письмом)"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(AccountLetter.account_id, Vacancy)
+                .join(Vacancy, Vacancy.hh_id == AccountLetter.vacancy_id)
+                .where(AccountLetter.status == 'queued', Vacancy.cover_letter_generated == True,
+                       Vacancy.archived_at.is_(None))
+            )
+            return list(result.all())
+
+    async def get_account_letter_stats(self):
+        """Письма дополнительных аккаунтов: account_id -> {статус: число}"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(AccountLetter.account_id, AccountLetter.status, func.count())
+                .group_by(AccountLetter.account_id, AccountLetter.status)
+            )
+            stats = {}
+            for account_id, status, count in result.all():
+                stats.setdefault(account_id, {})[status] = count
+            return stats
+
+    async def claim_message(self, stage, message_key, stale_after=None):
+        """Захватывает стадию для сообщения до начала работы
+
+        True - захват получен, False - стадия уже выполнена или выполняется
+        другим обработчиком, None - ошибка БД (решение принимает вызывающий).
+        stale_after - через сколько секунд незавершенный захват можно перехватить.
+        """
+        async with self.async_session() as session:
+            try:
+                session.add(ProcessedMessage(stage=stage, message_key=message_key))
+                await session.commit()
+                return True
+            except IntegrityError:
+                await session.rollback()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка захвата сообщения {stage}/{message_key}: {e}")
+                return None
+
+            try:
+                conditions = [
+                    ProcessedMessage.stage == stage,
+                    ProcessedMessage.message_key == message_key,
+                ]
+                if stale_after is not None:
+                    # Захват упавшего обработчика: перехватываем атомарным UPDATE
+                    deadline = datetime.utcnow() - timedelta(seconds=stale_after)
+                    result = await session.execute(
+                        update(ProcessedMessage)
+                        .where(*conditions,
+                               ProcessedMessage.status == 'in_progress',
+                               ProcessedMessage.claimed_at < deadline)
+                        .values(claimed_at=datetime.utcnow())
+                    )
+                    if result.rowcount:
+                        await session.commit()
+                        logger.warning(f"Перехвачен зависший захват: {stage}/{message_key}")
+                        return True
+
+                await session.execute(
+                    update(ProcessedMessage)
+                    .where(*conditions)
+                    .values(duplicates=ProcessedMessage.duplicates + 1)
+                )
+                await session.commit()
+                return False
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка захвата сообщения {stage}/{message_key}: {e}")
+                return None
+
+    async def complete_message(self, stage, message_key):
+        """Отмечает захваченную стадию как выполненную"""
+        async with self.async_session() as session:
+            try:
+                await session.execute(
+                    update(ProcessedMessage)
+                    .where(ProcessedMessage.stage == stage, ProcessedMessage.message_key == message_key)
+                    .values(status='done')
+                )
+                await session.commit()
+                return True
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка отметки обработки сообщения: {e}")
+                return False
+
+    async def release_message(self, stage, message_key):
+        """Снимает захват, чтобы сообщение можно было обработать повторно"""
+        async with self.async_session() as session:
+            try:
+                await session.execute(
+                    delete(ProcessedMessage)
+                    .where(ProcessedMessage.stage == stage,
+                           ProcessedMessage.message_key == message_key,
+                           ProcessedMessage.status == 'in_progress')
+                )
+                await session.commit()
+                return True
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка снятия захвата сообщения: {e}")
+                return False
+
+    async def get_duplicate_stats(self):
+        """Количество подавленных повторных доставок по стадиям"""
+        async with self.async_session() as session:
+            try:
+                result = await session.execute(
+                    select(ProcessedMessage.stage, func.sum(ProcessedMessage.duplicates))
+                    .group_by(ProcessedMessage.stage)
+                )
+                return {stage: int(total or 0) for stage, total in result.all()}
+            except Exception as e:
+                logger.error(f"Ошибка получения статистики дубликатов: {e}")
+                return {}
+
+    async def get_idf_table(self):
+        """Документные частоты корзин и число учтенных документов (вакансий с оценкой)"""
+        async with self.async_session() as session:
+            terms = await session.execute(select(IdfTerm.bucket, IdfTerm.doc_freq))
+            documents = await session.execute(
+                select(func.count(Vacancy.id)).where(Vacancy.relevance_score.is_not(None))
+            )
+            return dict(terms.all()), int(documents.scalar_one())
+
+    async def increment_doc_freqs(self, increments):
+        """Прибавляет документные частоты корзин одним upsert: {корзина: прирост}"""
+        if not increments:
+            return
+        dialect_insert = postgresql.insert if self.engine.dialect.name == 'postgresql' else sqlite.insert
+        rows = [{'bucket': int(bucket), 'doc_freq': int(count)} for bucket, count in increments.items()]
+
+        async with self.async_session() as session:
+            # Порциями: у SQLite ограничено число параметров в одном запросе
+            for start in range(0, len(rows), 400):
+                statement = dialect_insert(IdfTerm).values(rows[start:start + 400])
+                statement = statement.on_conflict_do_update(
+                    index_elements=[IdfTerm.bucket],
+                    set_={'doc_freq': IdfTerm.doc_freq + statement.excluded.doc_freq},
+                )
+                await session.execute(statement)
+            await session.commit()
+
+    async def save_relevance_scores(self, scores, gated_out=()):
+        """Сохраняет оценки {hh_id: score}; вакансии из gated_out помечаются обработанными без письма"""
+        async with self.async_session() as session:
+            try:
+                for hh_id, score in scores.items():
+                    values = {'relevance_score': score}
+                    if hh_id in gated_out:
+                        values['processed'] = True
+                    await session.execute(update(Vacancy).where(Vacancy.hh_id == hh_id).values(**values))
+                await session.commit()
+                return True
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка сохранения оценок релевантности: {e}")
+                return False
+
+    async def get_minhash_signatures(self):
+        """Пары (hh_id, сигнатура) для построения индекса перепубликаций"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(Vacancy.hh_id, Vacancy.minhash).where(Vacancy.minhash.is_not(None))
+            )
+            return result.all()
+
+    async def get_vacancies_without_minhash(self, after_id=0, limit=500):
+        """Порция вакансий без сигнатуры по возрастанию id (keyset-пагинация для backfill)"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(Vacancy)
+                .where(Vacancy.minhash.is_(None), Vacancy.id > after_id)
+                .order_by(Vacancy.id)
+                .limit(limit)
+            )
+            return result.scalars().all()
+
+    async def save_minhashes(self, rows):
+        """Сохраняет сигнатуры порции: [(id, сигнатура, hh_id оригинала или None)]"""
+        async with self.async_session() as session:
+            try:
+                for vacancy_id, minhash, duplicate_of in rows:
+                    await session.execute(
+                        update(Vacancy).where(Vacancy.id == vacancy_id)
+                        .values(minhash=minhash, duplicate_of=duplicate_of)
+                    )
+                await session.commit()
+                return True
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка сохранения сигнатур: {e}")
+                return False
+
+    async def get_llm_usage_stats(self):
+        """Письма по источнику (llm/template), суммарные токены и стоимость генерации"""
+        async with self.async_session() as session:
+            try:
+                result = await session.execute(
+                    select(
+                        Vacancy.letter_source,
+                        func.count(Vacancy.id),
+                        func.sum(Vacancy.llm_prompt_tokens),
+                        func.sum(Vacancy.llm_completion_tokens),
+                        func.sum(Vacancy.llm_cost),
+                    )
+                    .where(Vacancy.letter_source.is_not(None))
+                    .group_by(Vacancy.letter_source)
+                )
+                return {
+                    source: {
+                        'letters': int(count),
+                        'prompt_tokens': int(prompt or 0),
+                        'completion_tokens': int(completion or 0),
+                        'cost': float(cost or 0),
+                    }
+                    for source, count, prompt, completion, cost in result.all()
+                }
+            except Exception as e:
+                logger.error(f"Ошибка получения статистики генерации: {e}")
+                return {}
+
+    async def count_vacancies(self, conditions=()):
+        """Число вакансий, подходящих под условия"""
+        async with self.async_session() as session:
+            result = await session.execute(select(func.count(Vacancy.id)).where(*conditions))
+            return int(result.scalar_one())
+
+    async def get_vacancies_page(self, conditions=(), after_id=0, limit=500):
+        """Порция вакансий по условиям после after_id (keyset-пагинация по id)"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(Vacancy)
+                .where(Vacancy.id > after_id, *conditions)
+                .order_by(Vacancy.id)
+                .limit(limit)
+            )
+            return result.scalars().all()
+
+    async def bulk_update_vacancies(self, rows):
+        """Обновляет вакансии одним executemany: [{'id': ..., колонка: значение}]"""
+        if not rows:
+            return True
+        async with self.async_session() as session:
+            try:
+                await session.execute(update(Vacancy), rows)
+                await session.commit()
+                return True
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Ошибка пакетного обновления вакансий: {e}")
+                return False
+
+    async def get_reprocess_checkpoint(self, name):
+        """Чекпоинт переобработки или None"""
+        async with self.async_session() as session:
+            return await session.get(ReprocessCheckpoint, name)
+
+    async def save_reprocess_checkpoint(self, name, last_id, processed):
+        """Сохраняет позицию переобработки"""
+        async with self.async_session() as session:
+            await session.merge(ReprocessCheckpoint(
+                name=name, last_id=last_id, processed=processed, updated_at=datetime.utcnow()
+            ))
+            await session.commit()
+
+    async def delete_reprocess_checkpoint(self, name):
+        """Удаляет чекпоинт (переобработка завершена или начинается заново)"""
+        async with self.async_session() as session:
+            await session.execute(delete(ReprocessCheckpoint).where(ReprocessCheckpoint.name == name))
+            await session.commit()
+
 
 # Глобальный экземпляр
 db = Database()
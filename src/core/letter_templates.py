@@ -0,0 +1,263 @@
+"""Шаблоны сопроводительных писем
+
+Шаблоны лежат в каталоге LETTER_TEMPLATES_DIR (по умолчанию src/templates/letters):
+manifest.json описывает варианты писем (A/B, с весами) и правила выбора фразы
+о том, что привлекло в вакансии; тексты вариантов - отдельные файлы с
+плейсхолдерами {{поле}}. Шаблоны компилируются один раз при загрузке и
+перечитываются при изменении файлов без перезапуска воркеров.
+
+Выбор варианта и фразы детерминирован: зависит только от hh_id вакансии и
+ее токенов, поэтому повторная генерация дает то же письмо.
+"""
+
+import json
+import re
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.core.text import search_text_of
+
+logger = get_logger(__name__)
+
+DEFAULT_TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates" / "letters"
+MANIFEST_FILE = "manifest.json"
+
+PLACEHOLDER_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+VACANCY_FIELDS = ('company', 'vacancy_name', 'attraction')
+CONTACT_FIELDS = ('contact_name', 'contact_phone', 'contact_telegram', 'contact_github', 'contact_email')
+
+
+class TemplateError(ValueError):
+    """Шаблон или manifest.json некорректны"""
+
+
+class CompiledTemplate:
+    """Шаблон, разобранный на литералы и поля: рендер - одна склейка строк"""
+
+    def __init__(self, text: str, name: str = ''):
+        parts = PLACEHOLDER_RE.split(text.strip())
+        self.literals: Tuple[str, ...] = tuple(parts[0::2])
+        self.fields: Tuple[str, ...] = tuple(parts[1::2])
+        unknown = set(self.fields) - set(VACANCY_FIELDS) - set(CONTACT_FIELDS)
+        if unknown:
+            raise TemplateError(f"{name}: неизвестные поля {', '.join(sorted(unknown))}")
+
+    def render(self, values: Dict[str, str]) -> str:
+        out = [self.literals[0]]
+        for name, literal in zip(self.fields, self.literals[1:]):
+            out.append(values[name])
+            out.append(literal)
+        return ''.join(out)
+
+
+@dataclass
+class Attraction:
+    id: str
+    text: str
+    keywords: Tuple[str, ...] = ()  # Пусто - фраза из общего набора, выбирается по hh_id
+
+
+@dataclass
+class TemplateSet:
+    """Скомпилированное содержимое каталога шаблонов"""
+    version: int
+    variants: Dict[str, CompiledTemplate]
+    weights: List[Tuple[str, int]]
+    rules: List[Attraction]
+    defaults: List[Attraction]
+    attractions: Dict[str, Attraction] = field(default_factory=dict)
+
+    @property
+    def total_weight(self) -> int:
+        return sum(weight for _, weight in self.weights)
+
+
+@dataclass
+class LetterChoice:
+    """Выбранный вариант письма и значения полей (без контактов - они из настроек)"""
+    variant: str
+    version: int
+    params: Dict[str, str]  # company, vacancy_name, attraction (id фразы)
+
+
+def encode_choice(choice: LetterChoice) -> str:
+    """Компактная ссылка на шаблон для БД и очереди (название и компания хранятся отдельно)"""
+    return json.dumps({'t': choice.variant, 'v': choice.version, 'a': choice.params.get('attraction')},
+                      ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_choice(stored: str, company: str, vacancy_name: str) -> LetterChoice:
+    """LetterChoice из ссылки encode_choice; TemplateError - если ссылка повреждена"""
+    try:
+        data = json.loads(stored)
+        return LetterChoice(variant=data['t'], version=int(data['v']),
+                            params={'company': company or '', 'vacancy_name': vacancy_name or '',
+                                    'attraction': data.get('a')})
+    except (ValueError, KeyError, TypeError) as e:
+        raise TemplateError(f"Некорректная ссылка на шаблон письма: {stored!r}") from e
+
+
+def _seed(vacancy_data: dict, salt: str) -> int:
+    key = vacancy_data.get('hh_id') or vacancy_data.get('name') or ''
+    return zlib.crc32(f"{key}|{salt}".encode('utf-8'))
+
+
+def load_template_set(directory: Path) -> TemplateSet:
+    """Читает и компилирует каталог шаблонов; TemplateError - при ошибке в файлах"""
+    try:
+        manifest = json.loads((directory / MANIFEST_FILE).read_text(encoding='utf-8'))
+        variants, weights = {}, []
+        for variant in manifest['variants']:
+            text = (directory / variant['file']).read_text(encoding='utf-8')
+            variants[variant['id']] = CompiledTemplate(text, variant['file'])
+            weights.append((variant['id'], int(variant.get('weight', 1))))
+        attractions = [Attraction(item['id'], item['text'], tuple(item.get('keywords', ())))
+                       for item in manifest['attractions']]
+    except (OSError, KeyError, TypeError, json.JSONDecodeError) as e:
+        raise TemplateError(f"{directory}: {e!r}") from e
+
+    template_set = TemplateSet(
+        version=int(manifest.get('version', 1)),
+        variants=variants,
+        weights=[(variant_id, weight) for variant_id, weight in weights if weight > 0],
+        rules=[item for item in attractions if item.keywords],
+        defaults=[item for item in attractions if not item.keywords],
+        attractions={item.id: item for item in attractions},
+    )
+    if not template_set.weights or not template_set.defaults:
+        raise TemplateError(f"{directory}: нужны вариант с весом > 0 и хотя бы одна фраза без keywords")
+    return template_set
+
+
+class LetterTemplates:
+    """Выбор и рендер шаблонных писем с перезагрузкой при изменении файлов"""
+
+    def __init__(self, directory: Optional[str] = None, reload_interval: Optional[float] = None):
+        self.directory = Path(directory or settings.LETTER_TEMPLATES_DIR or DEFAULT_TEMPLATES_DIR)
+        self.reload_interval = (settings.LETTER_TEMPLATES_RELOAD_INTERVAL
+                                if reload_interval is None else reload_interval)
+        self._set: Optional[TemplateSet] = None
+        self._stamp: Optional[tuple] = None
+        self._checked = 0.0
+
+    def _files_stamp(self) -> tuple:
+        return tuple(sorted((path.name, path.stat().st_mtime_ns, path.stat().st_size)
+                            for path in self.directory.iterdir() if path.is_file()))
+
+    def templates(self) -> TemplateSet:
+        """Текущий набор шаблонов; файлы проверяются не чаще reload_interval секунд"""
+        now = time.monotonic()
+        if self._set is not None and now - self._checked < self.reload_interval:
+            return self._set
+        self._checked = now
+
+        stamp = self._files_stamp()
+        if stamp != self._stamp:
+            try:
+                self._set = load_template_set(self.directory)
+                logger.info(f"Шаблоны писем загружены: {', '.join(self._set.variants)} "
+                            f"(версия {self._set.version})")
+            except TemplateError as e:
+                if self._set is None:
+                    raise
+                # Ошибка в отредактированных файлах не должна останавливать воркеры
+                logger.error(f"Шаблоны не перезагружены, используются прежние: {e}")
+            self._stamp = stamp
+        return self._set
+
+    def attraction(self, vacancy_data: dict, template_set: Optional[TemplateSet] = None) -> Attraction:
+        """Фраза о том, что привлекло: первое правило, чьи keywords есть в токенах вакансии"""
+        template_set = template_set or self.templates()
+        text = search_text_of(vacancy_data)
+        for rule in template_set.rules:
+            if any(keyword in text for keyword in rule.keywords):
+                return rule
+        return template_set.defaults[_seed(vacancy_data, 'attraction') % len(template_set.defaults)]
+
+    def choose(self, vacancy_data: dict, template_set: Optional[TemplateSet] = None) -> LetterChoice:
+        """Вариант письма (по весам, детерминированно по hh_id) и значения полей"""
+        template_set = template_set or self.templates()
+        point = _seed(vacancy_data, 'variant') % template_set.total_weight
+        for variant, weight in template_set.weights:
+            if point < weight:
+                break
+            point -= weight
+
+        return LetterChoice(
+            variant=variant,
+            version=template_set.version,
+            params={
+                'company': vacancy_data.get('company') or '',
+                'vacancy_name': vacancy_data.get('name') or '',
+                'attraction': self.attraction(vacancy_data, template_set).id,
+            },
+        )
+
+    def render_choice(self, choice: LetterChoice, template_set: Optional[TemplateSet] = None,
+                      contacts: Optional[Dict[str, str]] = None) -> str:
+        """Текст письма по выбранному варианту; контакты - из настроек или contacts (аккаунт)"""
+        template_set = template_set or self.templates()
+        template = template_set.variants.get(choice.variant)
+        if template is None:
+            raise TemplateError(f"Вариант письма '{choice.variant}' не найден")
+        attraction = template_set.attractions.get(choice.params.get('attraction'))
+
+        values = {
+            'company': choice.params.get('company', ''),
+            'vacancy_name': choice.params.get('vacancy_name', ''),
+            'attraction': attraction.text if attraction else template_set.defaults[0].text,
+            'contact_name': settings.CONTACT_NAME,
+            'contact_phone': settings.CONTACT_PHONE,
+            'contact_telegram': settings.CONTACT_TELEGRAM,
+            'contact_github': settings.CONTACT_GITHUB,
+            'contact_email': settings.CONTACT_EMAIL,
+        }
+        values.update(contacts or {})
+        return template.render(values)
+
+    def render_stored(self, stored: str, company: str, vacancy_name: str,
+                      contacts: Optional[Dict[str, str]] = None) -> str:
+        """Текст письма по ссылке из БД или сообщения (рендер при отправке)
+
+        Если вариант с тех пор удален из manifest.json, используется первый
+        действующий: отклик важнее точного совпадения формулировок.
+        """
+        template_set = self.templates()
+        choice = decode_choice(stored, company, vacancy_name)
+        if choice.variant not in template_set.variants:
+            logger.warning(f"Вариант письма '{choice.variant}' больше не существует, "
+                           f"используется '{template_set.weights[0][0]}'")
+            choice.variant = template_set.weights[0][0]
+        elif choice.version != template_set.version:
+            logger.debug(f"Письмо {choice.variant} v{choice.version} рендерится шаблонами v{template_set.version}")
+        return self.render_choice(choice, template_set, contacts)
+
+    def letter_text(self, letter_data: dict, contacts: Optional[Dict[str, str]] = None) -> str:
+        """Текст письма из данных CoverLetterMessage: готовый текст (LLM) или рендер по ссылке"""
+        if letter_data.get('cover_letter') or not letter_data.get('letter_template'):
+            return letter_data.get('cover_letter') or ''
+        return self.render_stored(letter_data['letter_template'], letter_data.get('company'),
+                                  letter_data.get('vacancy_name'), contacts)
+
+    def render(self, vacancy_data: dict) -> Tuple[LetterChoice, str]:
+        """Выбор и текст письма для одной вакансии"""
+        template_set = self.templates()
+        choice = self.choose(vacancy_data, template_set)
+        return choice, self.render_choice(choice, template_set)
+
+    def render_batch(self, vacancies: List[dict]) -> List[Tuple[LetterChoice, str]]:
+        """Письма для многих вакансий: файлы проверяются один раз на пакет"""
+        template_set = self.templates()
+        results = []
+        for vacancy_data in vacancies:
+            choice = self.choose(vacancy_data, template_set)
+            results.append((choice, self.render_choice(choice, template_set)))
+        return results
+
+
+# Глобальный экземпляр
+letter_templates = LetterTemplates()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, LargeBinary, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, UTC, timezone
 
@@ -16,15 +16,40 @@ class Vacancy(Base):
     salary_currency = Column(String(10))
     experience = Column(String(100))
     employment = Column(String(100))
-    description = Column(Text)
+    description = Column(Text)  # обычный текст (до нормализации при приеме - HTML)
     skills = Column(Text)
     url = Column(String(500))
+    published_at = Column(DateTime)  # naive UTC, время публикации на HH
+
+    # Нормализация при приеме: исходный HTML описания, токены и их хеш
+    description_html = Column(Text)
+    search_text = Column(Text)
+    text_hash = Column(String(16))
+
+    # Релевантность резюме (косинус TF-IDF, 0..1)
+    relevance_score = Column(Float)
+
+    # Перепубликации: MinHash-сигнатура названия и описания, hh_id оригинала
+    minhash = Column(LargeBinary)
+    duplicate_of = Column(String(50))
+
+    # Вакансия закрыта на HH (архив или удалена) - отклик не отправляется
+    archived_at = Column(DateTime)
+
+    # Письмо устарело (LETTER_MAX_AGE_HOURS с публикации) - отклик не отправляется
+    letter_expired_at = Column(DateTime)
 
     # Статусы обработки
     processed = Column(Boolean, default=False)
     cover_letter_generated = Column(Boolean, default=False)
-    cover_letter = Column(Text)
+    cover_letter = Column(Text)  # Текст письма LLM; шаблонное письмо хранится ссылкой в letter_template
+    letter_template = Column(String(200))  # Вариант, версия и параметры шаблона (см. letter_templates)
     cover_letter_generated_at = Column(DateTime)
+    letter_source = Column(String(20))  # llm, cache или template
+    letter_variant = Column(String(50))  # Вариант шаблона (A/B) для писем по шаблону
+    llm_prompt_tokens = Column(Integer)
+    llm_completion_tokens = Column(Integer)
+    llm_cost = Column(Float)  # USD
 
     # Отправка отклика
     applied = Column(Boolean, default=False)
@@ -49,3 +74,140 @@ class Vacancy(Base):
             'applied': self.applied,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class IdfTerm(Base):
+    """Документная частота хешированного терма для IDF скоринга релевантности"""
+    __tablename__ = 'idf_terms'
+
+    bucket = Column(Integer, primary_key=True, autoincrement=False)  # Номер корзины хеша терма
+    doc_freq = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<IdfTerm(bucket={self.bucket}, doc_freq={self.doc_freq})>"
+
+
+class ReprocessCheckpoint(Base):
+    """Позиция массовой переобработки (main.py reprocess) для продолжения после остановки"""
+    __tablename__ = 'reprocess_checkpoints'
+
+    name = Column(String(64), primary_key=True)  # Отпечаток фильтра или имя, заданное в команде
+    last_id = Column(Integer, nullable=False, default=0)  # Последний обработанный vacancies.id
+    processed = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ReprocessCheckpoint(name='{self.name}', last_id={self.last_id})>"
+
+
+class Negotiation(Base):
+    """Отклик на HH.ru из /negotiations: отправленные ботом и вручную, с текущим статусом"""
+    __tablename__ = 'negotiations'
+
+    id = Column(String(50), primary_key=True)  # id отклика на HH
+    account_id = Column(String(40), index=True)  # Аккаунт (см. accounts); None - основной
+    vacancy_id = Column(String(50), index=True)  # hh_id вакансии; None - вакансия удалена
+    vacancy_name = Column(String(500))
+    company = Column(String(255))
+    state = Column(String(50))  # response, invitation, discard, ...
+    created_at = Column(DateTime)  # naive UTC, время HH
+    updated_at = Column(DateTime)
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Negotiation(id='{self.id}', vacancy_id='{self.vacancy_id}', state='{self.state}')>"
+
+
+class LetterReview(Base):
+    """Письмо, ожидающее решения в интерактивном режиме (см. ReviewQueue)"""
+    __tablename__ = 'letter_reviews'
+
+    vacancy_id = Column(String(50), primary_key=True)  # hh_id вакансии
+    vacancy_name = Column(String(500))
+    company = Column(String(255))
+    url = Column(String(500))
+    relevance = Column(Float)
+    cover_letter = Column(Text)  # Готовый текст (шаблонное письмо собрано при приеме)
+    letter_template = Column(String(200))
+    expires_at = Column(Float)  # Срок письма (epoch, см. letter_expires_at)
+    status = Column(String(20), index=True, default='pending')  # pending, approved, rejected, sent, failed, skipped, expired
+    created_at = Column(DateTime, default=datetime.utcnow)
+    decided_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<LetterReview(vacancy_id='{self.vacancy_id}', status='{self.status}')>"
+
+
+class AccountLetter(Base):
+    """Письмо дополнительного аккаунта: у основного состояние хранится в vacancies"""
+    __tablename__ = 'account_letters'
+
+    account_id = Column(String(40), primary_key=True)
+    vacancy_id = Column(String(50), primary_key=True)  # hh_id вакансии, письмо - в vacancies
+    status = Column(String(20), index=True, default='queued')  # queued, sent, failed, skipped, expired
+    queued_at = Column(DateTime, default=datetime.utcnow)
+    applied_at = Column(DateTime)  # naive UTC, время отклика (журнал ограничителя аккаунта)
+
+    def __repr__(self):
+        return f"<AccountLetter(account_id='{self.account_id}', vacancy_id='{self.vacancy_id}', status='{self.status}')>"
+
+
+class CircuitBreakerState(Base):
+    """Последнее состояние предохранителя HH в воркере (для main.py status)"""
+    __tablename__ = 'circuit_breaker_states'
+
+    id = Column(String(100), primary_key=True)  # имя предохранителя:роль воркера
+    name = Column(String(50))
+    role = Column(String(50))
+    state = Column(String(20))  # closed, open, half_open
+    reason = Column(String(200))
+    trips = Column(Integer, default=0)  # Размыканий с запуска воркера
+    open_until = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CircuitBreakerState(id='{self.id}', state='{self.state}')>"
+
+
+class RateLimitBucket(Base):
+    """Общий бюджет откликов: строка блокируется на время выдачи слота (см. SharedRateLimiter)"""
+    __tablename__ = 'rate_limit_buckets'
+
+    name = Column(String(50), primary_key=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RateLimitBucket(name='{self.name}')>"
+
+
+class SendLease(Base):
+    """Слот отправки, выданный реплике отправителя; удаляется, если отклик не ушел"""
+    __tablename__ = 'send_leases'
+
+    id = Column(Integer, primary_key=True)
+    bucket = Column(String(50), nullable=False, index=True)
+    leased_at = Column(DateTime, nullable=False, index=True)  # naive UTC, как applied_at
+    holder = Column(String(100))  # host:pid реплики
+    vacancy_id = Column(String(50))  # hh_id вакансии, если известен
+
+    def __repr__(self):
+        return f"<SendLease(bucket='{self.bucket}', leased_at={self.leased_at}, holder='{self.holder}')>"
+
+
+class ProcessedMessage(Base):
+    """Захват стадии обработки сообщения (защита от повторной доставки)"""
+    __tablename__ = 'processed_messages'
+    __table_args__ = (
+        UniqueConstraint('stage', 'message_key', name='uq_processed_messages_stage_key'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    stage = Column(String(50), nullable=False)
+    message_key = Column(String(100), nullable=False)
+    status = Column(String(20), default='in_progress')  # in_progress или done
+    duplicates = Column(Integer, default=0)  # Сколько повторных доставок подавлено
+    claimed_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ProcessedMessage(stage='{self.stage}', key='{self.message_key}', status='{self.status}')>"
@@ -0,0 +1,56 @@
+"""Нормализация текста вакансий: HTML -> текст, регистр, токены
+
+Описания HH приходят в HTML. При приеме вакансии (стадия признаков в поиске)
+описание один раз переводится в обычный текст, а токены названия, навыков и
+описания сохраняются строкой search_text. Дальше все проверки по ключевым
+словам читают search_text и не разбирают разметку заново.
+"""
+
+import hashlib
+import html
+import re
+from typing import List
+
+# Теги, после которых начинается новая строка текста
+BLOCK_TAG_RE = re.compile(r'<\s*/?\s*(?:p|div|br|li|ul|ol|h[1-6]|tr|table|blockquote)\b[^>]*>', re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]+>')
+SPACE_RE = re.compile(r'[ \t\r\f\v\u00a0\u200b]+')
+TOKEN_RE = re.compile(r'[a-zа-яё0-9][a-zа-яё0-9+#]*')
+
+
+def html_to_text(markup: str) -> str:
+    """Обычный текст из HTML: без тегов и сущностей, строки по блочным тегам, схлопнутые пробелы"""
+    if not markup:
+        return ''
+    text = BLOCK_TAG_RE.sub('\n', markup)
+    text = html.unescape(TAG_RE.sub('', text))  # строчные теги (strong, em, span) не разрывают слова
+    lines = (SPACE_RE.sub(' ', line).strip() for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def fold_case(text: str) -> str:
+    """Нижний регистр для сравнения: ё и е не различаются"""
+    return (text or '').lower().replace('ё', 'е')
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова текста в нижнем регистре без HTML-тегов"""
+    return TOKEN_RE.findall(fold_case(TAG_RE.sub(' ', text or '')))
+
+
+def build_search_text(name: str, skills: str, description: str) -> str:
+    """Токены названия, навыков и описания через пробел"""
+    return ' '.join(tokenize(name) + tokenize(skills) + tokenize(description))
+
+
+def search_text_of(vacancy_data: dict) -> str:
+    """Сохраненные токены вакансии; для старых сообщений и записей - расчет на месте"""
+    return vacancy_data.get('search_text') or build_search_text(
+        vacancy_data.get('name') or '', vacancy_data.get('skills') or '',
+        vacancy_data.get('description') or '',
+    )
+
+
+def text_hash(search_text: str) -> str:
+    """Хеш нормализованного текста: меняется только при изменении слов вакансии"""
+    return hashlib.blake2b(search_text.encode('utf-8'), digest_size=8).hexdigest()
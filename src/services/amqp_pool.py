@@ -0,0 +1,101 @@
+import asyncio
+import random
+from typing import Optional
+import aio_pika
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AMQPConnectionPool:
+    """Одно долгоживущее robust-соединение с RabbitMQ на процесс
+
+    Публикация идет через общий канал, каждый подписчик получает собственный
+    канал со своим prefetch. Первое подключение - с экспоненциальной паузой
+    и джиттером, чтобы после рестарта брокера воркеры не ломились разом;
+    дальше переподключение делает сам RobustConnection.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or settings.RABBITMQ_URL
+        self.connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self._publisher_channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection is not None and not self.connection.is_closed
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(settings.RABBITMQ_RETRY_BACKOFF_BASE * 2 ** attempt, settings.RABBITMQ_RETRY_BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def get_connection(self, max_retries: Optional[int] = None) -> aio_pika.abc.AbstractRobustConnection:
+        """Возвращает соединение процесса, подключаясь при первом обращении"""
+        if self.is_open:
+            return self.connection
+
+        # Одновременные вызовы ждут одну попытку подключения, а не открывают свои
+        async with self._lock:
+            if self.is_open:
+                return self.connection
+
+            max_retries = max_retries or settings.RABBITMQ_CONNECT_RETRIES
+            for attempt in range(max_retries):
+                try:
+                    logger.info(f"Попытка подключения к RabbitMQ ({attempt + 1}/{max_retries})...")
+                    self.connection = await aio_pika.connect_robust(
+                        self.url,
+                        reconnect_interval=settings.RABBITMQ_RETRY_BACKOFF_MAX,
+                    )
+                    self._publisher_channel = None
+                    logger.info("Подключение к RabbitMQ установлено")
+                    return self.connection
+
+                except Exception as e:
+                    logger.error(f"Попытка {attempt + 1}/{max_retries} не удалась: {e}")
+                    if attempt < max_retries - 1:
+                        delay = self._backoff(attempt)
+                        logger.info(f"Повторная попытка через {delay:.1f} секунд...")
+                        await asyncio.sleep(delay)
+
+            raise ConnectionError("Не удалось подключиться к RabbitMQ после всех попыток")
+
+    async def publisher_channel(self) -> aio_pika.abc.AbstractChannel:
+        """Общий канал для публикации"""
+        connection = await self.get_connection()
+        if self._publisher_channel is None or self._publisher_channel.is_closed:
+            self._publisher_channel = await connection.channel()
+        return self._publisher_channel
+
+    async def consumer_channel(self, prefetch_count: int = 1) -> aio_pika.abc.AbstractChannel:
+        """Отдельный канал подписчика: его qos не влияет на публикацию"""
+        connection = await self.get_connection()
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=prefetch_count)
+        return channel
+
+    async def health_check(self) -> bool:
+        """Проверка живости: соединение открыто и брокер отвечает на passive declare"""
+        if not self.is_open:
+            return False
+        try:
+            channel = await self.publisher_channel()
+            await channel.declare_queue(settings.QUEUE_VACANCIES, passive=True)
+            return True
+        except Exception as e:
+            logger.warning(f"RabbitMQ не прошел проверку: {e}")
+            return False
+
+    async def close(self) -> None:
+        """Закрывает соединение процесса (при остановке воркера)"""
+        if self.connection and not self.connection.is_closed:
+            await self.connection.close()
+            logger.info("Соединение с RabbitMQ закрыто")
+        self.connection = None
+        self._publisher_channel = None
+
+
+# Глобальный экземпляр: одно соединение на процесс
+amqp_pool = AMQPConnectionPool()
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import Dict
+from src.core.config import settings
+from src.core.accounts import Account, accounts
+from src.core.logger import get_logger
+from src.services.send_planner import send_planner
+
+logger = get_logger(__name__)
+
+STATE_NORMAL = "normal"
+STATE_THROTTLED = "throttled"
+STATE_PAUSED = "paused"
+
+
+@dataclass
+class BackpressureDecision:
+    """Как проводить следующий цикл поиска"""
+    state: str
+    per_page: int
+    interval: float
+    reason: str = ""
+
+    @property
+    def search_allowed(self) -> bool:
+        return self.state != STATE_PAUSED
+
+
+def send_throughput(account: Account) -> float:
+    """Писем в час, которые аккаунт реально отправляет (в среднем за неделю)
+
+    Часовой лимит действует только в рабочие часы (SENDER_STRATEGY=plan),
+    суточный ограничивает каждый рабочий день.
+    """
+    per_hour, per_day = account.requests_per_hour, account.requests_per_day
+    per_hour = settings.REQUESTS_PER_HOUR if per_hour is None else per_hour
+    per_day = settings.REQUESTS_PER_DAY if per_day is None else per_day
+    hours, days = 24.0, 7
+    if settings.SENDER_STRATEGY == "plan":
+        working_hours = send_planner.working_hours
+        hours, days = working_hours.hours_per_day, working_hours.days_per_week
+    return min(per_hour * hours, per_day) * days / (24 * 7)
+
+
+class BackpressureController:
+    """Подстраивает поиск под заполненность очередей с гистерезисом high/low
+
+    Сигналы: глубина очереди вакансий и запас очереди писем в часах отправки
+    (писем / send_throughput). Поиск общий на все аккаунты, поэтому запас
+    берется по наименее загруженной очереди писем аккаунта. Выше high
+    watermark - пауза, между low и high - торможение (меньше страница,
+    длиннее интервал), после паузы поиск возобновляется только когда оба
+    сигнала опустятся ниже low.
+    """
+
+    def __init__(self):
+        self.state = STATE_NORMAL
+
+    def evaluate(self, queue_details: Dict[str, Dict[str, int]]) -> BackpressureDecision:
+        """Решение на следующий цикл по статистике очередей"""
+        base_interval = settings.SEARCH_INTERVAL
+
+        if not queue_details:
+            # Статистика недоступна - не блокируем поиск, но и не разгоняемся
+            logger.warning("Статистика очередей недоступна, backpressure не применяется")
+            return BackpressureDecision(self.state, settings.SEARCH_PER_PAGE, base_interval, "no stats")
+
+        vacancies = queue_details.get(settings.QUEUE_VACANCIES, {}).get('messages', 0)
+        letters, letter_hours = 0, 0.0
+        for index, account in enumerate(accounts.all()):
+            depth = queue_details.get(account.letter_queue, {}).get('messages', 0)
+            throughput = send_throughput(account)
+            # Аккаунт на паузе (лимит 0) не разберет очередь никогда
+            hours = depth / throughput if throughput > 0 else (float('inf') if depth else 0.0)
+            if index == 0 or hours < letter_hours:
+                letters, letter_hours = depth, hours
+
+        above_high = (vacancies >= settings.BACKPRESSURE_VACANCY_HIGH
+                      or letter_hours >= settings.BACKPRESSURE_LETTER_HOURS_HIGH)
+        above_low = (vacancies > settings.BACKPRESSURE_VACANCY_LOW
+                     or letter_hours > settings.BACKPRESSURE_LETTER_HOURS_LOW)
+
+        if above_high:
+            state = STATE_PAUSED
+        elif above_low:
+            state = STATE_PAUSED if self.state == STATE_PAUSED else STATE_THROTTLED
+        else:
+            state = STATE_NORMAL
+
+        reason = f"вакансий в очереди: {vacancies}, писем: {letters} (~{letter_hours:.1f} ч отправки)"
+        if state != self.state:
+            logger.info(f"Backpressure: {self.state} -> {state} ({reason})")
+        self.state = state
+
+        if state == STATE_NORMAL:
+            return BackpressureDecision(state, settings.SEARCH_PER_PAGE, base_interval, reason)
+
+        per_page = max(settings.BACKPRESSURE_MIN_PER_PAGE, settings.SEARCH_PER_PAGE // 2)
+        interval = base_interval * settings.BACKPRESSURE_INTERVAL_MULTIPLIER
+        return BackpressureDecision(state, per_page, interval, reason)
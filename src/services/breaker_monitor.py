@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Set
+from src.core.circuit_breaker import CircuitBreaker, hh_breaker
+from src.core.database import db, Database
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BreakerMonitor:
+    """Публикует состояние предохранителя HH и останавливает подписки, пока он разомкнут
+
+    Предохранитель живет в памяти процесса; его состояние записывается в
+    таблицу circuit_breaker_states при каждой смене, чтобы main.py status
+    показывал его для каждого воркера (role).
+    """
+
+    def __init__(self, role: str, breaker: Optional[CircuitBreaker] = None, database: Optional[Database] = None):
+        self.role = role
+        self.breaker = breaker or hh_breaker
+        self.database = database or db
+        self._tasks: Set[asyncio.Task] = set()
+
+    def attach(self) -> None:
+        """Подписывается на смену состояний и записывает текущее"""
+        self.breaker.add_listener(self._on_change)
+        self._on_change(self.breaker)
+
+    def _on_change(self, breaker: CircuitBreaker) -> None:
+        # Слушатель синхронный: запись в БД - отдельной задачей, ссылка держится до конца
+        task = asyncio.create_task(self.save())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def save(self) -> None:
+        stats = self.breaker.get_stats()
+        open_until = None
+        if stats['open_remaining']:
+            open_until = datetime.utcnow() + timedelta(seconds=stats['open_remaining'])
+        await self.database.save_breaker_state(
+            f"{stats['name']}:{self.role}",
+            name=stats['name'], role=self.role, state=stats['state'], reason=stats['last_reason'],
+            trips=stats['trips'], open_until=open_until,
+        )
+
+    async def pause_consumers_while_open(self, queue_manager, queue_name: str,
+                                         on_pause: Optional[Callable[[], None]] = None) -> None:
+        """Фоновая задача: отписка от очереди на время размыкания, затем подписка для пробы"""
+        while True:
+            await self.breaker.wait_open()
+            logger.warning(f"HH ограничивает запросы: подписка на '{queue_name}' приостановлена "
+                           f"на {self.breaker.remaining():.0f} с")
+            await queue_manager.pause_consumers(queue_name)
+            if on_pause:
+                on_pause()
+
+            while (remaining := self.breaker.remaining()) > 0:
+                await asyncio.sleep(remaining)
+
+            logger.info(f"Пробный режим предохранителя HH: подписка на '{queue_name}' возобновлена")
+            await queue_manager.resume_consumers(queue_name)
@@ -0,0 +1,71 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def default_workers() -> int:
+    """Размер пула: CPU_POOL_WORKERS или число ядер минус одно под event loop"""
+    if settings.CPU_POOL_WORKERS > 0:
+        return settings.CPU_POOL_WORKERS
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class CpuPool:
+    """Стадия CPU-обработки: пачки элементов уходят в пул процессов, event loop не блокируется
+
+    func получает список элементов и возвращает список результатов той же длины;
+    она должна быть функцией уровня модуля без тяжелых импортов (см. text_features).
+    Маленькие объемы (меньше CPU_POOL_MIN_ITEMS) обрабатываются на месте:
+    передача между процессами дороже самой работы.
+    """
+
+    def __init__(self, workers: Optional[int] = None, executor: Optional[Executor] = None):
+        self.workers = workers or default_workers()
+        self._executor = executor
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CPU_POOL_ENABLED
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"Пул CPU-обработки запущен: {self.workers} процессов")
+        return self._executor
+
+    async def map(self, func: Callable[[List[T]], List[R]], items: Sequence[T],
+                  batch_size: Optional[int] = None) -> List[R]:
+        """Результаты func для всех items в исходном порядке"""
+        items = list(items)
+        if not items:
+            return []
+        if not self.enabled or len(items) < settings.CPU_POOL_MIN_ITEMS:
+            return func(items)
+
+        # Пачки не крупнее batch_size и не меньше, чем нужно, чтобы занять все процессы
+        batch_size = batch_size or settings.CPU_POOL_BATCH_SIZE
+        batch_size = max(1, min(batch_size, -(-len(items) // self.workers)))
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        results = await asyncio.gather(*(loop.run_in_executor(executor, func, batch) for batch in batches))
+        return [result for batch_result in results for result in batch_result]
+
+    def shutdown(self) -> None:
+        """Останавливает процессы пула (при остановке воркера)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+# Глобальный экземпляр
+cpu_pool = CpuPool()
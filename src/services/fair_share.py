@@ -0,0 +1,68 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class FairShare:
+    """Взвешенно-справедливая очередность отправок между аккаунтами процесса
+
+    У каждого аккаунта свои лимиты HH, но канал к HH у процесса общий: между
+    откликами любых аккаунтов проходит не меньше min_interval секунд. Когда
+    отправить готовы несколько аккаунтов, ход получает тот, у кого меньше
+    виртуальное время окончания (WFQ): запрос аккаунта с весом w начинается
+    не раньше текущего виртуального времени и конца его прошлого хода и
+    длится 1/w. Под нагрузкой аккаунты получают отклики пропорционально
+    весам, а простаивавший аккаунт не копит «долг» и не захватывает канал.
+    """
+
+    def __init__(self, weights: Dict[str, float], min_interval: Optional[float] = None):
+        self.weights = dict(weights)
+        self.min_interval = settings.SEND_SHARED_MIN_INTERVAL if min_interval is None else min_interval
+        self.virtual_time = 0.0
+        self._finish: Dict[str, float] = {}  # Конец последнего хода аккаунта (виртуальное время)
+        self._waiting: List[Tuple[float, int, float, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._last_grant: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.granted: Dict[str, int] = {}
+
+    async def turn(self, account_id: str) -> None:
+        """Ждет хода аккаунта в общем канале"""
+        start = max(self.virtual_time, self._finish.get(account_id, 0.0))
+        finish = start + 1.0 / self.weights.get(account_id, 1.0)
+        self._finish[account_id] = finish
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (finish, next(self._seq), start, account_id, future))
+        self._schedule()
+        await future
+
+    def _schedule(self) -> None:
+        # Решение откладывается до следующей итерации цикла: одновременные запросы сравниваются между собой
+        if self._timer is not None or not self._waiting:
+            return
+        delay = 0.0
+        if self._last_grant is not None:
+            delay = max(0.0, self._last_grant + self.min_interval - time.monotonic())
+        self._timer = asyncio.get_running_loop().call_later(delay, self._grant)
+
+    def _grant(self) -> None:
+        self._timer = None
+        while self._waiting:
+            _, _, start, account_id, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue  # Ожидание отменено (остановка аккаунта)
+            self.virtual_time = max(self.virtual_time, start)
+            self._last_grant = time.monotonic()
+            self.granted[account_id] = self.granted.get(account_id, 0) + 1
+            future.set_result(None)
+            break
+        self._schedule()
+
+    def get_stats(self) -> Dict:
+        return {'granted': dict(self.granted), 'waiting': sum(1 for entry in self._waiting if not entry[4].done())}
@@ -0,0 +1,84 @@
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Tuple
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Стадии пайплайна, для которых повторная обработка недопустима
+STAGE_COVER_LETTER = "cover_letter"
+STAGE_SEND = "send"
+
+# Стадии, зависший захват которых можно перехватить. Отправку не перехватываем:
+# упавший обработчик мог успеть создать отклик на HH.ru
+TAKEOVER_STAGES = {STAGE_COVER_LETTER}
+
+
+class IdempotencyUnavailableError(Exception):
+    """БД недоступна - нельзя решить, обрабатывать ли сообщение"""
+
+
+class IdempotencyGuard:
+    """Пропускает повторно доставленные сообщения по ключу (стадия, hh_id)
+
+    Стадия захватывается вставкой в processed_messages ДО дорогой работы:
+    уникальный индекс гарантирует, что из двух реплик или из оригинала и
+    повторной доставки работу выполнит только один. Локальный LRU хранит
+    завершенные ключи и отсекает повторы без запроса к БД.
+    """
+
+    def __init__(self, cache_size: Optional[int] = None, database: Optional[Database] = None):
+        self.cache_size = cache_size or settings.IDEMPOTENCY_CACHE_SIZE
+        self.database = database or db
+        self._completed: OrderedDict[Tuple[str, str], None] = OrderedDict()
+        self.duplicates_suppressed: Dict[str, int] = defaultdict(int)
+
+    def _remember(self, key: Tuple[str, str]) -> None:
+        self._completed[key] = None
+        self._completed.move_to_end(key)
+        if len(self._completed) > self.cache_size:
+            self._completed.popitem(last=False)
+
+    def _suppress(self, stage: str, message_key: str) -> bool:
+        self.duplicates_suppressed[stage] += 1
+        logger.info(
+            f"Повторное сообщение пропущено: {stage}/{message_key} "
+            f"(подавлено дубликатов: {self.duplicates_suppressed[stage]})"
+        )
+        return False
+
+    async def claim(self, stage: str, message_key: str) -> bool:
+        """Захватывает стадию. False - сообщение дубликат, работу делать не нужно"""
+        key = (stage, str(message_key))
+
+        if key in self._completed:
+            self._completed.move_to_end(key)
+            return self._suppress(*key)
+
+        stale_after = settings.IDEMPOTENCY_CLAIM_TIMEOUT if stage in TAKEOVER_STAGES else None
+        claimed = await self.database.claim_message(*key, stale_after=stale_after)
+
+        if claimed is None:
+            raise IdempotencyUnavailableError(f"Не удалось проверить {stage}/{message_key}")
+        if not claimed:
+            return self._suppress(*key)
+        return True
+
+    async def complete(self, stage: str, message_key: str) -> None:
+        """Отмечает захваченную стадию выполненной"""
+        key = (stage, str(message_key))
+        self._remember(key)
+        await self.database.complete_message(*key)
+
+    async def release(self, stage: str, message_key: str) -> None:
+        """Снимает захват после неудачи, чтобы повторная доставка обработала сообщение"""
+        await self.database.release_message(stage, str(message_key))
+
+    def get_stats(self) -> Dict[str, int]:
+        """Счетчики подавленных этим процессом дубликатов по стадиям"""
+        return dict(self.duplicates_suppressed)
+
+
+# Глобальный экземпляр
+idempotency_guard = IdempotencyGuard()
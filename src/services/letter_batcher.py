@@ -0,0 +1,64 @@
+import asyncio
+from typing import List, Optional, Set, Tuple
+from src.api.deepseek_client import DeepSeekClient, LetterGeneration
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LetterBatcher:
+    """Микро-батчер генерации: копит вакансии и отправляет их в LLM одним запросом
+
+    Пакет уходит, когда набрано max_size вакансий или через max_wait секунд
+    после первой. Пока очередь пуста, вакансия ждет не дольше max_wait;
+    когда копится бэклог, пакеты заполняются сразу.
+    """
+
+    def __init__(self, client: DeepSeekClient, max_size: Optional[int] = None,
+                 max_wait: Optional[float] = None):
+        self.client = client
+        self.max_size = max(1, max_size or settings.LLM_BATCH_SIZE)
+        self.max_wait = settings.LLM_BATCH_MAX_WAIT if max_wait is None else max_wait
+        self._items: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def submit(self, vacancy_data: dict) -> Optional[LetterGeneration]:
+        """Ставит вакансию в пакет и ждет ее письмо"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append((vacancy_data, future))
+
+        if len(self._items) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        items, self._items = self._items, []
+        if items:
+            # Держим ссылку на задачу, иначе ее может собрать GC посреди генерации
+            task = asyncio.create_task(self._run(items))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, items: List[Tuple[dict, asyncio.Future]]) -> None:
+        try:
+            results = await self.client.generate_batch([vacancy_data for vacancy_data, _ in items])
+        except Exception as e:
+            logger.error(f"Ошибка пакетной генерации писем: {e}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), generation in zip(items, results):
+            if not future.done():
+                future.set_result(generation)
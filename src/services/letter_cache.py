@@ -0,0 +1,92 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+SOURCE_CACHE = "cache"  # LetterGeneration.source для письма из кэша
+
+PLACEHOLDER_COMPANY = "{{company}}"
+PLACEHOLDER_VACANCY = "{{vacancy_name}}"
+
+
+def _normalize(text: Optional[str]) -> str:
+    text = (text or '').lower().replace('ё', 'е')
+    return ' '.join(re.sub(r'[^\w+#]+', ' ', text).split())
+
+
+def vacancy_fingerprint(vacancy_data: dict) -> str:
+    """Отпечаток вакансии: нормализованные название, компания, ключевые навыки и версия шаблона
+
+    Перепубликации одной вакансии и вакансии с одинаковым профилем дают один отпечаток.
+    """
+    skills = sorted({_normalize(skill) for skill in (vacancy_data.get('skills') or '').split(',')} - {''})
+    parts = [
+        _normalize(vacancy_data.get('name')),
+        _normalize(vacancy_data.get('company')),
+        ','.join(skills),
+        str(settings.LETTER_TEMPLATE_VERSION),
+    ]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+class LetterCache:
+    """LRU-кэш писем по отпечатку вакансии с TTL
+
+    Хранится обезличенная заготовка: название компании и вакансии заменены
+    плейсхолдерами, при попадании подставляются значения новой вакансии.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_size = settings.LETTER_CACHE_SIZE if max_size is None else max_size
+        self.ttl = settings.LETTER_CACHE_TTL if ttl is None else ttl
+        self._items: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, vacancy_data: dict) -> Optional[str]:
+        """Письмо из кэша с подстановкой данных вакансии или None"""
+        key = vacancy_fingerprint(vacancy_data)
+        item = self._items.get(key)
+
+        if item is None or time.monotonic() - item[1] > self.ttl:
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return self._personalize(item[0], vacancy_data)
+
+    def put(self, vacancy_data: dict, letter: str) -> None:
+        """Сохраняет письмо как заготовку для вакансий с тем же отпечатком"""
+        if self.max_size <= 0:
+            return
+
+        key = vacancy_fingerprint(vacancy_data)
+        self._items[key] = (self._depersonalize(letter, vacancy_data), time.monotonic())
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    @staticmethod
+    def _depersonalize(letter: str, vacancy_data: dict) -> str:
+        for value, placeholder in ((vacancy_data.get('name'), PLACEHOLDER_VACANCY),
+                                   (vacancy_data.get('company'), PLACEHOLDER_COMPANY)):
+            if value:
+                letter = letter.replace(value, placeholder)
+        return letter
+
+    @staticmethod
+    def _personalize(template: str, vacancy_data: dict) -> str:
+        return (template
+                .replace(PLACEHOLDER_VACANCY, vacancy_data.get('name') or '')
+                .replace(PLACEHOLDER_COMPANY, vacancy_data.get('company') or ''))
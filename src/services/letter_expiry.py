@@ -0,0 +1,89 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.services.messages import CoverLetterMessage, MessageSchemaError, MessageUnsupportedError, decode_message
+
+logger = get_logger(__name__)
+
+
+def letter_expires_at(vacancy) -> Optional[float]:
+    """Срок письма (epoch): публикация вакансии + LETTER_MAX_AGE_HOURS; None - без срока"""
+    published = vacancy.published_at or vacancy.created_at
+    if not settings.LETTER_MAX_AGE_HOURS or published is None:
+        return None
+    return (published.replace(tzinfo=timezone.utc) + timedelta(hours=settings.LETTER_MAX_AGE_HOURS)).timestamp()
+
+
+def is_expired(cover_data: dict, now: Optional[float] = None) -> bool:
+    expires_at = cover_data.get('expires_at')
+    return expires_at is not None and expires_at <= (time.time() if now is None else now)
+
+
+class LetterExpirySweeper:
+    """Помечает в БД письма, срок которых истек (vacancies.letter_expired_at)
+
+    Письмо в очереди QUEUE_COVER_LETTERS живет до expires_at: RabbitMQ
+    отбрасывает просроченное сообщение (per-message TTL) и, при
+    RABBITMQ_LETTER_DEAD_LETTERING, перекладывает его в QUEUE_EXPIRED_LETTERS -
+    отсюда оно и читается. TTL срабатывает только в голове очереди, поэтому
+    отправитель дополнительно проверяет срок при получении, а sweep раз в
+    LETTER_EXPIRY_SWEEP_INTERVAL помечает по БД всё, что просрочено, но еще
+    не отмечено (включая письма на проверке и потерянные без DLX сообщения).
+    """
+
+    def __init__(self, database: Optional[Database] = None):
+        self.database = database or db
+        self.expired = 0
+
+    async def mark(self, vacancy_ids: Iterable[str], account_id: Optional[str] = None) -> int:
+        """Помечает письма аккаунта (None - основного) просроченными"""
+        vacancy_ids = [str(vacancy_id).strip() for vacancy_id in vacancy_ids]
+        if not vacancy_ids:
+            return 0
+        marked = await self.database.mark_letters_expired(vacancy_ids, account_id)
+        self.expired += marked
+        if marked:
+            logger.info(f"Письма просрочены и не будут отправлены: {', '.join(vacancy_ids)}")
+        return marked
+
+    async def handle_message(self, message) -> None:
+        """Обработчик очереди просроченных писем"""
+        async with message.process(requeue=True):
+            try:
+                letter = decode_message(message, CoverLetterMessage)
+            except MessageUnsupportedError as e:
+                logger.error(f"{e}. Сообщение возвращается в очередь")
+                await asyncio.sleep(5)
+                raise
+            except MessageSchemaError as e:
+                logger.error(f"Некорректное просроченное письмо: {e}")
+                return
+            await self.mark([letter.vacancy_id], letter.account_id)
+
+    async def sweep(self) -> int:
+        """Помечает письма вакансий, опубликованных раньше LETTER_MAX_AGE_HOURS"""
+        if not settings.LETTER_MAX_AGE_HOURS:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(hours=settings.LETTER_MAX_AGE_HOURS)
+        marked = await self.database.expire_stale_letters(cutoff)
+        self.expired += marked
+        if marked:
+            logger.info(f"Просроченных писем помечено в БД: {marked}")
+        return marked
+
+    async def run_periodic(self, interval: Optional[float] = None) -> None:
+        interval = interval or settings.LETTER_EXPIRY_SWEEP_INTERVAL
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка пометки просроченных писем: {e}")
+            await asyncio.sleep(interval)
+
+
+# Глобальный экземпляр
+letter_expiry_sweeper = LetterExpirySweeper()
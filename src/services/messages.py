@@ -0,0 +1,198 @@
+import json
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Callable, Dict, Optional, Tuple
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Необязательные ускорители: без них используется стандартный json без сжатия
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SCHEMA_VERSION = 2
+
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+CONTENT_ENCODING_ZSTD = "zstd"
+
+
+class MessageSchemaError(ValueError):
+    """Сообщение не удалось декодировать или оно не соответствует схеме"""
+
+
+class MessageUnsupportedError(MessageSchemaError):
+    """Сообщение корректно, но этот воркер не может его прочитать: схема новее
+    или нет пакета кодека. Сообщение возвращается в очередь - его прочитает
+    обновленный воркер или этот же после установки пакета.
+    """
+
+
+# ---------------------------------------------------------------------------
+# Схема сообщений
+# ---------------------------------------------------------------------------
+
+@dataclass
+class VacancyMessage:
+    """Вакансия для генерации письма (очередь QUEUE_VACANCIES)"""
+    hh_id: str
+    name: str
+    company: str = ''
+    salary_from: Optional[float] = None
+    salary_to: Optional[float] = None
+    salary_currency: Optional[str] = None
+    experience: str = ''
+    employment: str = ''
+    description: str = ''
+    skills: str = ''
+    url: str = ''
+    relevance: Optional[float] = None  # Оценка релевантности резюме (см. relevance.py)
+    search_text: str = ''  # Токены вакансии (src/core/text.py); пусто - в старых сообщениях
+
+
+@dataclass
+class CoverLetterMessage:
+    """Письмо для отправки отклика (очередь писем аккаунта, Account.letter_queue)"""
+    vacancy_id: str
+    cover_letter: str = ''  # Текст письма LLM; пусто, если передана ссылка на шаблон
+    vacancy_name: str = ''
+    company: str = ''
+    url: str = ''
+    relevance: Optional[float] = None
+    letter_template: Optional[str] = None  # Ссылка на шаблон (letter_templates.encode_choice)
+    expires_at: Optional[float] = None  # epoch, после которого письмо не отправляется (см. letter_expiry)
+    account_id: Optional[str] = None  # Аккаунт HH (см. accounts); None - основной
+
+    def __post_init__(self):
+        if not self.cover_letter and not self.letter_template:
+            raise MessageSchemaError("CoverLetterMessage: нет ни текста письма, ни ссылки на шаблон")
+
+
+def _upgrade_v0(data: Dict[str, Any]) -> Dict[str, Any]:
+    """v0 - сообщения без поля версии (до появления схемы): поля совпадают с v1"""
+    return data
+
+
+def _upgrade_v1(data: Dict[str, Any]) -> Dict[str, Any]:
+    """v1 - письмо всегда текстом; в v2 шаблонное письмо приходит ссылкой letter_template
+
+    Версия поднята, чтобы отправитель v1 не принял письмо без текста: он отклонит сообщение.
+    """
+    return data
+
+
+# Шимы: версия -> функция, поднимающая словарь на версию выше
+UPGRADES: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    0: _upgrade_v0,
+    1: _upgrade_v1,
+}
+
+
+def _upgrade(data: Dict[str, Any]) -> Dict[str, Any]:
+    version = data.pop('v', 0)
+    if version > SCHEMA_VERSION:
+        raise MessageUnsupportedError(f"Версия схемы {version} новее поддерживаемой {SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        data = UPGRADES[version](data)
+        version += 1
+    return data
+
+
+def to_payload(message) -> Dict[str, Any]:
+    """Словарь сообщения с версией схемы"""
+    payload = asdict(message)
+    payload['v'] = SCHEMA_VERSION
+    return payload
+
+
+def from_payload(message_cls, data: Dict[str, Any]):
+    """Строит типизированное сообщение: поднимает версию, лишние поля игнорирует"""
+    if not isinstance(data, dict):
+        raise MessageSchemaError(f"Ожидался объект, получен {type(data).__name__}")
+
+    data = _upgrade(dict(data))
+    known = {f.name for f in fields(message_cls)}
+    try:
+        return message_cls(**{key: value for key, value in data.items() if key in known})
+    except TypeError as e:
+        raise MessageSchemaError(f"{message_cls.__name__}: {e}") from e
+
+
+# ---------------------------------------------------------------------------
+# Кодек
+# ---------------------------------------------------------------------------
+
+def _dumps_json(payload: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+def _loads_json(body: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body.decode('utf-8'))
+
+
+def _codec() -> str:
+    if settings.MESSAGE_CODEC == "msgpack" and msgpack is None:
+        logger.warning("MESSAGE_CODEC=msgpack, но пакет msgpack не установлен - используется JSON")
+        return "json"
+    return settings.MESSAGE_CODEC
+
+
+def encode_payload(payload: Dict[str, Any]) -> Tuple[bytes, str, Optional[str]]:
+    """Кодирует словарь: (тело, content_type, content_encoding)"""
+    if _codec() == "msgpack":
+        body, content_type = msgpack.packb(payload, use_bin_type=True), CONTENT_TYPE_MSGPACK
+    else:
+        body, content_type = _dumps_json(payload), CONTENT_TYPE_JSON
+
+    threshold = settings.MESSAGE_COMPRESSION_THRESHOLD
+    if zstandard is not None and threshold and len(body) >= threshold:
+        return zstandard.ZstdCompressor(level=3).compress(body), content_type, CONTENT_ENCODING_ZSTD
+
+    return body, content_type, None
+
+
+def decode_payload(body: bytes, content_type: Optional[str] = None,
+                   content_encoding: Optional[str] = None) -> Dict[str, Any]:
+    """Декодирует тело по заголовкам. Без content_type - JSON (старые сообщения)"""
+    try:
+        if content_encoding == CONTENT_ENCODING_ZSTD:
+            if zstandard is None:
+                raise MessageUnsupportedError("Сообщение сжато zstd, но пакет zstandard не установлен")
+            body = zstandard.ZstdDecompressor().decompress(body)
+
+        if content_type == CONTENT_TYPE_MSGPACK:
+            if msgpack is None:
+                raise MessageUnsupportedError("Сообщение в msgpack, но пакет msgpack не установлен")
+            return msgpack.unpackb(body, raw=False)
+
+        return _loads_json(body)
+    except MessageSchemaError:
+        raise
+    except Exception as e:
+        raise MessageSchemaError(f"Не удалось декодировать сообщение: {e}") from e
+
+
+def decode_message(message, message_cls):
+    """Декодирует входящее сообщение очереди в типизированную схему"""
+    data = decode_payload(
+        message.body,
+        getattr(message, 'content_type', None),
+        getattr(message, 'content_encoding', None),
+    )
+    return from_payload(message_cls, data)
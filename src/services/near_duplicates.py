@@ -0,0 +1,121 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.services.text_features import MinHasher, near_duplicate_text
+
+logger = get_logger(__name__)
+
+class NearDuplicateIndex:
+    """LSH-индекс MinHash-сигнатур вакансий в памяти процесса
+
+    Сигнатура делится на NEAR_DUP_BANDS полос; вакансии с совпадающей полосой -
+    кандидаты, дубликатом считается кандидат с оценкой Жаккара не ниже
+    NEAR_DUP_THRESHOLD. Сигнатуры хранятся в vacancies.minhash, индекс строится
+    из них при старте, полосы вычисляются заново.
+    """
+
+    def __init__(self, database: Optional[Database] = None):
+        self.database = database or db
+        self.hasher = MinHasher()
+        self.bands = settings.NEAR_DUP_BANDS
+        self.rows = self.hasher.num_perm // self.bands
+        self.buckets: Dict[Tuple[int, bytes], List[str]] = defaultdict(list)
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.loaded = False
+
+    async def load(self) -> None:
+        """Строит индекс из сигнатур в БД"""
+        skipped = 0
+        for hh_id, blob in await self.database.get_minhash_signatures():
+            signature = np.frombuffer(blob, dtype=np.uint32)
+            if len(signature) != self.hasher.num_perm:
+                skipped += 1  # сигнатура с другим NEAR_DUP_NUM_PERM - нужен backfill
+                continue
+            self.add(hh_id, signature)
+        self.loaded = True
+        logger.info(f"Индекс дубликатов загружен: {len(self.signatures)} сигнатур"
+                    + (f", пропущено несовместимых: {skipped}" if skipped else ""))
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def add(self, hh_id: str, signature: np.ndarray) -> None:
+        self.signatures[hh_id] = signature
+        for key in self._band_keys(signature):
+            self.buckets[key].append(hh_id)
+
+    def find(self, signature: np.ndarray, exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """Самый похожий из кандидатов LSH: (hh_id, оценка Жаккара) или None"""
+        candidates = {hh_id for key in self._band_keys(signature) for hh_id in self.buckets.get(key, ())}
+        candidates.discard(exclude)
+
+        best = None
+        for hh_id in candidates:
+            similarity = float(np.mean(self.signatures[hh_id] == signature))
+            if similarity >= settings.NEAR_DUP_THRESHOLD and (best is None or similarity > best[1]):
+                best = (hh_id, similarity)
+        return best
+
+    async def check(self, vacancy_data: dict, signature: Optional[np.ndarray] = None,
+                    precomputed: bool = False) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Сигнатура вакансии и hh_id оригинала, если это перепубликация
+
+        precomputed=True - signature уже посчитана в пуле процессов (None - в тексте нет слов).
+        """
+        if not self.loaded:
+            await self.load()
+
+        if not precomputed:
+            signature = self.hasher.signature(near_duplicate_text(vacancy_data))
+        if signature is None:
+            return None, None
+
+        match = self.find(signature, exclude=vacancy_data['hh_id'])
+        if match:
+            logger.info(f"Перепубликация: {vacancy_data['name']} ~ {match[0]} (сходство {match[1]:.2f})")
+            return signature, match[0]
+        return signature, None
+
+    async def backfill(self, batch_size: int = 500) -> Tuple[int, int]:
+        """Считает сигнатуры для вакансий, сохраненных без них: (обработано, найдено перепубликаций)
+
+        Идет по возрастанию id, поэтому оригиналом считается более ранняя вакансия.
+        Статусы обработки существующих вакансий не меняются - только пометка duplicate_of.
+        """
+        if not self.loaded:
+            await self.load()
+
+        processed = duplicates = 0
+        last_id = 0
+        while True:
+            vacancies = await self.database.get_vacancies_without_minhash(last_id, batch_size)
+            if not vacancies:
+                break
+
+            rows = []
+            for vacancy in vacancies:
+                signature = self.hasher.signature(near_duplicate_text({'name': vacancy.name,
+                                                                       'description': vacancy.description}))
+                if signature is None:
+                    continue
+                match = self.find(signature, exclude=vacancy.hh_id)
+                duplicate_of = match[0] if match else None
+                duplicates += bool(duplicate_of)
+                self.add(vacancy.hh_id, signature)
+                rows.append((vacancy.id, signature.tobytes(), duplicate_of))
+
+            if not await self.database.save_minhashes(rows):
+                raise RuntimeError("Не удалось сохранить сигнатуры, backfill остановлен")
+            processed += len(vacancies)
+            last_id = vacancies[-1].id
+            logger.info(f"Backfill сигнатур: {processed} вакансий, перепубликаций: {duplicates}")
+
+        return processed, duplicates
+
+
+# Глобальный экземпляр
+near_duplicate_index = NearDuplicateIndex()
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional, Set
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.api.hh_client import parse_hh_time
+from src.api.hh_responder import HHResponder
+
+logger = get_logger(__name__)
+
+
+def negotiation_row(item: Dict, synced_at: datetime, account_id: Optional[str] = None) -> Dict:
+    """Строка таблицы negotiations из элемента ответа /negotiations"""
+    vacancy = item.get('vacancy') or {}
+    return {
+        'id': str(item['id']),
+        'account_id': account_id,
+        'vacancy_id': str(vacancy['id']) if vacancy.get('id') else None,
+        'vacancy_name': vacancy.get('name'),
+        'company': (vacancy.get('employer') or {}).get('name'),
+        'state': (item.get('state') or {}).get('id'),
+        'created_at': parse_hh_time(item.get('created_at')),
+        'updated_at': parse_hh_time(item.get('updated_at')),
+        'synced_at': synced_at,
+    }
+
+
+class NegotiationSync:
+    """Синхронизация откликов с HH.ru и проверка «уже откликались» без запросов
+
+    Список /negotiations читается постранично, сначала недавно измененные:
+    повторная синхронизация останавливается на странице, где отклики старше
+    сохраненных. Отклики, сделанные вручную, попадают в таблицу negotiations,
+    а их вакансии помечаются отправленными. Множество applied хранит hh_id
+    всех вакансий с откликом - проверка перед отправкой за O(1).
+
+    У каждого аккаунта HH свои отклики: account_id - дополнительный аккаунт
+    (responder с его токеном), None - основной.
+    """
+
+    def __init__(self, responder: Optional[HHResponder] = None, database: Optional[Database] = None,
+                 per_page: Optional[int] = None, max_pages: Optional[int] = None,
+                 account_id: Optional[str] = None):
+        self.responder = responder or HHResponder()
+        self.database = database or db
+        self.account_id = account_id
+        self.per_page = per_page or settings.NEGOTIATION_SYNC_PER_PAGE
+        self.max_pages = max_pages or settings.NEGOTIATION_SYNC_MAX_PAGES
+        self.applied: Set[str] = set()
+
+    async def load(self) -> None:
+        """Заполняет множество из БД (без запросов к HH)"""
+        self.applied = await self.database.get_applied_vacancy_ids(self.account_id)
+        logger.info(f"Известных откликов: {len(self.applied)}")
+
+    def is_applied(self, vacancy_id: str) -> bool:
+        return str(vacancy_id).strip() in self.applied
+
+    def add(self, vacancy_id: str) -> None:
+        """Учитывает отклик, только что отправленный ботом"""
+        self.applied.add(str(vacancy_id).strip())
+
+    async def sync(self, full: bool = False) -> int:
+        """Загружает изменившиеся отклики; full - все страницы. Возвращает число сохраненных"""
+        since = None if full else await self.database.get_last_negotiation_update(self.account_id)
+        saved = 0
+
+        for page in range(self.max_pages):
+            data = await self.responder.get_negotiations_page(page, self.per_page)
+            if data is None:
+                break
+            items = data.get('items') or []
+            rows = [negotiation_row(item, datetime.utcnow(), self.account_id) for item in items]
+            saved += await self.database.upsert_negotiations(rows)
+            self.applied.update(row['vacancy_id'] for row in rows if row['vacancy_id'])
+
+            if not items or page + 1 >= data.get('pages', 0):
+                break
+            # Дальше - отклики, не менявшиеся с прошлой синхронизации
+            if since is not None and rows[-1]['updated_at'] is not None and rows[-1]['updated_at'] < since:
+                break
+
+        marked = await self.database.mark_applied_from_negotiations(self.account_id)
+        logger.info(f"Синхронизация откликов: сохранено {saved}, вакансий помечено отправленными: {marked}")
+        return saved
+
+    async def run_periodic(self, interval: Optional[float] = None) -> None:
+        """Повторяет синхронизацию каждые interval секунд"""
+        interval = interval or settings.NEGOTIATION_SYNC_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации откликов: {e}")
+
+
+# Глобальный экземпляр
+negotiation_sync = NegotiationSync()
@@ -1,129 +1,444 @@
 import aio_pika
-import json
 import asyncio
-from typing import Dict, Any, Optional
+import heapq
+import itertools
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Set
+from aio_pika.exceptions import MessageProcessError
 from src.core.config import settings
+from src.core.accounts import accounts, is_letter_queue, letter_queue
+from src.services.amqp_pool import AMQPConnectionPool, amqp_pool
+from src.services.messages import (
+    VacancyMessage, CoverLetterMessage, encode_payload, from_payload, to_payload,
+)
 from src.core.logger import get_logger
 
 logger = get_logger(__name__)
 
+MessageHandler = Callable[[Any], Awaitable[None]]
 
-class RabbitMQManager:
-    """Менеджер для работы с очередями RabbitMQ"""
 
-    def __init__(self):
-        self.connection: Optional[aio_pika.RobustConnection] = None
-        self.channel: Optional[aio_pika.Channel] = None
-        self.is_connected = False
+def relevance_priority(score: Optional[float]) -> int:
+    """Приоритет сообщения 0..MESSAGE_PRIORITY_MAX по оценке релевантности вакансии"""
+    if score is None:
+        return 0
+    return max(0, min(settings.MESSAGE_PRIORITY_MAX, round(score * settings.MESSAGE_PRIORITY_MAX)))
 
-    async def connect(self, max_retries: int = 5) -> bool:
-        """Подключение к RabbitMQ с повторными попытками"""
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Попытка подключения к RabbitMQ ({attempt + 1}/{max_retries})...")
-                self.connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-                self.channel = await self.connection.channel()
 
-                # Устанавливаем лимит неподтвержденных сообщений
-                await self.channel.set_qos(prefetch_count=1)
+def queue_arguments(queue_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Аргументы объявления очередей RabbitMQ (приоритет и dead-lettering писем - по настройке)"""
+    arguments = {}
+    if settings.RABBITMQ_QUEUE_MAX_PRIORITY > 0:
+        arguments['x-max-priority'] = settings.RABBITMQ_QUEUE_MAX_PRIORITY
+    if queue_name and is_letter_queue(queue_name) and settings.RABBITMQ_LETTER_DEAD_LETTERING:
+        # Просроченное письмо (per-message TTL) уходит через default exchange в очередь просроченных
+        arguments['x-dead-letter-exchange'] = ''
+        arguments['x-dead-letter-routing-key'] = settings.QUEUE_EXPIRED_LETTERS
+    return arguments or None
 
-                # Объявляем очереди
-                await self.channel.declare_queue(settings.QUEUE_VACANCIES, durable=True)
-                await self.channel.declare_queue(settings.QUEUE_COVER_LETTERS, durable=True)
 
-                self.is_connected = True
-                logger.info("Подключение к RabbitMQ установлено")
-                return True
+class QueueManager(ABC):
+    """Общий интерфейс менеджера очередей (RabbitMQ или in-process)"""
 
-            except Exception as e:
-                logger.error(f"Попытка {attempt + 1}/{max_retries} не удалась: {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Повторная попытка через 5 секунд...")
-                    await asyncio.sleep(5)
+    is_connected: bool = False
 
-        logger.error("Не удалось подключиться к RabbitMQ после всех попыток")
-        return False
+    @abstractmethod
+    async def connect(self, max_retries: Optional[int] = None) -> bool:
+        """Подключение к брокеру (повторные попытки - внутри реализации)"""
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Закрывает соединение"""
+
+    @abstractmethod
+    async def publish(self, queue_name: str, payload: Dict[str, Any], priority: int = 0,
+                      expiration: Optional[float] = None) -> bool:
+        """Публикует сообщение в очередь (кодирование - encode_payload); expiration - TTL в секундах"""
+
+    @abstractmethod
+    async def consume(self, queue_name: str, callback: MessageHandler, prefetch_count: int = 1) -> None:
+        """Подписывает обработчик на очередь"""
+
+    @abstractmethod
+    async def pause_consumers(self, queue_name: str) -> None:
+        """Перестает получать новые сообщения очереди (выданные остаются у обработчиков)"""
+
+    @abstractmethod
+    async def resume_consumers(self, queue_name: str) -> None:
+        """Возобновляет подписки, остановленные pause_consumers"""
+
+    @abstractmethod
+    async def get_queue_details(self) -> Dict[str, Dict[str, int]]:
+        """Глубина и число подписчиков по очередям: {очередь: {'messages': n, 'consumers': n}}"""
+
+    async def get_queue_stats(self) -> Dict[str, int]:
+        """Получает статистику по очередям (количество сообщений)"""
+        details = await self.get_queue_details()
+        return {name: info['messages'] for name, info in details.items()}
 
     async def ensure_connection(self) -> bool:
         """Проверяет и восстанавливает соединение при необходимости"""
-        if not self.is_connected or (self.connection and self.connection.is_closed):
-            logger.warning("Восстановление соединения с RabbitMQ...")
+        if not self.is_connected:
             return await self.connect()
         return True
 
+    async def health_check(self) -> bool:
+        """Проверка доступности брокера"""
+        return self.is_connected
+
     async def send_vacancy_to_queue(self, vacancy_data: Dict[str, Any]) -> bool:
         """Отправляет вакансию в очередь на обработку"""
-        if not await self.ensure_connection():
-            return False
+        payload = to_payload(from_payload(VacancyMessage, vacancy_data))
+        if await self.publish(settings.QUEUE_VACANCIES, payload, relevance_priority(payload['relevance'])):
+            logger.info(f"Вакансия отправлена в очередь: {vacancy_data['name']}")
+            return True
+        return False
 
+    async def send_cover_letter_to_queue(self, cover_letter_data: Dict[str, Any]) -> bool:
+        """Отправляет сопроводительное письмо в очередь отправки его аккаунта"""
+        payload = to_payload(from_payload(CoverLetterMessage, cover_letter_data))
+        expiration = None
+        if payload['expires_at'] is not None:
+            expiration = max(0.0, payload['expires_at'] - time.time())
+        if await self.publish(letter_queue(payload['account_id']), payload, relevance_priority(payload['relevance']),
+                              expiration):
+            logger.info("Сопроводительное письмо отправлено в очередь отправки")
+            return True
+        return False
+
+
+class RabbitMQManager(QueueManager):
+    """Менеджер для работы с очередями RabbitMQ поверх общего соединения процесса"""
+
+    def __init__(self, pool: Optional[AMQPConnectionPool] = None):
+        self.pool = pool or amqp_pool
+        self.channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self.is_connected = False
+        # Подписки по очередям: [очередь aio_pika, обработчик, consumer_tag или None на паузе]
+        self.subscriptions: Dict[str, List[list]] = {}
+
+    @property
+    def connection(self):
+        return self.pool.connection
+
+    async def connect(self, max_retries: Optional[int] = None) -> bool:
+        """Подключение к RabbitMQ (переиспользует соединение процесса)"""
         try:
-            message_body = json.dumps(vacancy_data, ensure_ascii=False)
-            message = aio_pika.Message(
-                body=message_body.encode('utf-8'),
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-            )
+            await self.pool.get_connection(max_retries)
+            self.channel = await self.pool.publisher_channel()
 
-            await self.channel.default_exchange.publish(
-                message,
-                routing_key=settings.QUEUE_VACANCIES
-            )
-            logger.info(f"Вакансия отправлена в очередь: {vacancy_data['name']}")
+            # Объявляем очереди
+            # Очередь писем у каждого аккаунта своя: публикация в необъявленную очередь теряет сообщение
+            for queue_name in (settings.QUEUE_VACANCIES, *accounts.letter_queues()):
+                await self.channel.declare_queue(queue_name, durable=True, arguments=queue_arguments(queue_name))
+            if settings.RABBITMQ_LETTER_DEAD_LETTERING:
+                await self.channel.declare_queue(settings.QUEUE_EXPIRED_LETTERS, durable=True)
+
+            self.is_connected = True
             return True
 
         except Exception as e:
-            logger.error(f"Ошибка отправки в очередь: {e}")
+            logger.error(f"Ошибка подключения к RabbitMQ: {e}")
             self.is_connected = False
             return False
 
-    async def send_cover_letter_to_queue(self, cover_letter_data: Dict[str, Any]) -> bool:
-        """Отправляет сопроводительное письмо в очередь на отправку"""
+    async def ensure_connection(self) -> bool:
+        """Проверяет и восстанавливает соединение при необходимости"""
+        if not self.is_connected or not self.pool.is_open or self.channel is None or self.channel.is_closed:
+            return await self.connect()
+        return True
+
+    async def health_check(self) -> bool:
+        """Брокер доступен и отвечает"""
+        return await self.pool.health_check()
+
+    async def publish(self, queue_name: str, payload: Dict[str, Any], priority: int = 0,
+                      expiration: Optional[float] = None) -> bool:
+        """Публикует сообщение в очередь через default exchange"""
         if not await self.ensure_connection():
             return False
 
         try:
-            message_body = json.dumps(cover_letter_data, ensure_ascii=False)
+            body, content_type, content_encoding = encode_payload(payload)
             message = aio_pika.Message(
-                body=message_body.encode('utf-8'),
+                body=body,
+                content_type=content_type,
+                content_encoding=content_encoding,
+                priority=priority,
+                expiration=expiration,
                 delivery_mode=aio_pika.DeliveryMode.PERSISTENT
             )
 
             await self.channel.default_exchange.publish(
                 message,
-                routing_key=settings.QUEUE_COVER_LETTERS
+                routing_key=queue_name
             )
-            logger.info("Сопроводительное письмо отправлено в очередь отправки")
             return True
 
         except Exception as e:
-            logger.error(f"Ошибка отправки письма в очередь: {e}")
+            logger.error(f"Ошибка отправки в очередь {queue_name}: {e}")
             self.is_connected = False
             return False
 
+    async def consume(self, queue_name: str, callback: MessageHandler, prefetch_count: int = 1) -> None:
+        """Подписывает обработчик на очередь RabbitMQ"""
+        if not await self.ensure_connection():
+            raise ConnectionError("Нет соединения с RabbitMQ")
+
+        channel = await self.pool.consumer_channel(prefetch_count)
+        queue = await channel.declare_queue(queue_name, durable=True, arguments=queue_arguments(queue_name))
+        consumer_tag = await queue.consume(callback)
+        self.subscriptions.setdefault(queue_name, []).append([queue, callback, consumer_tag])
+
+    async def pause_consumers(self, queue_name: str) -> None:
+        """basic.cancel подписок очереди: неподтвержденные сообщения остаются на канале"""
+        for subscription in self.subscriptions.get(queue_name, []):
+            queue, _, consumer_tag = subscription
+            if consumer_tag is not None:
+                await queue.cancel(consumer_tag)
+                subscription[2] = None
+
+    async def resume_consumers(self, queue_name: str) -> None:
+        """Подписывается заново на том же канале (prefetch прежний)"""
+        for subscription in self.subscriptions.get(queue_name, []):
+            queue, callback, consumer_tag = subscription
+            if consumer_tag is None:
+                subscription[2] = await queue.consume(callback)
+
     async def close(self) -> None:
-        """Закрывает соединение"""
-        if self.connection:
-            await self.connection.close()
-            self.is_connected = False
-            logger.info("Соединение с RabbitMQ закрыто")
+        """Отпускает менеджер; общее соединение закрывается при остановке процесса (amqp_pool.close)"""
+        self.is_connected = False
 
-    async def get_queue_stats(self) -> Dict[str, int]:
-        """Получает статистику по очередям"""
+    async def get_queue_details(self) -> Dict[str, Dict[str, int]]:
+        """Получает глубину очередей и число подписчиков"""
         if not await self.ensure_connection():
             return {}
 
         try:
             stats = {}
 
-            # Получаем очередь вакансий
-            queue_vacancies = await self.channel.declare_queue(settings.QUEUE_VACANCIES, passive=True)
-            stats[settings.QUEUE_VACANCIES] = queue_vacancies.declaration_result.message_count
-
-            # Получаем очередь писем
-            queue_letters = await self.channel.declare_queue(settings.QUEUE_COVER_LETTERS, passive=True)
-            stats[settings.QUEUE_COVER_LETTERS] = queue_letters.declaration_result.message_count
+            for queue_name in (settings.QUEUE_VACANCIES, *accounts.letter_queues()):
+                queue = await self.channel.declare_queue(queue_name, passive=True)
+                stats[queue_name] = {
+                    'messages': queue.declaration_result.message_count,
+                    'consumers': queue.declaration_result.consumer_count,
+                }
 
             return stats
 
         except Exception as e:
             logger.error(f"Ошибка получения статистики очередей: {e}")
             return {}
+
+
+class InMemoryMessage:
+    """Сообщение in-process очереди с семантикой aio_pika.IncomingMessage"""
+
+    def __init__(self, body: bytes, queue: asyncio.Queue, redelivered: bool = False,
+                 content_type: Optional[str] = None, content_encoding: Optional[str] = None,
+                 priority: int = 0):
+        self.body = body
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.priority = priority
+        self.redelivered = redelivered
+        self._queue = queue
+        self.processed = False
+
+    def _settle(self) -> None:
+        # Как в aio_pika: повторный ack/nack/reject - ошибка
+        if self.processed:
+            raise MessageProcessError("Message already processed", self)
+        self.processed = True
+
+    async def ack(self) -> None:
+        self._settle()
+
+    async def reject(self, requeue: bool = False) -> None:
+        self._settle()
+        if requeue:
+            self._queue.put_nowait(InMemoryMessage(
+                self.body, self._queue, redelivered=True,
+                content_type=self.content_type, content_encoding=self.content_encoding,
+                priority=self.priority,
+            ))
+
+    async def nack(self, requeue: bool = True) -> None:
+        await self.reject(requeue=requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, reject_on_redelivered: bool = False,
+                      ignore_processed: bool = False):
+        """Аналог aio_pika ProcessContext: ack при успехе, reject при исключении"""
+        try:
+            yield self
+        except Exception:
+            if not ignore_processed or not self.processed:
+                if reject_on_redelivered and self.redelivered:
+                    await self.reject(requeue=False)
+                else:
+                    await self.reject(requeue=requeue)
+            raise
+        else:
+            if not ignore_processed or not self.processed:
+                await self.ack()
+
+
+class InMemoryPriorityQueue(asyncio.Queue):
+    """asyncio.Queue сообщений: сначала больший priority, при равном - в порядке публикации"""
+
+    def _init(self, maxsize):
+        self._queue = []
+        self._sequence = itertools.count()
+
+    def _put(self, message):
+        heapq.heappush(self._queue, (-message.priority, next(self._sequence), message))
+
+    def _get(self):
+        return heapq.heappop(self._queue)[2]
+
+
+class InMemoryBroker:
+    """Общие для всего процесса очереди asyncio.Queue"""
+
+    def __init__(self):
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.consumer_counts: Dict[str, int] = {}
+
+    def get_queue(self, queue_name: str) -> asyncio.Queue:
+        if queue_name not in self.queues:
+            self.queues[queue_name] = InMemoryPriorityQueue()
+        return self.queues[queue_name]
+
+
+class InMemoryQueueManager(QueueManager):
+    """Очереди на asyncio.Queue для запуска всего пайплайна в одном процессе (run-all)
+
+    Очереди не переживают рестарт: при старте run-all незавершенные
+    вакансии и письма заново ставятся в очередь из БД.
+    """
+
+    def __init__(self, broker: Optional[InMemoryBroker] = None):
+        self.broker = broker or InMemoryBroker()
+        self.consumers: Set[asyncio.Task] = set()
+        self.in_flight: Set[asyncio.Task] = set()
+        self.is_connected = False
+        # Подписки по очередям: [обработчик, prefetch, задача или None на паузе]
+        self.subscriptions: Dict[str, List[list]] = {}
+
+    async def connect(self, max_retries: Optional[int] = None) -> bool:
+        """Объявляет очереди (сеть не нужна)"""
+        self.broker.get_queue(settings.QUEUE_VACANCIES)
+        self.broker.get_queue(settings.QUEUE_COVER_LETTERS)
+        self.is_connected = True
+        return True
+
+    async def close(self) -> None:
+        """Останавливает своих подписчиков и дожидается сообщений в обработке"""
+        for task in self.consumers:
+            task.cancel()
+        await asyncio.gather(*self.consumers, return_exceptions=True)
+        self.consumers.clear()
+
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+        self.is_connected = False
+
+    async def publish(self, queue_name: str, payload: Dict[str, Any], priority: int = 0,
+                      expiration: Optional[float] = None) -> bool:
+        """Кладет сообщение в локальную очередь; срок письма проверяет отправитель при получении"""
+        queue = self.broker.get_queue(queue_name)
+        body, content_type, content_encoding = encode_payload(payload)
+        queue.put_nowait(InMemoryMessage(body, queue, content_type=content_type,
+                                         content_encoding=content_encoding, priority=priority))
+        return True
+
+    async def consume(self, queue_name: str, callback: MessageHandler, prefetch_count: int = 1) -> None:
+        """Запускает фоновую задачу, раздающую сообщения обработчику"""
+        task = self._start_consumer(queue_name, callback, prefetch_count)
+        self.subscriptions.setdefault(queue_name, []).append([callback, prefetch_count, task])
+
+    def _start_consumer(self, queue_name: str, callback: MessageHandler, prefetch_count: int) -> asyncio.Task:
+        queue = self.broker.get_queue(queue_name)
+        task = asyncio.create_task(self._consume_loop(queue, callback, prefetch_count))
+        self.consumers.add(task)
+        self.broker.consumer_counts[queue_name] = self.broker.consumer_counts.get(queue_name, 0) + 1
+        task.add_done_callback(lambda _: self._forget_consumer(queue_name))
+        return task
+
+    async def pause_consumers(self, queue_name: str) -> None:
+        """Останавливает раздачу; сообщения в обработке дорабатываются"""
+        for subscription in self.subscriptions.get(queue_name, []):
+            task = subscription[2]
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                self.consumers.discard(task)
+                subscription[2] = None
+
+    async def resume_consumers(self, queue_name: str) -> None:
+        for subscription in self.subscriptions.get(queue_name, []):
+            callback, prefetch_count, task = subscription
+            if task is None:
+                subscription[2] = self._start_consumer(queue_name, callback, prefetch_count)
+
+    def _forget_consumer(self, queue_name: str) -> None:
+        self.broker.consumer_counts[queue_name] -= 1
+
+    async def _consume_loop(self, queue: asyncio.Queue, callback: MessageHandler, prefetch_count: int) -> None:
+        # Не больше prefetch_count сообщений в обработке, как basic.qos в RabbitMQ
+        semaphore = asyncio.Semaphore(prefetch_count)
+        while True:
+            await semaphore.acquire()
+            message = await queue.get()
+            # Держим ссылку на задачу, иначе ее может собрать GC посреди обработки
+            task = asyncio.create_task(self._dispatch(message, callback, semaphore))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def _dispatch(self, message: InMemoryMessage, callback: MessageHandler,
+                        semaphore: asyncio.Semaphore) -> None:
+        try:
+            await callback(message)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика in-process очереди: {e}")
+        finally:
+            semaphore.release()
+
+    async def get_queue_details(self) -> Dict[str, Dict[str, int]]:
+        """Количество ожидающих сообщений и подписчиков"""
+        return {
+            name: {'messages': queue.qsize(), 'consumers': self.broker.consumer_counts.get(name, 0)}
+            for name, queue in self.broker.queues.items()
+        }
+
+
+QUEUE_BACKENDS = ("rabbitmq", "memory")
+
+# Общие очереди процесса: все стадии run-all должны видеть одни и те же очереди
+in_memory_broker = InMemoryBroker()
+_in_process_pipeline = False
+
+
+def enable_in_process_pipeline() -> None:
+    """Разрешает бэкенд memory: вызывается только run-all, где все стадии в одном процессе"""
+    global _in_process_pipeline
+    _in_process_pipeline = True
+
+
+def create_queue_manager() -> QueueManager:
+    """Создает менеджер очередей согласно настройке QUEUE_BACKEND"""
+    backend = settings.QUEUE_BACKEND
+    if backend not in QUEUE_BACKENDS:
+        raise ValueError(f"Неизвестный QUEUE_BACKEND: {backend}. Доступные: {', '.join(QUEUE_BACKENDS)}")
+
+    if backend == "memory":
+        # Отдельный воркер с in-process очередью публиковал бы сообщения,
+        # которые никто не прочитает, - вакансии терялись бы навсегда
+        if not _in_process_pipeline:
+            raise RuntimeError("QUEUE_BACKEND=memory работает только в режиме 'main.py run-all'")
+        return InMemoryQueueManager(in_memory_broker)
+
+    return RabbitMQManager()
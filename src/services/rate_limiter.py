@@ -1,62 +1,223 @@
 import asyncio
+import copy
+import math
+import os
+import socket
 import time
-from typing import Optional
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
 from src.core.config import settings
 from src.core.logger import get_logger
 
 logger = get_logger(__name__)
 
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+def _to_epoch(moment: datetime) -> float:
+    """applied_at хранится как naive UTC (datetime.utcnow)"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _from_epoch(stamp: float) -> datetime:
+    """Epoch -> naive UTC для колонок DateTime"""
+    return datetime.fromtimestamp(stamp, timezone.utc).replace(tzinfo=None)
+
+
+def _format_wait(wait_time: float) -> str:
+    if math.isinf(wait_time):
+        return "нет (лимит 0 - отправка на паузе)"
+    minutes, seconds = divmod(int(wait_time), 60)
+    return f"через {minutes:02d}:{seconds:02d}"
+
 
 class RateLimiter:
-    """Ограничитель частоты запросов для соблюдения лимитов HH.ru"""
+    """Ограничитель откликов по скользящим окнам (журнал времени отправок)
 
-    def __init__(self, requests_per_hour: Optional[int] = None):
-        self.requests_per_hour = requests_per_hour or settings.REQUESTS_PER_HOUR
-        self.delay = 3600 / self.requests_per_hour  # секунд между запросами
-        self.last_request: float = 0
+    Окна: REQUESTS_PER_HOUR за час и REQUESTS_PER_DAY за сутки; между
+    откликами - не меньше APPLY_MIN_INTERVAL секунд. Журнал восстанавливается
+    из vacancies.applied_at при старте, поэтому перезапуск отправителя не
+    обнуляет лимит. Скользящие сутки строже календарных: лимит HH на день
+    не превышается ни при каком положении границы дня. account_id - журнал
+    дополнительного аккаунта (account_letters.applied_at), None - основного.
+    """
+
+    def __init__(self, requests_per_hour: Optional[int] = None, requests_per_day: Optional[int] = None,
+                 min_interval: Optional[float] = None, database=None, account_id: Optional[str] = None):
+        self.windows: List[Tuple[float, int]] = [
+            # Явный 0 - аккаунт на паузе, None - лимит из настроек
+            (HOUR, settings.REQUESTS_PER_HOUR if requests_per_hour is None else requests_per_hour),
+            (DAY, settings.REQUESTS_PER_DAY if requests_per_day is None else requests_per_day),
+        ]
+        self.min_interval = settings.APPLY_MIN_INTERVAL if min_interval is None else min_interval
+        self.database = database
+        self.account_id = account_id
+        self._log: List[float] = []  # Время отправок (epoch), по возрастанию, за последние сутки
+        self._lock = asyncio.Lock()
 
         logger.info(
-            f"Rate limiter настроен: {self.requests_per_hour} запросов/час (~{self.delay:.0f} сек между откликами)")
+            f"Rate limiter настроен: {self.windows[0][1]} откликов/час, {self.windows[1][1]} откликов/сутки, "
+            f"не чаще раза в {self.min_interval:.0f} с")
+
+    async def load(self) -> None:
+        """Восстанавливает журнал из времени отправленных откликов в БД"""
+        if self.database is None:
+            from src.core.database import db
+            self.database = db
+        since = datetime.utcnow() - timedelta(seconds=DAY)
+        stamps = sorted(_to_epoch(moment) for moment in await self.database.get_applied_times(since, self.account_id))
+        # Записи, сделанные в этом процессе до загрузки, сохраняются
+        self._log = sorted(set(stamps) | set(self._log))
+        logger.info(f"Журнал отправок загружен: {len(stamps)} за сутки, следующий слот "
+                    f"{_format_wait(self.get_remaining_time())}")
+
+    async def refresh(self) -> None:
+        """Журнал процесса всегда актуален; общий бюджет перечитывается из БД"""
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - max(length for length, _ in self.windows)
+        if self._log and self._log[0] <= cutoff:
+            del self._log[:bisect_right(self._log, cutoff)]
+
+    def next_slot(self, now: Optional[float] = None, ignore_spacing: bool = False) -> float:
+        """Время (epoch), когда можно отправить следующий отклик; <= now - можно сейчас
+
+        При нулевом лимите - math.inf: слот не откроется никогда.
+        """
+        now = time.time() if now is None else now
+        self._prune(now)
+        slot = now
+
+        for length, limit in self.windows:
+            if limit <= 0:
+                return math.inf
+            in_window = len(self._log) - bisect_right(self._log, now - length)
+            if in_window >= limit:
+                # Слот освободится, когда из окна выйдет limit-я с конца отправка
+                slot = max(slot, self._log[len(self._log) - limit] + length)
 
-    async def wait_if_needed(self) -> None:
-        """Ждет если нужно соблюдать лимиты"""
-        if self.last_request == 0:
-            self.last_request = time.time()
-            return
+        if not ignore_spacing and self._log:
+            slot = max(slot, self._log[-1] + self.min_interval)
+        return slot
 
+    def get_remaining_time(self, ignore_spacing: bool = False) -> float:
+        """Секунд до следующего слота (0 - можно отправлять)"""
         now = time.time()
-        time_since_last = now - self.last_request
+        return max(0.0, self.next_slot(now, ignore_spacing) - now)
 
-        if time_since_last < self.delay:
-            wait_time = self.delay - time_since_last
+    def snapshot(self) -> 'RateLimiter':
+        """Копия с текущим журналом для расчетов наперед (план отправки); бюджет не меняет"""
+        clone = copy.copy(self)
+        clone._log = list(self._log)
+        return clone
 
-            # обратный отсчёт
-            minutes = int(wait_time // 60)
-            seconds = int(wait_time % 60)
-            logger.info(f"Отправка через: {minutes:02d}:{seconds:02d}")
+    def record(self, stamp: Optional[float] = None) -> float:
+        """Учитывает отправку в журнале"""
+        stamp = time.time() if stamp is None else stamp
+        insort(self._log, stamp)
+        return stamp
 
-            # Обновляем каждую секунду
-            while wait_time > 0:
-                minutes = int(wait_time // 60)
-                seconds = int(wait_time % 60)
-                print(f"Отправка через: {minutes:02d}:{seconds:02d}", end='\r', flush=True)
-                await asyncio.sleep(1)
-                wait_time -= 1
+    async def release(self, stamp: float) -> None:
+        """Возвращает слот, занятый acquire: отклик так и не был отправлен"""
+        try:
+            self._log.remove(stamp)
+        except ValueError:
+            pass
 
-            print(" " * 50, end='\r')  # Очищаем строку
-            logger.info("Отправка сейчас!")
+    async def acquire(self, ignore_spacing: bool = False, vacancy_id: Optional[str] = None) -> float:
+        """Ждет свободный слот и занимает его; возвращает отметку для release
 
-        self.last_request = time.time()
+        ignore_spacing - без паузы APPLY_MIN_INTERVAL (ручная отправка «сейчас»),
+        часовой и суточный лимиты соблюдаются всегда. vacancy_id записывается
+        только в журнал общего бюджета (SharedRateLimiter).
+        """
+        async with self._lock:
+            while (wait_time := self.get_remaining_time(ignore_spacing)) > 0:
+                logger.info(f"Лимит откликов: следующий слот {_format_wait(wait_time)}")
+                await asyncio.sleep(min(wait_time, HOUR))
+            return self.record()
 
-    def get_remaining_time(self) -> float:
-        """Возвращает оставшееся время до следующего запроса"""
-        if self.last_request == 0:
-            return 0
 
-        now = time.time()
-        time_since_last = now - self.last_request
+class SharedRateLimiter(RateLimiter):
+    """Один бюджет откликов на все реплики отправителя (журнал - таблица send_leases)
+
+    HH считает лимиты по аккаунту, поэтому у двух send-worker должен быть общий
+    журнал. Слот выдается атомарно в транзакции БД (Database.lease_send_slot):
+    проверка окон и запись слота под блокировкой строки бюджета. Локальный
+    _log - копия журнала на момент последнего обращения к БД (для
+    get_remaining_time). Время берется по часам реплики: на узлах нужен NTP.
+    """
+
+    def __init__(self, requests_per_hour: Optional[int] = None, requests_per_day: Optional[int] = None,
+                 min_interval: Optional[float] = None, database=None, account_id: Optional[str] = None,
+                 name: Optional[str] = None, holder: Optional[str] = None):
+        super().__init__(requests_per_hour, requests_per_day, min_interval, database, account_id)
+        # Бюджет на аккаунт HH: у дополнительных аккаунтов - свой
+        self.name = name or (settings.RATE_LIMIT_BUCKET if account_id is None
+                             else f"{settings.RATE_LIMIT_BUCKET}:{account_id}")
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+
+    def _database(self):
+        if self.database is None:
+            from src.core.database import db
+            self.database = db
+        return self.database
+
+    async def load(self) -> None:
+        """Создает бюджет в БД (при первом запуске - из applied_at) и читает журнал"""
+        since = _from_epoch(time.time() - DAY)
+        await self._database().ensure_rate_limit_bucket(self.name, since, self.account_id)
+        await self.refresh()
+        logger.info(f"Общий бюджет откликов '{self.name}': {len(self._log)} за сутки, "
+                    f"следующий слот {_format_wait(self.get_remaining_time())}")
+
+    async def refresh(self) -> None:
+        """Обновляет локальную копию журнала (отправки других реплик)"""
+        stamps = await self._database().get_send_lease_times(self.name, _from_epoch(time.time() - DAY))
+        self._log = [_to_epoch(moment) for moment in stamps]
+
+    async def acquire(self, ignore_spacing: bool = False, vacancy_id: Optional[str] = None) -> int:
+        """Ждет свободный слот общего бюджета и занимает его; возвращает id слота для release"""
+        async with self._lock:
+            while True:
+                now = time.time()
+
+                def can_send(stamps: List[datetime]) -> bool:
+                    self._log = [_to_epoch(moment) for moment in stamps]
+                    return self.next_slot(now, ignore_spacing) <= now
+
+                lease_id = await self._database().lease_send_slot(
+                    self.name, _from_epoch(now), _from_epoch(now - DAY), can_send, self.holder, vacancy_id)
+                if lease_id is None:
+                    await asyncio.sleep(settings.RATE_LIMIT_RETRY_INTERVAL)
+                    continue
+                if lease_id:
+                    self.record(now)
+                    return lease_id
+
+                wait_time = self.get_remaining_time(ignore_spacing)
+                logger.info(f"Лимит откликов '{self.name}': следующий слот {_format_wait(wait_time)}")
+                # Другая реплика может вернуть слот раньше - бюджет перепроверяется периодически
+                await asyncio.sleep(min(max(wait_time, 0.01), settings.RATE_LIMIT_POLL_INTERVAL))
+
+    async def release(self, lease_id: int) -> None:
+        """Возвращает слот в общий бюджет: отклик так и не был отправлен"""
+        await self._database().delete_send_lease(lease_id)
+        await self.refresh()
+
+
+RATE_LIMIT_BACKENDS = ("database", "memory")
+
 
-        if time_since_last >= self.delay:
-            return 0
-        else:
-            return self.delay - time_since_last
\ No newline at end of file
+def create_rate_limiter(**kwargs) -> RateLimiter:
+    """Ограничитель откликов согласно настройке RATE_LIMIT_BACKEND"""
+    backend = settings.RATE_LIMIT_BACKEND
+    if backend not in RATE_LIMIT_BACKENDS:
+        raise ValueError(f"Неизвестный RATE_LIMIT_BACKEND: {backend}. Доступные: {', '.join(RATE_LIMIT_BACKENDS)}")
+    if backend == "memory":
+        return RateLimiter(**kwargs)
+    return SharedRateLimiter(**kwargs)
@@ -0,0 +1,109 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.services.text_features import VacancyFeatures, hash_terms, tokenize, vacancy_text
+
+logger = get_logger(__name__)
+
+class RelevanceScorer:
+    """Оценка соответствия вакансий резюме: косинус TF-IDF на хешированных термах
+
+    Термы хешируются (crc32) в RELEVANCE_HASH_BITS-битное пространство, поэтому
+    словарь не нужен: в БД (idf_terms) хранятся только документные частоты
+    корзин, таблица дополняется каждой новой страницей поиска. Страница
+    оценивается одним матрично-векторным произведением в формате CSR.
+    """
+
+    def __init__(self, database: Optional[Database] = None, profile: Optional[str] = None):
+        self.database = database or db
+        self.profile = profile if profile is not None else settings.RESUME_PROFILE
+        self.dim = 1 << settings.RELEVANCE_HASH_BITS
+        self.doc_freq: Optional[np.ndarray] = None
+        self.documents = 0
+
+    async def load(self) -> None:
+        """Загружает таблицу IDF из БД (один раз на процесс)"""
+        doc_freqs, documents = await self.database.get_idf_table()
+        self.doc_freq = np.zeros(self.dim, dtype=np.int64)
+        if doc_freqs:
+            buckets = np.fromiter(doc_freqs.keys(), dtype=np.int64, count=len(doc_freqs))
+            counts = np.fromiter(doc_freqs.values(), dtype=np.int64, count=len(doc_freqs))
+            in_range = buckets < self.dim  # после смены RELEVANCE_HASH_BITS лишние корзины игнорируются
+            self.doc_freq[buckets[in_range]] = counts[in_range]
+        self.documents = documents
+        logger.info(f"Таблица IDF загружена: {len(doc_freqs)} корзин, {documents} документов")
+
+    def _hash(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Уникальные корзины термов и их частоты в документе"""
+        return hash_terms(tokens, settings.RELEVANCE_HASH_BITS)
+
+    def _idf(self) -> np.ndarray:
+        # Сглаженный IDF: термы, которых еще не было, получают максимальный вес
+        return np.log((1 + self.documents) / (1 + self.doc_freq)) + 1
+
+    def _to_csr(self, terms: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Матрица документов в CSR по (корзины, частоты): (indptr, indices, сублинейный tf)"""
+        indptr = [0]
+        indices, data = [], []
+        for buckets, counts in terms:
+            indices.append(buckets.astype(np.int64))
+            data.append(1 + np.log(counts))
+            indptr.append(indptr[-1] + len(buckets))
+        return (
+            np.asarray(indptr, dtype=np.int64),
+            np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+            np.concatenate(data) if data else np.empty(0),
+        )
+
+    async def score_page(self, vacancies: List[dict], learn: bool = True,
+                         features: Optional[List[VacancyFeatures]] = None) -> List[float]:
+        """Оценки 0..1 для страницы вакансий; learn - учесть вакансии в таблице IDF
+
+        features - термы, заранее посчитанные в пуле процессов (cpu_pool);
+        без них токенизация выполняется здесь же.
+        """
+        if not vacancies:
+            return []
+        if self.doc_freq is None:
+            await self.load()
+
+        if features is not None:
+            terms = [(item.term_buckets, item.term_counts) for item in features]
+        else:
+            terms = [self._hash(tokenize(vacancy_text(vacancy))) for vacancy in vacancies]
+        indptr, indices, tf = self._to_csr(terms)
+
+        if learn:
+            # Каждая корзина входит в документ один раз - прирост частоты = число документов с ней
+            buckets, counts = np.unique(indices, return_counts=True)
+            self.doc_freq[buckets] += counts
+            self.documents += len(vacancies)
+            await self.database.increment_doc_freqs(dict(zip(buckets.tolist(), counts.tolist())))
+
+        idf = self._idf()
+
+        profile_buckets, profile_counts = self._hash(tokenize(self.profile))
+        profile = np.zeros(self.dim)
+        profile[profile_buckets] = (1 + np.log(profile_counts)) * idf[profile_buckets]
+        profile_norm = np.linalg.norm(profile)
+
+        # Строки CSR: dot(doc, profile) и нормы документов через bincount по номеру строки
+        rows = np.repeat(np.arange(len(vacancies)), np.diff(indptr))
+        weights = tf * idf[indices]
+        dots = np.bincount(rows, weights=weights * profile[indices], minlength=len(vacancies))
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=len(vacancies)))
+
+        denominator = norms * profile_norm
+        scores = np.divide(dots, denominator, out=np.zeros_like(dots), where=denominator > 0)
+        return [round(float(score), 4) for score in scores]
+
+    @staticmethod
+    def passes(score: Optional[float]) -> bool:
+        """Достаточно ли сильное совпадение, чтобы тратить на вакансию письмо и отклик"""
+        return score is None or score >= settings.RELEVANCE_MIN_SCORE
+
+
+# Глобальный экземпляр
+relevance_scorer = RelevanceScorer()
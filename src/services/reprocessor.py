@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional
+from src.core.database import db, Database
+from src.core.models import Vacancy
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.core.text import fold_case
+from src.services.cpu_pool import cpu_pool, CpuPool
+from src.services.letter_expiry import letter_expires_at
+from src.services.relevance import relevance_scorer, RelevanceScorer
+from src.services.text_features import compute_vacancy_features
+from src.api.deepseek_client import LetterGeneration
+
+logger = get_logger(__name__)
+
+BOOL_VALUES = {'true': True, '1': True, 'yes': True, 'false': False, '0': False, 'no': False}
+
+# Вакансия больше не проходит фильтры: прежнее письмо и его учет стираются,
+# чтобы status, статистика LLM и фильтр source= не считали его действующим
+NO_LETTER = {
+    'cover_letter_generated': False,
+    'cover_letter': None,
+    'letter_template': None,
+    'cover_letter_generated_at': None,
+    'letter_source': None,
+    'letter_variant': None,
+    'llm_prompt_tokens': None,
+    'llm_completion_tokens': None,
+    'llm_cost': None,
+}
+
+
+def _parse_bool(value: str) -> bool:
+    try:
+        return BOOL_VALUES[value.lower()]
+    except KeyError:
+        raise ValueError(f"Ожидалось true/false, получено '{value}'")
+
+
+@dataclass
+class ReprocessFilter:
+    """Отбор вакансий для переобработки: выражения вида ключ=значение из --filter
+
+    applied, processed, letter, duplicate - true/false; source - llm, cache, template или none;
+    min_relevance, max_relevance - число; since, until - дата ISO (created_at);
+    keyword - подстрока в токенах вакансии. Без duplicate перепубликации не берутся.
+    """
+    applied: Optional[bool] = None
+    processed: Optional[bool] = None
+    letter: Optional[bool] = None
+    duplicate: Optional[bool] = False
+    source: Optional[str] = None
+    min_relevance: Optional[float] = None
+    max_relevance: Optional[float] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    keyword: Optional[str] = None
+    expressions: List[str] = field(default_factory=list)
+
+    PARSERS = {
+        'applied': _parse_bool, 'processed': _parse_bool, 'letter': _parse_bool, 'duplicate': _parse_bool,
+        'source': str.lower, 'min_relevance': float, 'max_relevance': float,
+        'since': datetime.fromisoformat, 'until': datetime.fromisoformat, 'keyword': fold_case,
+    }
+
+    @classmethod
+    def parse(cls, expressions: List[str]) -> 'ReprocessFilter':
+        """Фильтр из выражений; ValueError - неизвестный ключ или некорректное значение"""
+        result = cls(expressions=sorted(expressions))
+        for expression in expressions:
+            key, separator, value = expression.partition('=')
+            key = key.strip()
+            if not separator or key not in cls.PARSERS:
+                raise ValueError(f"Некорректный фильтр '{expression}', ключи: {', '.join(cls.PARSERS)}")
+            try:
+                setattr(result, key, cls.PARSERS[key](value.strip()))
+            except ValueError as e:
+                raise ValueError(f"Фильтр '{expression}': {e}") from e
+        return result
+
+    def conditions(self) -> list:
+        """Условия SQLAlchemy для выборки из vacancies"""
+        conditions = []
+        for column, value in ((Vacancy.applied, self.applied), (Vacancy.processed, self.processed),
+                              (Vacancy.cover_letter_generated, self.letter)):
+            if value is not None:
+                conditions.append(column == value)
+        if self.duplicate is not None:
+            conditions.append(Vacancy.duplicate_of.is_not(None) if self.duplicate else Vacancy.duplicate_of.is_(None))
+        if self.source is not None:
+            conditions.append(Vacancy.letter_source.is_(None) if self.source == 'none'
+                              else Vacancy.letter_source == self.source)
+        if self.min_relevance is not None:
+            conditions.append(Vacancy.relevance_score >= self.min_relevance)
+        if self.max_relevance is not None:
+            conditions.append(Vacancy.relevance_score <= self.max_relevance)
+        if self.since is not None:
+            conditions.append(Vacancy.created_at >= self.since)
+        if self.until is not None:
+            conditions.append(Vacancy.created_at < self.until)
+        if self.keyword:
+            conditions.append(Vacancy.search_text.contains(self.keyword, autoescape=True))
+        return conditions
+
+    def checkpoint_name(self) -> str:
+        """Имя чекпоинта по умолчанию: один и тот же фильтр продолжает с того же места"""
+        digest = hashlib.sha1('|'.join(self.expressions).encode('utf-8')).hexdigest()[:12]
+        return f"filter-{digest}"
+
+
+@dataclass
+class ReprocessStats:
+    total: int = 0  # Подходит под фильтр (с учетом чекпоинта)
+    scanned: int = 0
+    letters: int = 0
+    not_python: int = 0
+    low_relevance: int = 0
+    enqueued: int = 0
+    errors: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Вакансий в секунду"""
+        return self.scanned / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def _vacancy_data(vacancy: Vacancy) -> dict:
+    """Данные вакансии в формате сообщения QUEUE_VACANCIES"""
+    return {
+        'hh_id': vacancy.hh_id,
+        'name': vacancy.name or '',
+        'company': vacancy.company or '',
+        'salary_from': vacancy.salary_from,
+        'salary_to': vacancy.salary_to,
+        'salary_currency': vacancy.salary_currency,
+        'experience': vacancy.experience or '',
+        'employment': vacancy.employment or '',
+        # Для нормализации берем исходный HTML: правила нормализации могли измениться
+        'description': vacancy.description_html or vacancy.description or '',
+        'skills': vacancy.skills or '',
+        'url': vacancy.url,
+    }
+
+
+class Reprocessor:
+    """Переобработка сохраненных вакансий без запросов к HH
+
+    Порции по batch_size читаются keyset-пагинацией по id. Для каждой порции:
+    нормализация текста в пуле процессов, пересчет релевантности (без
+    обновления IDF), генерация писем через VacancyProcessor с ограничением
+    параллельности, запись результатов одним пакетом и, по желанию, отправка
+    писем в очередь откликов. После каждой порции сохраняется чекпоинт.
+    """
+
+    def __init__(self, processor=None, database: Optional[Database] = None,
+                 scorer: Optional[RelevanceScorer] = None, pool: Optional[CpuPool] = None,
+                 batch_size: int = 500, concurrency: Optional[int] = None,
+                 letters: bool = True, enqueue: bool = False):
+        if processor is None and letters:
+            from src.services.vacancy_processor import vacancy_processor
+            processor = vacancy_processor
+        self.processor = processor
+        self.database = database or db
+        self.scorer = scorer or relevance_scorer
+        self.pool = pool or cpu_pool
+        self.batch_size = batch_size
+        self.concurrency = concurrency or settings.DEEPSEEK_MAX_CONCURRENCY * settings.LLM_BATCH_SIZE
+        self.letters = letters
+        self.enqueue = enqueue
+
+    async def run(self, vacancy_filter: ReprocessFilter, checkpoint: Optional[str] = None,
+                  restart: bool = False,
+                  on_progress: Optional[Callable[[ReprocessStats], None]] = None) -> ReprocessStats:
+        """Переобрабатывает вакансии фильтра; с чекпоинта, если он есть и restart=False"""
+        checkpoint = checkpoint or vacancy_filter.checkpoint_name()
+        conditions = vacancy_filter.conditions()
+
+        last_id = done_before = 0
+        if restart:
+            await self.database.delete_reprocess_checkpoint(checkpoint)
+        else:
+            saved = await self.database.get_reprocess_checkpoint(checkpoint)
+            if saved is not None:
+                last_id, done_before = saved.last_id, saved.processed
+                logger.info(f"Продолжение переобработки '{checkpoint}' после id={last_id} "
+                            f"(уже обработано: {done_before})")
+
+        stats = ReprocessStats()
+        stats.total = await self.database.count_vacancies([Vacancy.id > last_id, *conditions])
+
+        while True:
+            vacancies = await self.database.get_vacancies_page(conditions, last_id, self.batch_size)
+            if not vacancies:
+                break
+
+            await self._process_page(vacancies, stats)
+            last_id = vacancies[-1].id
+            await self.database.save_reprocess_checkpoint(checkpoint, last_id, done_before + stats.scanned)
+            if on_progress:
+                on_progress(stats)
+
+        await self.database.delete_reprocess_checkpoint(checkpoint)
+        logger.info(f"Переобработка '{checkpoint}' завершена: {stats.scanned} вакансий "
+                    f"за {stats.elapsed:.1f} с ({stats.rate:.0f} вак/с)")
+        return stats
+
+    async def _process_page(self, vacancies: List[Vacancy], stats: ReprocessStats) -> None:
+        page = [_vacancy_data(vacancy) for vacancy in vacancies]
+        features = await self.pool.map(compute_vacancy_features, [
+            {key: data[key] for key in ('name', 'skills', 'description')} for data in page
+        ])
+        for data, vacancy_features in zip(page, features):
+            data['description'] = vacancy_features.description
+            data['search_text'] = vacancy_features.search_text
+        scores = await self.scorer.score_page(page, learn=False, features=features)
+
+        rows = []
+        for vacancy, data, vacancy_features, score in zip(vacancies, page, features, scores):
+            data['relevance'] = score
+            rows.append({
+                'id': vacancy.id,
+                'description': vacancy_features.description,
+                'description_html': vacancy.description_html or vacancy.description,
+                'search_text': vacancy_features.search_text,
+                'text_hash': vacancy_features.text_hash,
+                'relevance_score': score,
+            })
+
+        # Без LLM письма рендерятся шаблонами сразу для всей порции
+        templated = None
+        if self.letters and not self.processor.deepseek.llm_enabled:
+            templated = dict(zip((data['hh_id'] for data in page), self.processor.deepseek.generate_templates(page)))
+
+        # Письма LLM генерируются параллельно: кэш и пакетирование VacancyProcessor работают как в воркере
+        semaphore = asyncio.Semaphore(self.concurrency)
+        letters = await asyncio.gather(*(
+            self._regenerate(vacancy, data, row, stats, semaphore, templated)
+            for vacancy, data, row in zip(vacancies, page, rows)
+        ))
+
+        if not await self.database.bulk_update_vacancies(rows):
+            raise RuntimeError("Не удалось сохранить порцию, переобработка остановлена")
+        stats.scanned += len(vacancies)
+
+        if self.enqueue:
+            for vacancy, data, generation in zip(vacancies, page, letters):
+                if generation is not None:
+                    stats.enqueued += await self._enqueue(vacancy, data, generation)
+
+    async def _regenerate(self, vacancy: Vacancy, data: dict, row: dict, stats: ReprocessStats,
+                          semaphore: asyncio.Semaphore,
+                          templated: Optional[dict] = None) -> Optional[LetterGeneration]:
+        """Дополняет row полями письма; возвращает новое письмо или None"""
+        if vacancy.applied:
+            return None  # Отклик уже отправлен - только новая оценка
+
+        if not self.scorer.passes(data['relevance']):
+            stats.low_relevance += 1
+            row.update(processed=True, **NO_LETTER)
+            return None
+        if not self.letters:
+            return None
+
+        try:
+            if templated is not None:
+                generation = templated.get(data['hh_id'])
+            else:
+                async with semaphore:
+                    generation = await self.processor.generate_letter(data)
+        except Exception as e:
+            stats.errors += 1
+            logger.error(f"Ошибка генерации письма для {vacancy.hh_id}: {e}")
+            return None
+
+        if generation is None:
+            stats.not_python += 1
+            row.update(processed=True, **NO_LETTER)
+            return None
+
+        stats.letters += 1
+        row.update(
+            processed=True,
+            cover_letter_generated=True,
+            cover_letter=None if generation.letter_template else generation.text,
+            letter_template=generation.letter_template,
+            cover_letter_generated_at=datetime.utcnow(),
+            letter_source=generation.source,
+            letter_variant=generation.variant or None,
+            llm_prompt_tokens=generation.prompt_tokens,
+            llm_completion_tokens=generation.completion_tokens,
+            llm_cost=generation.cost,
+        )
+        return generation
+
+    async def _enqueue(self, vacancy: Vacancy, data: dict, generation: LetterGeneration) -> bool:
+        expires_at = letter_expires_at(vacancy)
+        if expires_at is not None and expires_at <= time.time():
+            return False  # Письмо устаревшей вакансии в очередь не ставится
+        # Письмо получают аккаунты, которым подходит вакансия (основной - как раньше)
+        return await self.processor.enqueue_for_accounts(data, {
+            'vacancy_id': data['hh_id'],
+            'vacancy_name': data['name'],
+            'company': data['company'],
+            'cover_letter': '' if generation.letter_template else generation.text,
+            'letter_template': generation.letter_template,
+            'url': data['url'],
+            'relevance': data['relevance'],
+            'expires_at': expires_at,
+        })
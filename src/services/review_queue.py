@@ -0,0 +1,158 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+from src.core.circuit_breaker import hh_breaker, STATE_OPEN
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.services.send_scheduler import SendScheduler, OUTCOME_SENT, OUTCOME_REQUEUE, OUTCOME_SKIPPED
+
+logger = get_logger(__name__)
+
+REVIEW_PENDING = "pending"
+REVIEW_APPROVED = "approved"
+REVIEW_REJECTED = "rejected"
+REVIEW_SENT = "sent"
+REVIEW_FAILED = "failed"
+REVIEW_SKIPPED = "skipped"
+REVIEW_EXPIRED = "expired"  # Срок письма истек (см. LetterExpirySweeper)
+
+# Итог планировщика -> статус письма; requeue оставляет письмо одобренным до следующей подачи
+OUTCOME_STATUSES = {
+    OUTCOME_SENT: REVIEW_SENT,
+    OUTCOME_SKIPPED: REVIEW_SKIPPED,
+}
+
+
+def review_row(cover_data: dict) -> Dict:
+    """Строка таблицы letter_reviews из сообщения с письмом"""
+    return {
+        'vacancy_id': str(cover_data['vacancy_id']).strip(),
+        'vacancy_name': cover_data.get('vacancy_name'),
+        'company': cover_data.get('company'),
+        'url': cover_data.get('url'),
+        'relevance': cover_data.get('relevance'),
+        'cover_letter': cover_data.get('cover_letter') or '',
+        'letter_template': cover_data.get('letter_template'),
+        'expires_at': cover_data.get('expires_at'),
+    }
+
+
+def review_cover_data(review) -> dict:
+    """Данные письма для планировщика из строки letter_reviews (текст уже собран)"""
+    return {
+        'vacancy_id': review.vacancy_id,
+        'vacancy_name': review.vacancy_name,
+        'company': review.company,
+        'cover_letter': review.cover_letter or '',
+        'letter_template': None,
+        'url': review.url,
+        'relevance': review.relevance,
+        'expires_at': review.expires_at,
+    }
+
+
+class ReviewQueue:
+    """Проверка писем в интерактивном режиме без блокировки event loop
+
+    Воркер отправки складывает письма в таблицу letter_reviews и подтверждает
+    сообщения; решения приходят из веб-страницы (ReviewServer) или команды
+    main.py review и записываются туда же. Подача читает одобренные письма и
+    ставит их в общий планировщик - не больше capacity одновременно, - так
+    что одобренное пачкой уходит по лимитам, пока проверка продолжается.
+    """
+
+    def __init__(self, scheduler: SendScheduler, database: Optional[Database] = None,
+                 capacity: Optional[int] = None, poll_interval: Optional[float] = None,
+                 prioritize: Optional[Callable[[dict], Awaitable[Optional[float]]]] = None):
+        self.scheduler = scheduler
+        self.database = database or db
+        self.capacity = capacity or settings.SENDER_SCHEDULER_CAPACITY
+        self.poll_interval = settings.REVIEW_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.prioritize = prioritize  # Оценка письма для планировщика (None - по релевантности)
+        self._in_flight: Dict[str, asyncio.Task] = {}  # hh_id -> ожидание итога планировщика
+        # Чтение одобренных и запись итога не пересекаются: иначе письмо, отправленное
+        # во время чтения, попало бы в планировщик второй раз
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    async def add(self, cover_data: dict) -> None:
+        """Ставит письмо на проверку"""
+        await self.database.add_letter_review(review_row(cover_data))
+
+    async def pending(self, limit: Optional[int] = None) -> List:
+        return await self.database.get_letter_reviews((REVIEW_PENDING,), limit)
+
+    async def decide(self, approve: Iterable[str] = (), reject: Iterable[str] = ()) -> Dict[str, int]:
+        """Записывает решения; отклоненное одобренное письмо снимается с планировщика"""
+        approve, reject = list(approve), list(reject)
+        approved = await self.database.set_letter_review_status(
+            approve, REVIEW_APPROVED, from_statuses=(REVIEW_PENDING,)) if approve else 0
+        rejected = await self.database.set_letter_review_status(
+            reject, REVIEW_REJECTED, from_statuses=(REVIEW_PENDING, REVIEW_APPROVED)) if reject else 0
+        for vacancy_id in reject:
+            self.scheduler.cancel(vacancy_id)
+        if approved:
+            self.wake()
+        logger.info(f"Проверка писем: одобрено {approved}, отклонено {rejected}")
+        return {'approved': approved, 'rejected': rejected}
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def feed(self) -> int:
+        """Ставит в планировщик одобренные письма до capacity; число поставленных"""
+        free = self.capacity - len(self._in_flight)
+        # Пока HH ограничивает запросы, письма ждут в БД, а не в планировщике
+        if free <= 0 or hh_breaker.state == STATE_OPEN:
+            return 0
+
+        async with self._lock:
+            approved = await self.database.get_letter_reviews(
+                (REVIEW_APPROVED,), self.capacity + len(self._in_flight))
+            submitted = 0
+            for review in approved:
+                if submitted >= free:
+                    break
+                if review.vacancy_id in self._in_flight:
+                    continue
+                cover_data = review_cover_data(review)
+                priority = await self.prioritize(cover_data) if self.prioritize else None
+                outcome = self.scheduler.submit(cover_data, priority)
+                self._in_flight[review.vacancy_id] = asyncio.create_task(self._track(review.vacancy_id, outcome))
+                submitted += 1
+            return submitted
+
+    async def _track(self, vacancy_id: str, outcome: asyncio.Future) -> None:
+        try:
+            result = await outcome
+        except asyncio.CancelledError:
+            self._in_flight.pop(vacancy_id, None)
+            raise
+        async with self._lock:
+            try:
+                if result != OUTCOME_REQUEUE:
+                    status = OUTCOME_STATUSES.get(result, REVIEW_FAILED)
+                    # Отклоненное во время ожидания письмо остается отклоненным, если не успело уйти
+                    from_statuses = None if status == REVIEW_SENT else (REVIEW_APPROVED,)
+                    await self.database.set_letter_review_status([vacancy_id], status, from_statuses)
+            finally:
+                self._in_flight.pop(vacancy_id, None)
+                self.wake()
+
+    async def run(self) -> None:
+        """Подача одобренных писем: по решению, по итогу отправки и раз в poll_interval"""
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.feed()
+            except Exception as e:
+                logger.error(f"Ошибка подачи одобренных писем: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def get_stats(self) -> Dict:
+        stats = await self.database.get_letter_review_stats()
+        stats['in_scheduler'] = len(self._in_flight)
+        return stats
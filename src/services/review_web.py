@@ -0,0 +1,139 @@
+import html
+from typing import Optional
+from urllib.parse import quote
+from aiohttp import web
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.services.review_queue import ReviewQueue
+
+logger = get_logger(__name__)
+
+PAGE_STYLE = """
+body { font-family: sans-serif; margin: 2em; }
+.letter { border-bottom: 1px solid #ddd; padding: .6em 0; }
+.meta { color: #666; font-size: .9em; }
+pre { white-space: pre-wrap; background: #f6f6f6; padding: .6em; }
+.actions { position: sticky; top: 0; background: #fff; padding: .6em 0; }
+"""
+
+SELECT_ALL_SCRIPT = """
+document.getElementById('all').onchange = function (e) {
+  document.querySelectorAll('input[name=id]').forEach(function (box) { box.checked = e.target.checked; });
+};
+"""
+
+
+class ReviewServer:
+    """Веб-страница проверки писем: список ожидающих, одобрение и отклонение пачкой
+
+    Работает в event loop воркера отправки (aiohttp.web) и только записывает
+    решения через ReviewQueue - отправка идет планировщиком по лимитам.
+    JSON API (/api/reviews, /api/decisions) - для своих клиентов проверки.
+    По умолчанию слушает только localhost; REVIEW_TOKEN закрывает доступ
+    при публикации порта.
+    """
+
+    def __init__(self, review_queue: ReviewQueue, host: Optional[str] = None, port: Optional[int] = None,
+                 token: Optional[str] = None):
+        self.review_queue = review_queue
+        self.host = host or settings.REVIEW_HOST
+        self.port = settings.REVIEW_PORT if port is None else port
+        self.token = settings.REVIEW_TOKEN if token is None else token
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._check_token])
+        app.add_routes([
+            web.get('/', self.index),
+            web.post('/decide', self.decide_form),
+            web.get('/api/reviews', self.api_reviews),
+            web.post('/api/decisions', self.api_decisions),
+        ])
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Проверка писем: http://{self.host}:{self.port}/")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _check_token(self, request: web.Request, handler):
+        if self.token:
+            supplied = request.query.get('token') or request.headers.get('X-Review-Token')
+            if supplied != self.token:
+                raise web.HTTPUnauthorized(text="Нужен REVIEW_TOKEN")
+        return await handler(request)
+
+    def _token_query(self) -> str:
+        return f"?token={quote(self.token)}" if self.token else ""
+
+    async def index(self, request: web.Request) -> web.Response:
+        reviews = await self.review_queue.pending(settings.REVIEW_PAGE_SIZE)
+        stats = await self.review_queue.get_stats()
+        summary = ", ".join(f"{status}: {count}" for status, count in sorted(stats.items()))
+
+        rows = []
+        for review in reviews:
+            relevance = f"{review.relevance:.2f}" if review.relevance is not None else "-"
+            rows.append(
+                f'<div class="letter"><label><input type="checkbox" name="id" '
+                f'value="{html.escape(review.vacancy_id)}"> <b>{html.escape(review.company or "")}</b> - '
+                f'{html.escape(review.vacancy_name or "")}</label>'
+                f'<div class="meta">релевантность {relevance}, '
+                f'<a href="{html.escape(review.url or "")}" target="_blank">вакансия</a>, '
+                f'{len(review.cover_letter or "")} символов</div>'
+                f'<details><summary>Письмо</summary><pre>{html.escape(review.cover_letter or "")}</pre></details>'
+                f'</div>'
+            )
+
+        body = (
+            f'<!doctype html><html><head><meta charset="utf-8"><title>Проверка писем</title>'
+            f'<style>{PAGE_STYLE}</style></head><body>'
+            f'<h1>Письма на проверке: {len(reviews)}</h1><p class="meta">{html.escape(summary)}</p>'
+            f'<form method="post" action="/decide{self._token_query()}">'
+            f'<div class="actions"><label><input type="checkbox" id="all"> все</label> '
+            f'<button name="action" value="approve">Одобрить</button> '
+            f'<button name="action" value="reject">Отклонить</button></div>'
+            f'{"".join(rows) or "<p>Новых писем нет</p>"}</form>'
+            f'<script>{SELECT_ALL_SCRIPT}</script></body></html>'
+        )
+        return web.Response(text=body, content_type='text/html')
+
+    async def decide_form(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        ids = form.getall('id', [])
+        action = form.get('action')
+        if action not in ('approve', 'reject'):
+            raise web.HTTPBadRequest(text="action: approve или reject")
+        await self.review_queue.decide(**{action: ids})
+        raise web.HTTPSeeOther(f"/{self._token_query()}")
+
+    async def api_reviews(self, request: web.Request) -> web.Response:
+        reviews = await self.review_queue.pending(settings.REVIEW_PAGE_SIZE)
+        return web.json_response({
+            'items': [{
+                'vacancy_id': review.vacancy_id,
+                'vacancy_name': review.vacancy_name,
+                'company': review.company,
+                'url': review.url,
+                'relevance': review.relevance,
+                'cover_letter': review.cover_letter,
+            } for review in reviews],
+            'stats': await self.review_queue.get_stats(),
+        })
+
+    async def api_decisions(self, request: web.Request) -> web.Response:
+        """{"approve": [hh_id, ...], "reject": [...]}"""
+        try:
+            data = await request.json()
+            approve = [str(vacancy_id) for vacancy_id in data.get('approve', [])]
+            reject = [str(vacancy_id) for vacancy_id in data.get('reject', [])]
+        except (ValueError, AttributeError, TypeError):
+            raise web.HTTPBadRequest(text="Ожидается JSON {\"approve\": [...], \"reject\": [...]}")
+        return web.json_response(await self.review_queue.decide(approve, reject))
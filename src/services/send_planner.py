@@ -0,0 +1,206 @@
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.services.rate_limiter import RateLimiter, HOUR
+
+logger = get_logger(__name__)
+
+# Письма, которые уже не нужно планировать (решение проверяющего или итог отправки)
+CLOSED_REVIEW_STATUSES = ("rejected", "sent", "failed", "skipped", "expired")
+
+
+class WorkingHours:
+    """Часы, в которые уходят отклики (PLAN_WORK_*), в часовом поясе PLAN_TIMEZONE"""
+
+    def __init__(self, start: Optional[int] = None, end: Optional[int] = None,
+                 days: Optional[List[int]] = None, tz_name: Optional[str] = None):
+        self.start = settings.PLAN_WORK_HOURS_START if start is None else start
+        self.end = settings.PLAN_WORK_HOURS_END if end is None else end
+        self.days = set(settings.PLAN_WORK_DAYS if days is None else days)
+        self.tz = ZoneInfo(tz_name or settings.PLAN_TIMEZONE)
+
+    @property
+    def always_open(self) -> bool:
+        return (self.start <= 0 and self.end >= 24 and self.days >= set(range(7))) or not self.days
+
+    @property
+    def hours_per_day(self) -> float:
+        """Рабочих часов в рабочий день"""
+        return 24.0 if self.always_open else float(max(0, min(self.end, 24) - max(self.start, 0)))
+
+    @property
+    def days_per_week(self) -> int:
+        return 7 if self.always_open else len(self.days & set(range(7)))
+
+    def next_open(self, stamp: float) -> float:
+        """Ближайшее рабочее время (epoch) не раньше stamp"""
+        if self.always_open or math.isinf(stamp):
+            return stamp
+        moment = datetime.fromtimestamp(stamp, self.tz)
+        midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(8):
+            day = midnight + timedelta(days=offset)
+            if day.weekday() not in self.days:
+                continue
+            opens, closes = day + timedelta(hours=self.start), day + timedelta(hours=self.end)
+            if moment < opens:
+                return opens.timestamp()
+            if moment < closes:
+                return stamp
+        return stamp
+
+    def format(self, stamp: float) -> str:
+        return datetime.fromtimestamp(stamp, self.tz).strftime('%a %d.%m %H:%M')
+
+
+@dataclass
+class LetterCandidate:
+    """Письмо, ждущее отправки, с данными для оценки"""
+    vacancy_id: str
+    vacancy_name: str = ''
+    company: str = ''
+    relevance: Optional[float] = None
+    salary_from: Optional[float] = None
+    salary_to: Optional[float] = None
+    salary_currency: Optional[str] = None
+    published: Optional[float] = None  # epoch публикации на HH (или сохранения в БД)
+
+    @classmethod
+    def from_vacancy(cls, vacancy) -> 'LetterCandidate':
+        published = vacancy.published_at or vacancy.created_at
+        return cls(
+            vacancy_id=vacancy.hh_id,
+            vacancy_name=vacancy.name or '',
+            company=vacancy.company or '',
+            relevance=vacancy.relevance_score,
+            salary_from=vacancy.salary_from,
+            salary_to=vacancy.salary_to,
+            salary_currency=vacancy.salary_currency,
+            published=published.replace(tzinfo=timezone.utc).timestamp() if published else None,
+        )
+
+
+@dataclass
+class PlannedSend:
+    at: float  # epoch
+    candidate: LetterCandidate
+    score: float
+    components: Dict[str, float] = field(default_factory=dict)
+
+
+class SendPlanner:
+    """План отправки: какие письма и когда уйдут в пределах лимитов и рабочих часов
+
+    Оценка письма - взвешенная сумма (PLAN_WEIGHTS) четырех частей 0..1:
+    match (релевантность резюме), salary (зарплата к PLAN_SALARY_TARGET),
+    freshness (затухание с полупериодом PLAN_FRESHNESS_HALF_LIFE_HOURS на
+    момент отправки) и employer (сглаженная доля приглашений у работодателя
+    по таблице negotiations). Слоты - будущие моменты, когда лимитер и рабочие
+    часы позволят отправку. Каждый слот стоит одинаково (один отклик бюджета),
+    поэтому рюкзак вырождается в отбор лучших: слоты заполняются по порядку
+    времени письмом с наибольшей оценкой на этот момент. Тем же правилом
+    пользуется планировщик отправителя при SENDER_STRATEGY=plan, так что план
+    исполняется слот за слотом и подстраивается под новые письма.
+    """
+
+    def __init__(self, database: Optional[Database] = None, working_hours: Optional[WorkingHours] = None,
+                 weights: Optional[Dict[str, float]] = None):
+        self.database = database or db
+        self.working_hours = working_hours or WorkingHours()
+        self.weights = weights or settings.PLAN_WEIGHTS
+        self._employers: Dict[str, Tuple[int, int]] = {}  # company -> (откликов, приглашений)
+        self._employers_loaded: Optional[float] = None
+
+    async def load_employers(self) -> None:
+        """Читает историю откликов по работодателям"""
+        self._employers = await self.database.get_employer_response_stats(settings.PLAN_EMPLOYER_POSITIVE_STATES)
+        self._employers_loaded = time.monotonic()
+
+    async def candidates(self) -> List[LetterCandidate]:
+        """Письма, ожидающие отправки (без отклоненных и уже обработанных на проверке)"""
+        closed = {review.vacancy_id for review in await self.database.get_letter_reviews(CLOSED_REVIEW_STATUSES)}
+        return [LetterCandidate.from_vacancy(vacancy) for vacancy in await self.database.get_pending_cover_letters()
+                if vacancy.hh_id not in closed]
+
+    def salary_score(self, candidate: LetterCandidate) -> float:
+        rate = settings.PLAN_CURRENCY_RATES.get((candidate.salary_currency or '').upper())
+        amounts = [amount for amount in (candidate.salary_from, candidate.salary_to) if amount]
+        if not amounts or rate is None:
+            return settings.PLAN_SALARY_UNKNOWN
+        return min(1.0, sum(amounts) / len(amounts) * rate / settings.PLAN_SALARY_TARGET)
+
+    def freshness_score(self, candidate: LetterCandidate, at: float) -> float:
+        if candidate.published is None:
+            return 1.0
+        age_hours = max(0.0, at - candidate.published) / HOUR
+        return 0.5 ** (age_hours / settings.PLAN_FRESHNESS_HALF_LIFE_HOURS)
+
+    def employer_score(self, candidate: LetterCandidate) -> float:
+        total, positive = self._employers.get(candidate.company, (0, 0))
+        prior_weight = settings.PLAN_EMPLOYER_PRIOR_WEIGHT
+        return (positive + settings.PLAN_EMPLOYER_PRIOR * prior_weight) / (total + prior_weight)
+
+    def score(self, candidate: LetterCandidate, at: float) -> Tuple[float, Dict[str, float]]:
+        """Оценка письма при отправке в момент at и ее части"""
+        components = {
+            'match': candidate.relevance or 0.0,
+            'salary': self.salary_score(candidate),
+            'freshness': self.freshness_score(candidate, at),
+            'employer': self.employer_score(candidate),
+        }
+        return sum(self.weights.get(name, 0.0) * value for name, value in components.items()), components
+
+    def slots(self, rate_limiter: RateLimiter, now: float, horizon: float, count: int) -> List[float]:
+        """Моменты отправки в пределах горизонта: лимиты, паузы и рабочие часы"""
+        simulated = rate_limiter.snapshot()
+        end = now + horizon
+        slots = []
+        at = now
+        while len(slots) < count:
+            # Ограничения лимитера - «не раньше момента X», поэтому одного прохода достаточно
+            at = self.working_hours.next_open(simulated.next_slot(at))
+            if at >= end:
+                break
+            slots.append(simulated.record(at))
+        return slots
+
+    def plan(self, candidates: List[LetterCandidate], rate_limiter: RateLimiter, now: Optional[float] = None,
+             horizon_hours: Optional[float] = None) -> List[PlannedSend]:
+        """Жадное распределение писем по слотам в порядке времени"""
+        now = time.time() if now is None else now
+        horizon = (horizon_hours or settings.PLAN_HORIZON_HOURS) * HOUR
+        remaining = list(candidates)
+        planned = []
+        for at in self.slots(rate_limiter, now, horizon, len(remaining)):
+            scored = [self.score(candidate, at) for candidate in remaining]
+            best = max(range(len(remaining)), key=lambda index: scored[index][0])
+            planned.append(PlannedSend(at, remaining.pop(best), *scored[best]))
+        return planned
+
+    async def priority(self, cover_data: dict, now: Optional[float] = None) -> float:
+        """Оценка письма для планировщика отправителя (SENDER_STRATEGY=plan)"""
+        refresh_after = max(settings.NEGOTIATION_SYNC_INTERVAL, 60)
+        if self._employers_loaded is None or time.monotonic() - self._employers_loaded > refresh_after:
+            try:
+                await self.load_employers()
+            except Exception as e:
+                logger.error(f"Ошибка загрузки истории работодателей: {e}")
+                self._employers_loaded = time.monotonic()
+
+        vacancy = await self.database.get_vacancy_by_hh_id(str(cover_data['vacancy_id']).strip())
+        if vacancy is not None:
+            candidate = LetterCandidate.from_vacancy(vacancy)
+        else:
+            candidate = LetterCandidate(vacancy_id=str(cover_data['vacancy_id']), company=cover_data.get('company', ''),
+                                        relevance=cover_data.get('relevance'))
+        return self.score(candidate, time.time() if now is None else now)[0]
+
+
+# Глобальный экземпляр
+send_planner = SendPlanner()
@@ -0,0 +1,220 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from src.core.config import settings
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Итог письма для обработчика сообщения: sent/failed/skipped - подтвердить, requeue - вернуть в очередь
+OUTCOME_SENT = "sent"
+OUTCOME_FAILED = "failed"
+OUTCOME_REQUEUE = "requeue"
+OUTCOME_SKIPPED = "skipped"  # Отправка не нужна (например, отклик уже есть) - подтвердить
+
+SendCallback = Callable[[dict], Awaitable[str]]
+ValidateCallback = Callable[[List[str]], Awaitable[Set[str]]]  # hh_id -> закрытые из них
+WindowCallback = Callable[[float], float]  # момент -> ближайший разрешенный не раньше него
+TurnCallback = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class ScheduledLetter:
+    vacancy_id: str
+    cover_data: dict
+    priority: float
+    received: float
+    outcome: asyncio.Future = field(repr=False)
+
+
+class SendScheduler:
+    """Письма ждут слота лимитера в куче по приоритету (релевантности)
+
+    Сообщение остается неподтвержденным, пока письмо в куче: при падении
+    процесса брокер доставит его снова. Диспетчер просыпается один раз - к
+    ближайшему слоту лимитера или по новому письму - и отправляет лучшее из
+    ожидающих. Письмо, ждущее дольше max_hold, возвращается в очередь:
+    RabbitMQ закрывает канал, если сообщение не подтверждено дольше
+    consumer_timeout (по умолчанию 30 минут).
+
+    validate, если задан, проверяет вакансии lookahead ближайших писем, пока
+    слот не открылся, и каждое письмо перед отправкой: письма закрытых
+    вакансий подтверждаются без отправки и не занимают слот.
+
+    not_before, если задан, сдвигает слот лимитера в разрешенное время
+    (рабочие часы плана отправки, WorkingHours.next_open).
+
+    wait_turn, если задан, ожидается перед каждой отправкой: очередь общего
+    канала отправки нескольких аккаунтов (FairShare.turn).
+    """
+
+    def __init__(self, rate_limiter, send: SendCallback, max_hold: Optional[float] = None,
+                 validate: Optional[ValidateCallback] = None, lookahead: Optional[int] = None,
+                 not_before: Optional[WindowCallback] = None, wait_turn: Optional[TurnCallback] = None):
+        self.rate_limiter = rate_limiter
+        self.send = send
+        self.max_hold = settings.SENDER_MAX_HOLD if max_hold is None else max_hold
+        self.validate = validate
+        self.lookahead = settings.SENDER_LIVENESS_LOOKAHEAD if lookahead is None else lookahead
+        self.not_before = not_before
+        self.wait_turn = wait_turn
+        self._heap: List[Tuple[float, int, ScheduledLetter]] = []
+        self._items: Dict[str, ScheduledLetter] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.sent = self.failed = self.requeued = self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def submit(self, cover_data: dict, priority: Optional[float] = None) -> asyncio.Future:
+        """Ставит письмо в кучу; future завершается итогом OUTCOME_*
+
+        priority - оценка письма (по умолчанию релевантность), больше - раньше
+        """
+        vacancy_id = str(cover_data['vacancy_id']).strip()
+        previous = self._items.get(vacancy_id)
+        if previous is not None:
+            # Повторная доставка того же письма: ждет новая копия, старая подтверждается
+            self._settle(previous, OUTCOME_FAILED)
+
+        item = ScheduledLetter(
+            vacancy_id=vacancy_id,
+            cover_data=cover_data,
+            priority=priority if priority is not None else cover_data.get('relevance') or 0.0,
+            received=time.time(),
+            outcome=asyncio.get_running_loop().create_future(),
+        )
+        self._items[vacancy_id] = item
+        heapq.heappush(self._heap, (-item.priority, next(self._seq), item))
+        self._wakeup.set()
+        return item.outcome
+
+    def _settle(self, item: ScheduledLetter, outcome: str) -> None:
+        # Из кучи запись удаляется лениво: _pop_best пропускает завершенные
+        if self._items.get(item.vacancy_id) is item:
+            del self._items[item.vacancy_id]
+        if not item.outcome.done():
+            item.outcome.set_result(outcome)
+
+    def _pop_best(self) -> Optional[ScheduledLetter]:
+        while self._heap:
+            _, _, item = heapq.heappop(self._heap)
+            if not item.outcome.done():
+                return item
+        return None
+
+    def _expire(self, now: float) -> Optional[float]:
+        """Возвращает в очередь письма старше max_hold; время ближайшего истечения"""
+        nearest = None
+        for item in list(self._items.values()):
+            deadline = item.received + self.max_hold
+            if deadline <= now:
+                logger.info(f"Письмо {item.vacancy_id} ждет слота дольше {self.max_hold:.0f} с - возврат в очередь")
+                self.requeued += 1
+                self._settle(item, OUTCOME_REQUEUE)
+            elif nearest is None or deadline < nearest:
+                nearest = deadline
+        return nearest
+
+    async def run(self) -> None:
+        """Диспетчер: отправляет лучшее письмо в каждый открывшийся слот"""
+        while True:
+            # Сброс до первого await: письмо, пришедшее во время отправки или проверки,
+            # снова разбудит цикл
+            self._wakeup.clear()
+            now = time.time()
+            wake = self._expire(now) if self.max_hold else None
+
+            if self._items:
+                await self.rate_limiter.refresh()
+                slot = self.rate_limiter.next_slot(now)
+                if self.not_before is not None:
+                    slot = self.not_before(slot)
+                if slot <= now:
+                    item = self._pop_best()
+                    if item is not None:
+                        await self._dispatch(item)
+                        continue
+                # Пока слот не открылся, отсеиваем закрытые вакансии среди ближайших писем
+                elif await self._drop_closed(self._upcoming()):
+                    continue
+                # Нулевой лимит (slot = inf): письма ждут только истечения max_hold
+                if not math.isinf(slot):
+                    wake = slot if wake is None else min(wake, slot)
+
+            timeout = None if wake is None else max(0.0, wake - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _upcoming(self) -> List[ScheduledLetter]:
+        """Письма, которые уйдут следующими при нынешнем содержимом кучи"""
+        if not self.lookahead:
+            return []
+        waiting = (entry for entry in self._heap if not entry[2].outcome.done())
+        return [item for _, _, item in heapq.nsmallest(self.lookahead, waiting)]
+
+    async def _drop_closed(self, items: List[ScheduledLetter]) -> bool:
+        """Подтверждает без отправки письма закрытых вакансий; True - такие были"""
+        if self.validate is None or not items:
+            return False
+        try:
+            closed = await self.validate([item.vacancy_id for item in items])
+        except Exception as e:
+            logger.error(f"Ошибка проверки вакансий перед отправкой: {e}")
+            return False
+
+        dropped = False
+        for item in items:
+            if item.vacancy_id in closed and not item.outcome.done():
+                self.skipped += 1
+                self._settle(item, OUTCOME_SKIPPED)
+                dropped = True
+        return dropped
+
+    async def _dispatch(self, item: ScheduledLetter) -> None:
+        if self.lookahead and await self._drop_closed([item]):
+            return
+        if self.wait_turn is not None:
+            await self.wait_turn()
+            if item.outcome.done():
+                return  # Пока ждали хода, письмо вернули в очередь (close)
+        # Письмо уже не в куче: новая доставка того же письма встанет в очередь заново
+        if self._items.get(item.vacancy_id) is item:
+            del self._items[item.vacancy_id]
+        try:
+            outcome = await self.send(item.cover_data)
+        except Exception as e:
+            logger.error(f"Ошибка отправки письма {item.vacancy_id}: {e}")
+            outcome = OUTCOME_FAILED
+
+        if outcome == OUTCOME_SENT:
+            self.sent += 1
+        elif outcome == OUTCOME_REQUEUE:
+            self.requeued += 1
+        elif outcome == OUTCOME_SKIPPED:
+            self.skipped += 1
+        else:
+            self.failed += 1
+        self._settle(item, outcome)
+
+    def cancel(self, vacancy_id: str) -> bool:
+        """Снимает ожидающее письмо без отправки (итог skipped); False - письма нет в куче"""
+        item = self._items.get(str(vacancy_id).strip())
+        if item is None:
+            return False
+        self.skipped += 1
+        self._settle(item, OUTCOME_SKIPPED)
+        return True
+
+    def close(self) -> None:
+        """Возвращает в очередь все ожидающие письма (остановка воркера)"""
+        for item in list(self._items.values()):
+            self._settle(item, OUTCOME_REQUEUE)
+        self._heap.clear()
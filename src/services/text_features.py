@@ -0,0 +1,119 @@
+"""CPU-ядра обработки текста вакансий
+
+Модуль намеренно не импортирует БД и брокер: функции отсюда выполняются
+в процессах пула (cpu_pool) и должны импортироваться быстро и без побочных эффектов.
+"""
+
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+from src.core.config import settings
+from src.core.text import html_to_text, text_hash, tokenize
+
+# Параметры хеш-функций MinHash: при смене сохраненные в БД сигнатуры станут несовместимы
+MINHASH_SEED = 20240601
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def vacancy_text(vacancy_data: dict) -> str:
+    """Текст вакансии для скоринга: название, навыки и описание"""
+    return ' '.join((vacancy_data.get('name') or '', vacancy_data.get('skills') or '',
+                     vacancy_data.get('description') or ''))
+
+
+def near_duplicate_text(vacancy_data: dict) -> str:
+    """Текст для поиска перепубликаций: название и описание (компания не входит - агентства)"""
+    return f"{vacancy_data.get('name') or ''} {vacancy_data.get('description') or ''}"
+
+
+def hash_terms(tokens: List[str], hash_bits: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Уникальные корзины термов (crc32 mod 2^hash_bits) и их частоты в документе"""
+    mask = (1 << hash_bits) - 1
+    buckets = np.fromiter((zlib.crc32(token.encode('utf-8')) & mask for token in tokens),
+                          dtype=np.int64, count=len(tokens))
+    return np.unique(buckets, return_counts=True)
+
+
+def shingles(text: str, size: Optional[int] = None) -> np.ndarray:
+    """Хеши словесных шинглов нормализованного текста (без HTML, нижний регистр)"""
+    return shingle_hashes(tokenize(text), size)
+
+
+def shingle_hashes(words: List[str], size: Optional[int] = None) -> np.ndarray:
+    """Хеши шинглов по готовому списку токенов"""
+    size = size or settings.NEAR_DUP_SHINGLE_SIZE
+    if len(words) < size:
+        grams = words
+    else:
+        grams = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams),
+                                 dtype=np.int64, count=len(grams)))
+
+
+class MinHasher:
+    """MinHash-сигнатуры на семействе хешей (a*x + b) mod p"""
+
+    def __init__(self, num_perm: Optional[int] = None):
+        self.num_perm = num_perm or settings.NEAR_DUP_NUM_PERM
+        rng = np.random.default_rng(MINHASH_SEED)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Сигнатура текста или None, если в тексте нет слов"""
+        return self.signature_of_tokens(tokenize(text))
+
+    def signature_of_tokens(self, words: List[str]) -> Optional[np.ndarray]:
+        """Сигнатура по готовому списку токенов"""
+        hashes = shingle_hashes(words) & MERSENNE_PRIME  # 31 бит: a*x помещается в int64
+        if not len(hashes):
+            return None
+        values = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME
+        return values.min(axis=1).astype(np.uint32)
+
+
+@dataclass
+class VacancyFeatures:
+    """Компактный результат CPU-обработки вакансии (передается между процессами)"""
+    term_buckets: np.ndarray  # корзины термов для TF-IDF
+    term_counts: np.ndarray
+    minhash: Optional[np.ndarray]  # сигнатура перепубликаций, None - в тексте нет слов
+    description: str = ''  # описание обычным текстом (без HTML)
+    search_text: str = ''  # токены названия, навыков и описания через пробел
+    text_hash: str = ''
+
+
+_hasher: Optional[MinHasher] = None
+
+
+def compute_vacancy_features(vacancies: List[dict]) -> List[VacancyFeatures]:
+    """Признаки пачки вакансий: нормализованный текст, хешированные термы и MinHash-сигнатура
+
+    Описание на входе - HTML от HH (или уже обычный текст). Токенизация
+    выполняется один раз, термы и шинглы строятся из одних и тех же токенов.
+    """
+    global _hasher
+    if _hasher is None or _hasher.num_perm != settings.NEAR_DUP_NUM_PERM:
+        _hasher = MinHasher()
+
+    features = []
+    for vacancy_data in vacancies:
+        description = html_to_text(vacancy_data.get('description') or '')
+        name_tokens = tokenize(vacancy_data.get('name') or '')
+        skill_tokens = tokenize(vacancy_data.get('skills') or '')
+        description_tokens = tokenize(description)
+
+        # Порядок как в vacancy_text и near_duplicate_text
+        tokens = name_tokens + skill_tokens + description_tokens
+        search_text = ' '.join(tokens)
+        buckets, counts = hash_terms(tokens, settings.RELEVANCE_HASH_BITS)
+        features.append(VacancyFeatures(
+            term_buckets=buckets.astype(np.int32),
+            term_counts=counts.astype(np.int32),
+            minhash=_hasher.signature_of_tokens(name_tokens + description_tokens),
+            description=description,
+            search_text=search_text,
+            text_hash=text_hash(search_text),
+        ))
+    return features
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+from src.core.database import db, Database
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.api.hh_client import HHClient
+
+logger = get_logger(__name__)
+
+
+class VacancyLiveness:
+    """Проверка перед отправкой: вакансия еще открыта на HH
+
+    Письма ждут слота часами, а вакансии за это время уходят в архив - такой
+    отклик тратит слот лимита и возвращает ошибку. Состояние берется из
+    карточки вакансии (/vacancies/{id}), запросы для пачки идут параллельно в
+    пределах MAX_CONCURRENT_REQUESTS, ответы кэшируются на LIVENESS_CACHE_TTL.
+    Закрытые вакансии помечаются в БД (vacancies.archived_at).
+    """
+
+    def __init__(self, client: Optional[HHClient] = None, database: Optional[Database] = None,
+                 ttl: Optional[float] = None):
+        self.client = client or HHClient()
+        self.database = database or db
+        self.ttl = settings.LIVENESS_CACHE_TTL if ttl is None else ttl
+        self._cache: Dict[str, Tuple[bool, float]] = {}  # hh_id -> (открыта, время проверки)
+
+    def _cached(self, vacancy_id: str, now: float) -> Optional[bool]:
+        entry = self._cache.get(vacancy_id)
+        if entry is None or now - entry[1] >= self.ttl:
+            return None
+        return entry[0]
+
+    def _prune(self, now: float) -> None:
+        if len(self._cache) > settings.LIVENESS_CACHE_SIZE:
+            self._cache = {key: entry for key, entry in self._cache.items() if now - entry[1] < self.ttl}
+
+    async def find_closed(self, vacancy_ids: Iterable[str]) -> Set[str]:
+        """hh_id закрытых вакансий из пачки; при ошибке запроса вакансия считается открытой"""
+        now = time.monotonic()
+        vacancy_ids = list(dict.fromkeys(str(vacancy_id).strip() for vacancy_id in vacancy_ids))
+        unknown = [vacancy_id for vacancy_id in vacancy_ids if self._cached(vacancy_id, now) is None]
+
+        newly_closed = []
+        if unknown:
+            states = await asyncio.gather(*(self.client.get_vacancy_state(vacancy_id) for vacancy_id in unknown))
+            for vacancy_id, alive in zip(unknown, states):
+                if alive is None:
+                    continue  # Не кэшируем: проверим снова перед следующим слотом
+                self._cache[vacancy_id] = (alive, now)
+                if not alive:
+                    newly_closed.append(vacancy_id)
+            self._prune(now)
+
+        if newly_closed:
+            marked = await self.database.mark_vacancies_archived(newly_closed)
+            logger.info(f"Вакансии закрыты на HH, письма не будут отправлены: {', '.join(newly_closed)} "
+                        f"(помечено в БД: {marked})")
+        return {vacancy_id for vacancy_id in vacancy_ids if self._cached(vacancy_id, now) is False}
+
+
+# Глобальный экземпляр
+vacancy_liveness = VacancyLiveness()
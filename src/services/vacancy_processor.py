@@ -1,31 +1,75 @@
+import asyncio
+from typing import Dict, Optional
+from src.core.accounts import accounts
 from src.core.database import db
-from src.api.deepseek_client import DeepSeekClient
-from src.services.queue_manager import RabbitMQManager
+from src.api.deepseek_client import DeepSeekClient, LetterGeneration, SOURCE_LLM
+from src.services.letter_batcher import LetterBatcher
+from src.services.letter_cache import LetterCache, SOURCE_CACHE, vacancy_fingerprint
+from src.services.queue_manager import create_queue_manager
+from src.services.letter_expiry import letter_expiry_sweeper, letter_expires_at, is_expired
 from src.core.logger import get_logger
 
 logger = get_logger(__name__)
 
+
 class VacancyProcessor:
     def __init__(self):
         self.deepseek = DeepSeekClient()
-        self.rabbitmq = RabbitMQManager()
+        self.queue_manager = create_queue_manager()
+        self.letter_cache = LetterCache()
+        self.batcher = LetterBatcher(self.deepseek)
+        # Генерации в процессе: одинаковые вакансии, пришедшие параллельно, ждут одну генерацию
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def generate_letter(self, vacancy_data) -> Optional[LetterGeneration]:
+        """Письмо из кэша по отпечатку вакансии, иначе - генерация (LLM или шаблон)"""
+        cached = self.letter_cache.get(vacancy_data)
+        if cached is not None:
+            logger.info(f"Письмо из кэша: {vacancy_data['name']}")
+            return LetterGeneration(text=cached, source=SOURCE_CACHE)
+
+        key = vacancy_fingerprint(vacancy_data)
+        pending = self._pending.get(key)
+        if pending is not None:
+            await asyncio.shield(pending)
+            cached = self.letter_cache.get(vacancy_data)
+            if cached is not None:
+                return LetterGeneration(text=cached, source=SOURCE_CACHE)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            # Промахи кэша копятся в пакеты: один запрос к LLM на несколько вакансий
+            generation = await self.batcher.submit(vacancy_data)
+            # Шаблонные письма дешевы - кэшируем только ответы LLM
+            if generation is not None and generation.source == SOURCE_LLM:
+                self.letter_cache.put(vacancy_data, generation.text)
+            future.set_result(generation)
+            return generation
+        except BaseException:
+            future.set_result(None)
+            raise
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
 
     async def process_vacancy(self, vacancy_data):
         """Обрабатывает вакансию: генерирует письмо и отправляет в очередь"""
         logger.info(f"Обработка: {vacancy_data['name']}")
 
-        # Генерируем сопроводительное письмо
-        cover_letter = await self.deepseek.generate_cover_letter(vacancy_data)
+        # Генерируем сопроводительное письмо (LLM, при сбое - шаблон)
+        generation = await self.generate_letter(vacancy_data)
 
-        if cover_letter:
-            logger.info("Письмо сгенерировано")
+        if generation:
+            cover_letter = generation.text
+            logger.info(f"Письмо сгенерировано ({generation.source})")
 
             # Находим вакансию в БД
             vacancy = await db.get_vacancy_by_hh_id(vacancy_data['hh_id'])
 
             if vacancy:
                 # Сохраняем письмо в БД
-                success = await db.mark_cover_letter_generated(vacancy.id, cover_letter)
+                success = await db.mark_cover_letter_generated(vacancy.id, cover_letter, generation)
 
                 if success:
                     logger.info(f"Письмо сохранено: {vacancy_data['name']}")
@@ -35,16 +79,21 @@ class VacancyProcessor:
                         'vacancy_id': vacancy_data['hh_id'],
                         'vacancy_name': vacancy_data['name'],
                         'company': vacancy_data['company'],
-                        'cover_letter': cover_letter,
-                        'url': vacancy_data['url']
+                        # Шаблонное письмо идет ссылкой и рендерится при отправке
+                        'cover_letter': '' if generation.letter_template else cover_letter,
+                        'letter_template': generation.letter_template,
+                        'url': vacancy_data['url'],
+                        'relevance': vacancy_data.get('relevance'),
+                        # Срок письма по возрасту вакансии: позже оно в очереди не нужно (TTL сообщения)
+                        'expires_at': letter_expires_at(vacancy)
                     }
 
-                    if await self.rabbitmq.send_cover_letter_to_queue(cover_data):
-                        logger.info("Письмо в очереди отправки")
-                        return True
-                    else:
-                        logger.error("Ошибка отправки в очередь")
+                    if is_expired(cover_data):
+                        logger.info(f"Вакансия {vacancy_data['hh_id']} опубликована слишком давно, письмо не ставится в очередь")
+                        await letter_expiry_sweeper.mark([vacancy_data['hh_id']])
                         return False
+
+                    return await self.enqueue_for_accounts(vacancy_data, cover_data)
                 else:
                     logger.error("Ошибка сохранения письма")
                     return False
@@ -55,5 +104,30 @@ class VacancyProcessor:
             logger.info("Пропуск: не Python-вакансия")
             return False
 
+    async def enqueue_for_accounts(self, vacancy_data: dict, cover_data: dict) -> bool:
+        """Ставит письмо в очереди отправки аккаунтов, которым подходит вакансия
+
+        Письмо общее: подпись и контакты аккаунта подставляются при отправке.
+        """
+        targets = accounts.matching(vacancy_data)
+        if not targets:
+            logger.info(f"Вакансия не подходит ни одному аккаунту: {vacancy_data['name']}")
+            return True
+
+        queued = 0
+        for account in targets:
+            if not account.is_default:
+                await db.add_account_letters(account.id, [cover_data['vacancy_id']])
+            if await self.queue_manager.send_cover_letter_to_queue({**cover_data, 'account_id': account.ledger_id}):
+                queued += 1
+            else:
+                logger.error(f"Ошибка отправки в очередь аккаунта {account.id}")
+
+        if queued < len(targets):
+            return False
+        logger.info(f"Письмо в очереди отправки: {', '.join(account.id for account in targets)}")
+        return True
+
+
 # Глобальный экземпляр
 vacancy_processor = VacancyProcessor()
@@ -1,8 +1,13 @@
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from src.api.hh_client import HHClient
 from src.core.database import db
-from src.services.queue_manager import RabbitMQManager
+from src.core.config import settings
+from src.services.queue_manager import create_queue_manager
+from src.services.relevance import relevance_scorer
+from src.services.near_duplicates import near_duplicate_index
+from src.services.cpu_pool import cpu_pool
+from src.services.text_features import VacancyFeatures, compute_vacancy_features
 from src.core.logger import get_logger
 
 logger = get_logger(__name__)
@@ -13,7 +18,8 @@ class VacancySearcher:
 
     def __init__(self):
         self.hh_client = HHClient()
-        self.rabbitmq = RabbitMQManager()
+        self.queue_manager = create_queue_manager()
+        self._tables_ready = False
 
     async def search_and_process_vacancies(self, search_params: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -49,14 +55,14 @@ class VacancySearcher:
         except Exception as e:
             logger.error(f"Ошибка в процессе поиска вакансий: {e}")
             return {"success": False, "error": str(e)}
-        finally:
-            await self.rabbitmq.close()
 
     async def _initialize_services(self) -> None:
-        """Инициализация всех необходимых сервисов"""
-        await db.create_tables()
-        if not await self.rabbitmq.connect():
-            raise Exception("Не удалось подключиться к RabbitMQ")
+        """Инициализация сервисов: соединение с брокером общее и живет между циклами поиска"""
+        if not self._tables_ready:
+            await db.create_tables()
+            self._tables_ready = True
+        if not await self.queue_manager.ensure_connection():
+            raise Exception("Не удалось подключиться к брокеру очередей")
 
     async def _get_complete_vacancies_data(self, vacancy_items: List[Dict]) -> List[Dict]:
         """Получение полных данных вакансий"""
@@ -68,31 +74,51 @@ class VacancySearcher:
         return vacancies_data
 
     async def _process_vacancies_list(self, vacancies_data: List[Dict]) -> Dict[str, Any]:
-        """Обработка списка вакансий: сохранение и отправка в очередь"""
+        """Обработка списка вакансий: сохранение, оценка релевантности и отправка в очередь"""
         stats = {
             "total_found": len(vacancies_data),
             "new_saved": 0,
             "duplicates": 0,
+            "near_duplicates": 0,
+            "low_relevance": 0,
             "sent_to_queue": 0,
             "errors": 0
         }
 
-        for vacancy_data in vacancies_data:
+        # Нормализация HTML, токенизация, хеширование термов и MinHash страницы - в пуле процессов
+        features = await cpu_pool.map(compute_vacancy_features, [
+            {key: vacancy_data.get(key) for key in ('name', 'skills', 'description')}
+            for vacancy_data in vacancies_data
+        ])
+        for vacancy_data, vacancy_features in zip(vacancies_data, features):
+            self._apply_normalized_text(vacancy_data, vacancy_features)
+
+        new_vacancies = []
+        new_features = []
+        for vacancy_data, vacancy_features in zip(vacancies_data, features):
             try:
-                # Сохраняем вакансию в БД
-                vacancy = await db.save_vacancy(vacancy_data)
+                # Перепубликация под новым hh_id: сохраняем с пометкой, без письма
+                signature, duplicate_of = await near_duplicate_index.check(
+                    vacancy_data, vacancy_features.minhash, precomputed=True
+                )
 
-                if vacancy:
+                # Сохраняем вакансию в БД
+                vacancy = await db.save_vacancy(
+                    vacancy_data,
+                    minhash=signature.tobytes() if signature is not None else None,
+                    duplicate_of=duplicate_of,
+                )
+
+                if vacancy and signature is not None:
+                    near_duplicate_index.add(vacancy_data['hh_id'], signature)
+
+                if vacancy and duplicate_of:
+                    stats["near_duplicates"] += 1
+                elif vacancy:
                     stats["new_saved"] += 1
                     logger.info(f"Новая вакансия: {vacancy_data['name']}")
-
-                    # Отправляем в очередь на обработку
-                    if await self.rabbitmq.send_vacancy_to_queue(vacancy_data):
-                        stats["sent_to_queue"] += 1
-                        logger.debug(f"Отправлена в очередь: {vacancy_data['name']}")
-                    else:
-                        stats["errors"] += 1
-                        logger.error(f"Ошибка отправки в очередь: {vacancy_data['name']}")
+                    new_vacancies.append(vacancy_data)
+                    new_features.append(vacancy_features)
                 else:
                     stats["duplicates"] += 1
                     logger.debug(f"Дубликат: {vacancy_data['name']}")
@@ -101,16 +127,66 @@ class VacancySearcher:
                 stats["errors"] += 1
                 logger.error(f"Ошибка обработки вакансии {vacancy_data['name']}: {e}")
 
+        # Оцениваем новые вакансии страницы одним пакетом
+        await self._score_relevance(new_vacancies, new_features)
+
+        for vacancy_data in new_vacancies:
+            if not relevance_scorer.passes(vacancy_data.get('relevance')):
+                stats["low_relevance"] += 1
+                logger.info(f"Низкая релевантность ({vacancy_data['relevance']:.3f}), без письма: {vacancy_data['name']}")
+                continue
+
+            # Отправляем в очередь на обработку
+            if await self.queue_manager.send_vacancy_to_queue(vacancy_data):
+                stats["sent_to_queue"] += 1
+                logger.debug(f"Отправлена в очередь: {vacancy_data['name']}")
+            else:
+                stats["errors"] += 1
+                logger.error(f"Ошибка отправки в очередь: {vacancy_data['name']}")
+
         # Логируем итоговую статистику
         self._log_processing_stats(stats)
         return {"success": True, "stats": stats}
 
+    @staticmethod
+    def _apply_normalized_text(vacancy_data: Dict, features: VacancyFeatures) -> None:
+        """Описание обычным текстом, исходный HTML и токены - в данные вакансии для БД и очереди"""
+        vacancy_data['description_html'] = vacancy_data.get('description')
+        vacancy_data['description'] = features.description
+        vacancy_data['search_text'] = features.search_text
+        vacancy_data['text_hash'] = features.text_hash
+
+    async def _score_relevance(self, vacancies: List[Dict],
+                               features: Optional[List[VacancyFeatures]] = None) -> None:
+        """Проставляет vacancy_data['relevance'] и сохраняет оценки; при ошибке вакансии идут без отсечения"""
+        if not vacancies:
+            return
+
+        try:
+            scores = await relevance_scorer.score_page(vacancies, features=features)
+        except Exception as e:
+            logger.error(f"Ошибка оценки релевантности: {e}")
+            return
+
+        gated_out = set()
+        for vacancy_data, score in zip(vacancies, scores):
+            vacancy_data['relevance'] = score
+            if not relevance_scorer.passes(score):
+                gated_out.add(vacancy_data['hh_id'])
+
+        await db.save_relevance_scores(
+            {vacancy_data['hh_id']: vacancy_data['relevance'] for vacancy_data in vacancies},
+            gated_out,
+        )
+
     def _log_processing_stats(self, stats: Dict[str, Any]) -> None:
         """Логирование статистики обработки"""
         logger.info("СТАТИСТИКА ОБРАБОТКИ ВАКАНСИЙ:")
         logger.info(f"  Всего найдено: {stats['total_found']}")
         logger.info(f"   Новых сохранено: {stats['new_saved']}")
         logger.info(f"   Дубликатов: {stats['duplicates']}")
+        logger.info(f"   Перепубликаций: {stats['near_duplicates']}")
+        logger.info(f"   Низкая релевантность: {stats['low_relevance']}")
         logger.info(f"   Отправлено в очередь: {stats['sent_to_queue']}")
         logger.info(f"   Ошибок: {stats['errors']}")
 
@@ -123,12 +199,11 @@ class VacancySearcher:
             await db.create_tables()
             logger.info("База данных: OK")
 
-            # Тест RabbitMQ
-            if await self.rabbitmq.connect():
-                await self.rabbitmq.close()
-                logger.info("RabbitMQ: OK")
+            # Тест брокера очередей
+            if await self.queue_manager.connect() and await self.queue_manager.health_check():
+                logger.info(f"Очереди ({settings.QUEUE_BACKEND}): OK")
             else:
-                logger.error("RabbitMQ: FAILED")
+                logger.error(f"Очереди ({settings.QUEUE_BACKEND}): FAILED")
                 return False
 
             # Тест HH API
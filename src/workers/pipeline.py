@@ -0,0 +1,85 @@
+import asyncio
+from src.core.config import settings
+from src.core.accounts import accounts
+from src.core.database import db
+from src.core.logger import get_logger
+from src.services.queue_manager import QueueManager, QUEUE_BACKENDS, create_queue_manager, enable_in_process_pipeline
+from src.services.letter_expiry import letter_expires_at
+
+logger = get_logger(__name__)
+
+
+async def restore_pending_messages(queue_manager: QueueManager) -> None:
+    """Заново ставит в in-process очереди то, что не успели обработать до остановки
+
+    asyncio.Queue не переживает рестарт, а строки в БД к этому моменту уже есть:
+    без восстановления такие вакансии поиск считал бы дубликатами и терял.
+    """
+    unprocessed = await db.get_unprocessed_vacancies()
+    for vacancy in unprocessed:
+        await queue_manager.send_vacancy_to_queue({
+            'hh_id': vacancy.hh_id,
+            'name': vacancy.name,
+            'company': vacancy.company,
+            'salary_from': vacancy.salary_from,
+            'salary_to': vacancy.salary_to,
+            'salary_currency': vacancy.salary_currency,
+            'experience': vacancy.experience,
+            'employment': vacancy.employment,
+            'description': vacancy.description or '',
+            'skills': vacancy.skills or '',
+            'url': vacancy.url,
+            'relevance': vacancy.relevance_score,
+            'search_text': vacancy.search_text or ''
+        })
+
+    # Письма основного аккаунта - по vacancies, дополнительных - по account_letters
+    pending_letters = []
+    if accounts.has_default():
+        pending_letters = [(None, vacancy) for vacancy in await db.get_pending_cover_letters()]
+    pending_letters += [(account_id, vacancy) for account_id, vacancy in await db.get_pending_account_letters()
+                        if accounts.get(account_id) is not None]
+    for account_id, vacancy in pending_letters:
+        await queue_manager.send_cover_letter_to_queue({
+            'vacancy_id': vacancy.hh_id,
+            'vacancy_name': vacancy.name,
+            'company': vacancy.company,
+            'cover_letter': vacancy.cover_letter or '',
+            'letter_template': vacancy.letter_template,
+            'url': vacancy.url,
+            'relevance': vacancy.relevance_score,
+            'expires_at': letter_expires_at(vacancy),
+            'account_id': account_id
+        })
+
+    logger.info(f"Восстановлено из БД: {len(unprocessed)} вакансий, {len(pending_letters)} писем")
+
+
+async def run_pipeline():
+    """Запускает поиск, обработку и отправку в одном event loop"""
+    if settings.QUEUE_BACKEND not in QUEUE_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд очередей: {settings.QUEUE_BACKEND}")
+
+    if settings.QUEUE_BACKEND == "memory":
+        enable_in_process_pipeline()
+
+    # Импорт после выбора бэкенда: глобальные сервисы создают менеджер очередей при импорте
+    from src.workers.search_worker import search_worker
+    from src.workers.vacancy_worker import main as vacancy_main
+    from src.workers.sender_worker import main as sender_main
+
+    logger.info(f"Запуск всего пайплайна в одном процессе (очереди: {settings.QUEUE_BACKEND})")
+    await db.create_tables()
+
+    if settings.QUEUE_BACKEND == "memory":
+        await restore_pending_messages(create_queue_manager())
+
+    await asyncio.gather(
+        vacancy_main(),
+        sender_main(),
+        search_worker(),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(run_pipeline())
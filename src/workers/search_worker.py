@@ -1,6 +1,13 @@
 import asyncio
 import time
 from src.services.vacancy_searcher import search_new_vacancies
+from src.services.queue_manager import create_queue_manager
+from src.services.amqp_pool import amqp_pool
+from src.services.cpu_pool import cpu_pool
+from src.services.backpressure import BackpressureController
+from src.services.breaker_monitor import BreakerMonitor
+from src.core.circuit_breaker import hh_breaker, STATE_OPEN
+from src.core.database import db
 from src.core.config import settings
 from src.core.logger import get_logger
 
@@ -11,29 +18,59 @@ async def search_worker():
     """Воркер для периодического поиска вакансий"""
     logger.info("Запуск поискового воркера...")
 
+    backpressure = BackpressureController()
+    await db.create_tables()
+    BreakerMonitor("search").attach()
+
+    # Менеджер для чтения глубины очередей (соединение с брокером общее на процесс)
+    queue_manager = create_queue_manager()
+    await queue_manager.connect()
+
+    try:
+        await _search_loop(queue_manager, backpressure)
+    finally:
+        await queue_manager.close()
+        await amqp_pool.close()
+        cpu_pool.shutdown()
+
+
+async def _search_loop(queue_manager, backpressure: BackpressureController):
     search_count = 0
 
     while True:
-        try:
-            search_count += 1
-            logger.info(f"Запуск поиска #{search_count}...")
+        if hh_breaker.state == STATE_OPEN:
+            # HH ответил 429/капчей: запросы поиска только продлили бы блокировку
+            wait_time = min(hh_breaker.remaining(), settings.SEARCH_INTERVAL)
+            logger.warning(f"Поиск приостановлен предохранителем HH на {wait_time:.0f} с")
+            await asyncio.sleep(wait_time)
+            continue
+
+        decision = backpressure.evaluate(await queue_manager.get_queue_details())
+
+        if not decision.search_allowed:
+            # Нижние стадии не успевают - не тратим квоту HH на вакансии, которые протухнут в очереди
+            logger.warning(f"Поиск приостановлен: {decision.reason}")
+        else:
+            try:
+                search_count += 1
+                logger.info(f"Запуск поиска #{search_count} (per_page={decision.per_page}, режим: {decision.state})...")
 
-            result = await search_new_vacancies()
+                result = await search_new_vacancies({"per_page": decision.per_page})
 
-            if result.get('success'):
-                stats = result.get('stats', {})
-                logger.info(
-                    f"Поиск #{search_count} завершен. Найдено: {stats.get('total_found', 0)}, Новых: {stats.get('new_saved', 0)}")
-            else:
-                logger.error(f"Ошибка поиска #{search_count}: {result.get('message', 'Unknown error')}")
+                if result.get('success'):
+                    stats = result.get('stats', {})
+                    logger.info(
+                        f"Поиск #{search_count} завершен. Найдено: {stats.get('total_found', 0)}, Новых: {stats.get('new_saved', 0)}")
+                else:
+                    logger.error(f"Ошибка поиска #{search_count}: {result.get('message', 'Unknown error')}")
 
-        except Exception as e:
-            logger.error(f"Ошибка в поисковом воркере #{search_count}: {e}")
+            except Exception as e:
+                logger.error(f"Ошибка в поисковом воркере #{search_count}: {e}")
 
         # Ждем перед следующим поиском
-        interval_minutes = getattr(settings, 'SEARCH_INTERVAL_MINUTES', 30)
-        logger.info(f"Следующий поиск через {interval_minutes} минут...")
-        await asyncio.sleep(interval_minutes * 60)
+        interval_minutes = decision.interval / 60
+        logger.info(f"Следующий поиск через {interval_minutes:.0f} минут...")
+        await asyncio.sleep(decision.interval)
 
 
 async def main():
@@ -1,10 +1,29 @@
 import asyncio
 import aio_pika
-import json
-import time
+from functools import partial
+from typing import List, Optional
+from dataclasses import asdict
+from src.core.accounts import Account, accounts, default_account
 from src.core.database import db
-from src.api.hh_responder import HHResponder
-from src.services.rate_limiter import RateLimiter
+from src.api.hh_responder import HHResponder, APPLY_SENT, APPLY_THROTTLED
+from src.api.deepseek_client import resign_letter
+from src.services.rate_limiter import create_rate_limiter
+from src.services.send_scheduler import (SendScheduler, OUTCOME_SENT, OUTCOME_FAILED,
+                                         OUTCOME_REQUEUE, OUTCOME_SKIPPED)
+from src.services.negotiation_sync import NegotiationSync
+from src.services.fair_share import FairShare
+from src.services.vacancy_liveness import vacancy_liveness
+from src.services.breaker_monitor import BreakerMonitor
+from src.services.review_queue import ReviewQueue
+from src.services.review_web import ReviewServer
+from src.services.send_planner import send_planner
+from src.services.letter_expiry import letter_expiry_sweeper, is_expired
+from src.core.circuit_breaker import hh_breaker, STATE_OPEN
+from src.services.queue_manager import create_queue_manager
+from src.services.amqp_pool import amqp_pool
+from src.services.messages import CoverLetterMessage, MessageSchemaError, MessageUnsupportedError, decode_message
+from src.services.idempotency import idempotency_guard, IdempotencyUnavailableError, STAGE_SEND
+from src.core.letter_templates import TemplateError, letter_templates
 from src.core.config import settings
 from src.core.logger import get_logger
 
@@ -12,222 +31,299 @@ logger = get_logger(__name__)
 
 
 class SenderWorker:
-    """Воркер для отправки откликов на HH.ru"""
-
-    def __init__(self):
-        self.rate_limiter = RateLimiter(settings.REQUESTS_PER_HOUR)
-        self.hh_responder = HHResponder()
+    """Отправка откликов на HH.ru от одного аккаунта
+
+    У аккаунта свои токен и резюме, лимиты (журнал и общий бюджет реплик),
+    очередь писем и синхронизация /negotiations. Несколько аккаунтов одного
+    процесса делят канал к HH через FairShare.
+    """
+
+    def __init__(self, account: Optional[Account] = None, fair_share: Optional[FairShare] = None):
+        # По умолчанию - основной аккаунт (HH_ACCESS_TOKEN / HH_RESUME_ID)
+        self.account = account or default_account()
+        self.rate_limiter = create_rate_limiter(
+            requests_per_hour=self.account.requests_per_hour, requests_per_day=self.account.requests_per_day,
+            min_interval=self.account.min_interval, account_id=self.account.ledger_id)
+        self.hh_responder = HHResponder(self.account.hh_access_token, self.account.resume_id)
+        self.negotiation_sync = NegotiationSync(self.hh_responder, account_id=self.account.ledger_id)
+        # SENDER_STRATEGY=plan: письма идут по оценке плана отправки и только в рабочие часы
+        self.use_plan = settings.SENDER_STRATEGY == "plan"
+        self.scheduler = SendScheduler(
+            self.rate_limiter, self._send_scheduled, validate=vacancy_liveness.find_closed,
+            not_before=send_planner.working_hours.next_open if self.use_plan else None,
+            wait_turn=partial(fair_share.turn, self.account.id) if fair_share else None)
+        # Интерактивный режим: письма ждут решения в БД, одобренные идут через тот же планировщик
+        self.review_queue = ReviewQueue(self.scheduler, prioritize=self._priority)
+        self.review_server: Optional[ReviewServer] = None
+        self.tasks: List[asyncio.Task] = []
         self.sent_count = 0
         self.error_count = 0
 
-    async def ask_confirmation(self, cover_data: dict) -> str:
-        """Спрашивает подтверждение перед отправкой отклика"""
-        print("\n" + "=" * 70)
-        print("НОВЫЙ ОТКЛИК ДЛЯ ОТПРАВКИ")
-        print("=" * 70)
-        print(f"Компания: {cover_data['company']}")
-        print(f"Вакансия: {cover_data['vacancy_name']}")
-        print(f"Ссылка: {cover_data['url']}")
-        print(f"Длина письма: {len(cover_data['cover_letter'])} символов")
-
-        # Показываем время до следующей возможной отправки
-        remaining_time = self.rate_limiter.get_remaining_time()
-        if remaining_time > 0:
-            minutes = int(remaining_time // 60)
-            seconds = int(remaining_time % 60)
-            print(f"До следующей отправки: {minutes:02d}:{seconds:02d}")
-
-        print("\nСОДЕРЖИМОЕ ПИСЬМА:")
-        print("-" * 50)
-        print(cover_data['cover_letter'])
-        print("-" * 50)
-
-        while True:
-            print("\nВыберите действие:")
-            print("  [y] - Отправить отклик СЕЙЧАС (без ожидания)")
-            print("  [w] - Отправить с ожиданием лимитов")
-            print("  [n] - Пропустить вакансию")
-            print("  [s] - Пропустить и оставить в очереди")
-            print("  [v] - Посмотреть ссылку на вакансию")
-            print("  [p] - Показать письмо еще раз")
-
-            choice = input("\nВаш выбор (y/w/n/s/v/p): ").lower().strip()
-
-            if choice in ['y', 'w', 'n', 's']:
-                return choice
-            elif choice == 'v':
-                print(f"Открываю ссылку: {cover_data['url']}")
-                import webbrowser
-                webbrowser.open(cover_data['url'])
-            elif choice == 'p':
-                print("\nСОДЕРЖИМОЕ ПИСЬМА:")
-                print("-" * 50)
-                print(cover_data['cover_letter'])
-                print("-" * 50)
-            else:
-                print("Неверный выбор, попробуйте еще раз")
+    def letter_text(self, cover_data: dict) -> str:
+        """Текст письма с контактами аккаунта: шаблон рендерится с ними, у письма LLM меняется подпись"""
+        if self.account.is_default:
+            return letter_templates.letter_text(cover_data)
+        contacts = self.account.contact_values()
+        return resign_letter(letter_templates.letter_text(cover_data, contacts), contacts)
 
-    async def process_cover_letter_automatic(self, cover_data: dict) -> bool:
-        """Автоматическая отправка без подтверждения"""
+    async def process_cover_letter_automatic(self, cover_data: dict) -> str:
+        """Автоматическая отправка без подтверждения; итог - OUTCOME_*"""
         logger.info(f" АВТОМАТИЧЕСКАЯ ОТПРАВКА")
         logger.info(f"{cover_data['company']} - {cover_data['vacancy_name']}")
         logger.info(f"{cover_data['url']}")
 
-        #  ЗАДЕРЖКА
-        logger.info("Подготовка к отправке...")
-        await asyncio.sleep(10)
-
-        await self.rate_limiter.wait_if_needed()
+        vacancy_id_str = str(cover_data['vacancy_id']).strip()
+        slot = await self.rate_limiter.acquire(vacancy_id=vacancy_id_str)
 
         # Отправляем отклик
-        vacancy_id_str = str(cover_data['vacancy_id']).strip()
-        success = await self.hh_responder.send_application(
+        result = await self.hh_responder.send_application(
             vacancy_id_str,
             cover_data['cover_letter']
         )
 
-        if success:
+        if result == APPLY_SENT:
             self.sent_count += 1
-            vacancy = await db.get_vacancy_by_hh_id(cover_data['vacancy_id'])
-            if vacancy:
-                await db.mark_as_applied(vacancy.id)
-            logger.info(f"Отклик #{self.sent_count} отправлен")
-            return True
-        else:
-            self.error_count += 1
-            logger.error(f"Ошибка отправки (#{self.error_count})")
-            return False
+            self.negotiation_sync.add(vacancy_id_str)
+            if self.account.is_default:
+                vacancy = await db.get_vacancy_by_hh_id(cover_data['vacancy_id'])
+                if vacancy:
+                    await db.mark_as_applied(vacancy.id)
+            else:
+                await db.set_account_letter_status(self.account.id, [vacancy_id_str], 'sent')
+            logger.info(f"Отклик #{self.sent_count} отправлен ({self.account.id})")
+            return OUTCOME_SENT
+
+        await self.rate_limiter.release(slot)
+        if result == APPLY_THROTTLED:
+            # HH ограничивает запросы: письмо не потеряно, а возвращается в очередь
+            logger.warning(f"Отклик на {vacancy_id_str} отложен - письмо вернется в очередь")
+            return OUTCOME_REQUEUE
+        self.error_count += 1
+        logger.error(f"Ошибка отправки (#{self.error_count})")
+        return OUTCOME_FAILED
+
+    async def _priority(self, cover_data: dict) -> Optional[float]:
+        """Оценка письма для планировщика; None - по релевантности"""
+        if not self.use_plan:
+            return None
+        try:
+            return await send_planner.priority(cover_data)
+        except Exception as e:
+            logger.error(f"Ошибка оценки письма для плана отправки: {e}")
+            return None
+
+    async def _send_scheduled(self, cover_data: dict) -> str:
+        """Отправка письма, выбранного планировщиком"""
+        vacancy_hh_id = cover_data['vacancy_id']
+        send_key = self.account.send_key(vacancy_hh_id)
+        # HH ограничивает запросы: письмо вернется в очередь, подписка встает на паузу
+        if hh_breaker.state == STATE_OPEN:
+            return OUTCOME_REQUEUE
+
+        # Срок письма истек, пока оно ждало слота или одобрения
+        if is_expired(cover_data):
+            await letter_expiry_sweeper.mark([vacancy_hh_id], self.account.ledger_id)
+            return OUTCOME_SKIPPED
+
+        # Пока письмо ждало слота, отклик мог появиться (вручную или другой репликой)
+        if self.negotiation_sync.is_applied(vacancy_hh_id):
+            logger.info(f"Отклик на вакансию {vacancy_hh_id} уже есть на HH - письмо пропущено")
+            return OUTCOME_SKIPPED
+
+        try:
+            # Захватываем отправку ДО запроса к HH: второй экземпляр сообщения
+            # (повторная доставка или другая реплика) отклик не продублирует
+            if not await idempotency_guard.claim(STAGE_SEND, send_key):
+                logger.info(f"Отклик на вакансию {vacancy_hh_id} уже отправлен или отправляется - дубликат пропущен")
+                return OUTCOME_SKIPPED
+        except IdempotencyUnavailableError as e:
+            logger.error(f"{e}. Сообщение возвращается в очередь")
+            await asyncio.sleep(5)
+            return OUTCOME_REQUEUE
+
+        try:
+            outcome = await self.process_cover_letter_automatic(cover_data)
+        except Exception:
+            await idempotency_guard.release(STAGE_SEND, send_key)
+            raise
+
+        if outcome == OUTCOME_SENT:
+            await idempotency_guard.complete(STAGE_SEND, send_key)
+            return outcome
+        await idempotency_guard.release(STAGE_SEND, send_key)
+        if outcome == OUTCOME_REQUEUE and hh_breaker.state != STATE_OPEN:
+            # Цепь не разомкнута (пробный запрос half-open занят другим запросом):
+            # подписка не встанет на паузу - письмо не должно сразу вернуться по кругу
+            await asyncio.sleep(5)
+        return outcome
 
     async def process_message(self, message: aio_pika.IncomingMessage):
         """Обработчик сообщений - простой и надежный как в simple_worker_v2.py"""
-        async with message.process():
+        # requeue=True: если проверить дубликат не удалось (БД недоступна), сообщение вернется в очередь.
+        # ignore_processed=True: сообщение уже могло быть возвращено через nack
+        # (письмо, не дождавшееся слота в планировщике)
+        async with message.process(requeue=True, ignore_processed=True):
             try:
-                body = message.body.decode('utf-8')
-                cover_data = json.loads(body)
+                cover_data = asdict(decode_message(message, CoverLetterMessage))
+                # TTL брокера срабатывает только в голове очереди: срок проверяется и здесь
+                if is_expired(cover_data):
+                    await letter_expiry_sweeper.mark([cover_data['vacancy_id']], self.account.ledger_id)
+                    return
+                # Шаблонное письмо приходит ссылкой: текст собирается только сейчас
+                cover_data['cover_letter'] = self.letter_text(cover_data)
 
                 logger.info(f"\n Обработка отклика: {cover_data['vacancy_name']}")
                 logger.info(f"Компания: {cover_data['company']}")
 
+                # Отклик уже есть (отправлен вручную или раньше) - слот лимита не тратим
+                if self.negotiation_sync.is_applied(cover_data['vacancy_id']):
+                    logger.info("Отклик на эту вакансию уже есть на HH - письмо пропущено")
+                    return
+
                 if settings.BOT_MODE == "automatic":
-                    # АВТОМАТИЧЕСКИЙ РЕЖИМ
-                    await self.process_cover_letter_automatic(cover_data)
-                else:
-                    # ИНТЕРАКТИВНЫЙ РЕЖИМ
-                    choice = await self.ask_confirmation(cover_data)
-
-                    if choice in ['n', 's']:
-                        if choice == 'n':
-                            logger.info("Отклик пропущен и удален из очереди")
-                        else:
-                            logger.info("Вакансия оставлена в очереди")
-                            await message.nack(requeue=True)
-                        return
-
-                    # Обработка отправки
-                    if choice == 'w':
-                        logger.info("Ожидание соблюдения лимитов...")
-                        await self.rate_limiter.wait_if_needed()
-                    else:  # choice == 'y'
-                        logger.info("Отправка СЕЙЧАС (без ожидания)")
-                        self.rate_limiter.last_request = 0
-
-                    # Отправляем отклик
-                    vacancy_id_str = str(cover_data['vacancy_id']).strip()
-                    logger.info("Отправка отклика...")
-
-                    success = await self.hh_responder.send_application(
-                        vacancy_id_str,
-                        cover_data['cover_letter']
-                    )
-
-                    if success:
-                        if choice != 'w':  # Для режима "сейчас" обновляем таймер
-                            self.rate_limiter.last_request = time.time()
-
-                        # Помечаем как отправленную в БД
-                        vacancy = await db.get_vacancy_by_hh_id(cover_data['vacancy_id'])
-                        if vacancy:
-                            await db.mark_as_applied(vacancy.id)
-                            logger.info(f"Отклик отправлен и записан в БД")
-                        else:
-                            logger.warning(f"Отклик отправлен, но вакансия не найдена в БД")
-                    else:
-                        logger.error(f"Не удалось отправить отклик")
-
-            except json.JSONDecodeError as e:
-                logger.error(f"Ошибка декодирования JSON: {e}")
+                    # Письмо ждет слота в планировщике; сообщение подтверждается после отправки
+                    priority = await self._priority(cover_data)
+                    if await self.scheduler.submit(cover_data, priority) == OUTCOME_REQUEUE:
+                        await message.nack(requeue=True)
+                    return
+
+                # Интерактивный режим: письмо ждет решения в БД, сообщение подтверждается сразу.
+                # Захват отправки (защита от дублей) - в _send_scheduled, после одобрения
+                await self.review_queue.add(cover_data)
+                logger.info("Письмо ожидает проверки")
+
+            except IdempotencyUnavailableError as e:
+                logger.error(f"{e}. Сообщение возвращается в очередь")
+                await asyncio.sleep(5)
+                raise
+            except MessageUnsupportedError as e:
+                # Схема новее или нет пакета кодека: письмо дождется обновленного воркера
+                logger.error(f"{e}. Сообщение возвращается в очередь")
+                await asyncio.sleep(5)
+                raise
+            except (MessageSchemaError, TemplateError) as e:
+                # Без возврата в очередь: при x-dead-letter-exchange брокер переложит сообщение туда
+                logger.error(f"Некорректное сообщение с письмом отклонено: {e}")
+                await message.reject(requeue=False)
             except Exception as e:
                 logger.error(f"Ошибка обработки письма: {e}")
                 import traceback
                 logger.error(f"Traceback: {traceback.format_exc()}")
 
-    async def main(self):
-        """Основная функция воркера - простая как в simple_worker_v2.py"""
-        logger.info("Запуск воркера отправки откликов...")
-        logger.info(f"Режим: {settings.BOT_MODE.upper()}")
-        logger.info(f"ВНИМАНИЕ: Rate limiting активирован ({settings.REQUESTS_PER_HOUR} откликов/час)")
-
+    async def start(self, queue_manager, breaker_monitor: BreakerMonitor) -> None:
+        """Загружает журнал и отклики аккаунта и подписывается на его очередь писем"""
+        await self.rate_limiter.load()
+        # Отклики, уже существующие на HH (в том числе сделанные вручную), не отправляются повторно
+        await self.negotiation_sync.load()
+        try:
+            await self.negotiation_sync.sync()
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации откликов ({self.account.id}): {e}")
+
+        queue_name = self.account.letter_queue
+        # Пока предохранитель HH разомкнут, письма не забираются, ожидающие возвращаются в очередь
+        self.tasks.append(asyncio.create_task(breaker_monitor.pause_consumers_while_open(
+            queue_manager, queue_name, on_pause=self.scheduler.close)))
+        if settings.NEGOTIATION_SYNC_INTERVAL > 0:
+            self.tasks.append(asyncio.create_task(self.negotiation_sync.run_periodic()))
+
+        # Письма копятся в планировщике (до SENDER_SCHEDULER_CAPACITY):
+        # в автоматическом режиме - прямо из очереди, в интерактивном - после одобрения
+        self.tasks.append(asyncio.create_task(self.scheduler.run()))
         if settings.BOT_MODE != "automatic":
-            logger.info("Доступные режимы отправки:")
-            logger.info("  [y] - СЕЙЧАС (игнорирует лимиты)")
-            logger.info("  [w] - С ожиданием (соблюдает лимиты)")
-
-        # Инициализация БД
-        await db.create_tables()
-
-        connection = None
-        max_retries = 3
-
-        for attempt in range(max_retries):
-            try:
-                #   подключение к RabbitMQ
-                logger.info(f"Попытка подключения к RabbitMQ ({attempt + 1}/{max_retries})...")
-                connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-                channel = await connection.channel()
-                await channel.set_qos(prefetch_count=1)
-
-                # Получаем очередь
-                queue = await channel.declare_queue(settings.QUEUE_COVER_LETTERS, durable=True)
-
-                logger.info("Подключение к RabbitMQ установлено")
-                logger.info(f"Ожидание писем в очереди '{settings.QUEUE_COVER_LETTERS}'...")
-
-                # Начинаем слушать очередь
-                await queue.consume(self.process_message)
-
-                logger.info("\n ВОРКЕР ОТПРАВКИ ЗАПУЩЕН!")
-                if settings.BOT_MODE == "automatic":
-                    logger.info(" Режим: АВТОМАТИЧЕСКИЙ (без подтверждения)")
-                else:
-                    logger.info("Режим: ИНТЕРАКТИВНЫЙ (требует подтверждение)")
-                logger.info("Нажмите Ctrl+C для остановки")
-
-                # Бесконечное ожидание
-                await asyncio.Future()
-
-            except aio_pika.exceptions.AMQPConnectionError as e:
-                logger.error(f"Ошибка подключения: {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Повторная попытка через 10 секунд...")
-                    await asyncio.sleep(10)
-                else:
-                    logger.error("Не удалось подключиться после всех попыток")
-                    break
-            except KeyboardInterrupt:
-                logger.info("\nОстановка воркера отправки...")
-                break
-            except Exception as e:
-                logger.error(f"Неожиданная ошибка: {e}")
-                break
-            finally:
-                if connection:
-                    await connection.close()
+            self.tasks.append(asyncio.create_task(self.review_queue.run()))
+            if settings.REVIEW_PORT:
+                self.review_server = ReviewServer(self.review_queue)
+                await self.review_server.start()
+        await queue_manager.consume(queue_name, self.process_message,
+                                    prefetch_count=settings.SENDER_SCHEDULER_CAPACITY)
+        logger.info(f"Аккаунт '{self.account.id}': ожидание писем в очереди '{queue_name}'")
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        self.scheduler.close()
+        if self.review_server is not None:
+            await self.review_server.stop()
+
+
+def sender_accounts() -> List[Account]:
+    """Аккаунты, письма которых отправляет этот процесс"""
+    active = accounts.all()
+    if settings.BOT_MODE == "automatic":
+        return active
+    # Проверка писем (letter_reviews, веб-страница) ведется для основного аккаунта
+    skipped = [account.id for account in active if not account.is_default]
+    if skipped:
+        logger.warning(f"Интерактивный режим: письма аккаунтов {', '.join(skipped)} ждут в их очередях "
+                       f"(проверка писем - только для основного аккаунта)")
+    return [account for account in active if account.is_default]
 
 
 # Функция для запуска
 async def main():
-    worker = SenderWorker()
-    await worker.main()
+    """Основная функция воркера: отправители всех аккаунтов в одном процессе"""
+    logger.info("Запуск воркера отправки откликов...")
+    logger.info(f"Режим: {settings.BOT_MODE.upper()}")
+    if settings.SENDER_STRATEGY == "plan":
+        logger.info(f"Порядок отправки: по плану (рабочие часы {settings.PLAN_WORK_HOURS_START}-"
+                    f"{settings.PLAN_WORK_HOURS_END}, {settings.PLAN_TIMEZONE})")
+    logger.info(f"ВНИМАНИЕ: Rate limiting активирован ({settings.REQUESTS_PER_HOUR} откликов/час, "
+                f"{settings.REQUESTS_PER_DAY} откликов/сутки на аккаунт, если у аккаунта не заданы свои)")
+
+    active = sender_accounts()
+    if not active:
+        logger.error("Нет аккаунтов для отправки")
+        return
+    # Общий канал к HH: несколько аккаунтов отправляют по очереди, пропорционально весам
+    fair_share = FairShare({account.id: account.weight for account in active}) if len(active) > 1 else None
+    workers = [SenderWorker(account, fair_share) for account in active]
+
+    # Инициализация БД (журналы отправок переживают перезапуск)
+    await db.create_tables()
+    breaker_monitor = BreakerMonitor("sender")
+    breaker_monitor.attach()
+
+    queue_manager = create_queue_manager()
+
+    # Повторные попытки и паузы между ними - внутри connect() (RABBITMQ_CONNECT_RETRIES)
+    if not await queue_manager.connect():
+        logger.error("Не удалось подключиться к брокеру после всех попыток")
+        return
+
+    expiry_task = None
+    try:
+        logger.info(f"Подключение к брокеру установлено ({settings.QUEUE_BACKEND})")
+        if settings.LETTER_MAX_AGE_HOURS and settings.LETTER_EXPIRY_SWEEP_INTERVAL > 0:
+            expiry_task = asyncio.create_task(letter_expiry_sweeper.run_periodic())
+
+        for worker in workers:
+            await worker.start(queue_manager, breaker_monitor)
+        # Просроченные письма RabbitMQ перекладывает в отдельную очередь (dead-lettering)
+        if settings.QUEUE_BACKEND == "rabbitmq" and settings.RABBITMQ_LETTER_DEAD_LETTERING:
+            await queue_manager.consume(settings.QUEUE_EXPIRED_LETTERS, letter_expiry_sweeper.handle_message)
+
+        logger.info(f"\n ВОРКЕР ОТПРАВКИ ЗАПУЩЕН! Аккаунты: {', '.join(account.id for account in active)}")
+        if settings.BOT_MODE == "automatic":
+            logger.info(" Режим: АВТОМАТИЧЕСКИЙ (без подтверждения)")
+        else:
+            logger.info("Режим: ИНТЕРАКТИВНЫЙ (письма ждут одобрения: веб-страница или main.py review)")
+        logger.info("Нажмите Ctrl+C для остановки")
+
+        # Бесконечное ожидание
+        await asyncio.Future()
+
+    except KeyboardInterrupt:
+        logger.info("\nОстановка воркера отправки...")
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка: {e}")
+    finally:
+        if expiry_task is not None:
+            expiry_task.cancel()
+        for worker in workers:
+            await worker.stop()
+        await queue_manager.close()
+        await amqp_pool.close()
 
 
 if __name__ == "__main__":
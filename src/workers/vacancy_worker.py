@@ -1,9 +1,12 @@
 import asyncio
 import aio_pika
-import json
+from dataclasses import asdict
 from src.core.database import db
 from src.services.vacancy_processor import vacancy_processor
-from src.services.queue_manager import RabbitMQManager
+from src.services.queue_manager import create_queue_manager
+from src.services.amqp_pool import amqp_pool
+from src.services.messages import VacancyMessage, MessageSchemaError, MessageUnsupportedError, decode_message
+from src.services.idempotency import idempotency_guard, IdempotencyUnavailableError, STAGE_COVER_LETTER
 from src.core.config import settings
 from src.core.logger import get_logger
 
@@ -12,24 +15,46 @@ logger = get_logger(__name__)
 
 async def process_vacancy_message(message: aio_pika.IncomingMessage):
     """Обрабатывает сообщение с вакансией из очереди"""
-    async with message.process():
+    # requeue=True: если проверить дубликат не удалось (БД недоступна), сообщение вернется в очередь.
+    # ignore_processed=True: некорректное сообщение отклоняется явно (reject без возврата)
+    async with message.process(requeue=True, ignore_processed=True):
         try:
-            # Декодируем сообщение
-            body = message.body.decode('utf-8')
-            vacancy_data = json.loads(body)
+            # Декодируем сообщение по content_type/content_encoding и проверяем схему
+            vacancy_data = asdict(decode_message(message, VacancyMessage))
 
             logger.info(f"НОВАЯ ВАКАНСИЯ: {vacancy_data.get('name', 'Unknown')}")
 
+            # Письмо уже сгенерировано (или генерируется) по прошлой доставке - не тратим LLM повторно
+            if not await idempotency_guard.claim(STAGE_COVER_LETTER, vacancy_data['hh_id']):
+                return
+
             # Обрабатываем вакансию через процессор
-            success = await vacancy_processor.process_vacancy(vacancy_data)
+            try:
+                success = await vacancy_processor.process_vacancy(vacancy_data)
+            except Exception:
+                await idempotency_guard.release(STAGE_COVER_LETTER, vacancy_data['hh_id'])
+                raise
 
             if success:
+                await idempotency_guard.complete(STAGE_COVER_LETTER, vacancy_data['hh_id'])
                 logger.info(f"Успешно обработана: {vacancy_data['name']}")
             else:
+                await idempotency_guard.release(STAGE_COVER_LETTER, vacancy_data['hh_id'])
                 logger.warning(f"Не обработана: {vacancy_data['name']}")
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка декодирования JSON: {e}")
+        except IdempotencyUnavailableError as e:
+            logger.error(f"{e}. Сообщение возвращается в очередь")
+            await asyncio.sleep(5)
+            raise
+        except MessageUnsupportedError as e:
+            # Схема новее или нет пакета кодека: сообщение дождется обновленного воркера
+            logger.error(f"{e}. Сообщение возвращается в очередь")
+            await asyncio.sleep(5)
+            raise
+        except MessageSchemaError as e:
+            # Без возврата в очередь: при x-dead-letter-exchange брокер переложит сообщение туда
+            logger.error(f"Некорректное сообщение с вакансией отклонено: {e}")
+            await message.reject(requeue=False)
         except Exception as e:
             logger.error(f"Ошибка обработки вакансии: {e}")
 
@@ -42,44 +67,25 @@ async def main():
     await db.create_tables()
     logger.info("База данных готова")
 
-    # Инициализация RabbitMQ
-    rabbitmq = RabbitMQManager()
-
-    connection = None
-    max_retries = 3
+    # Инициализация брокера очередей
+    queue_manager = create_queue_manager()
 
-    for attempt in range(max_retries):
-        try:
-            # Подключаемся к RabbitMQ
-            logger.info(f"Попытка подключения к RabbitMQ ({attempt + 1}/{max_retries})...")
-
-            if await rabbitmq.connect():
-                connection = rabbitmq.connection
-                break
-            else:
-                if attempt < max_retries - 1:
-                    logger.info("Повторная попытка через 10 секунд...")
-                    await asyncio.sleep(10)
-
-        except Exception as e:
-            logger.error(f"Ошибка подключения: {e}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(10)
-
-    if not connection:
-        logger.error("Не удалось подключиться к RabbitMQ после всех попыток")
+    # Повторные попытки и паузы между ними - внутри connect() (RABBITMQ_CONNECT_RETRIES)
+    if not await queue_manager.connect():
+        logger.error("Не удалось подключиться к брокеру после всех попыток")
         return
 
     try:
-        # Получаем очередь
-        channel = rabbitmq.channel
-        queue = await channel.declare_queue(settings.QUEUE_VACANCIES, durable=True)
-
-        logger.info("Подключение к RabbitMQ установлено")
+        logger.info(f"Подключение к брокеру установлено ({settings.QUEUE_BACKEND})")
         logger.info(f"Ожидание вакансий в очереди '{settings.QUEUE_VACANCIES}'...")
 
-        # Начинаем слушать очередь
-        await queue.consume(process_vacancy_message)
+        # Начинаем слушать очередь: prefetch вмещает DEEPSEEK_MAX_CONCURRENCY пакетов
+        # по LLM_BATCH_SIZE вакансий, общий лимит запросов к API держит семафор DeepSeekClient
+        await queue_manager.consume(
+            settings.QUEUE_VACANCIES,
+            process_vacancy_message,
+            prefetch_count=settings.DEEPSEEK_MAX_CONCURRENCY * max(1, settings.LLM_BATCH_SIZE),
+        )
 
         logger.info("\nВОРКЕР ЗАПУЩЕН!")
         logger.info("Ожидание сообщений... (Ctrl+C для выхода)")
@@ -92,8 +98,9 @@ async def main():
     except Exception as e:
         logger.error(f"Неожиданная ошибка: {e}")
     finally:
-        if rabbitmq:
-            await rabbitmq.close()
+        await queue_manager.close()
+        await vacancy_processor.deepseek.close()
+        await amqp_pool.close()
         logger.info("Соединения закрыты")
 
 
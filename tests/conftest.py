@@ -0,0 +1,38 @@
+import itertools
+import os
+import tempfile
+
+import pytest
+from dotenv import load_dotenv
+
+# Настройки читаются один раз при первом импорте src: если DATABASE_URL не задан
+# ни в окружении, ни в .env, модульные тесты работают на временной SQLite
+load_dotenv()
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'hh_bot_test.db')}"
+)
+
+
+@pytest.fixture
+def with_database(tmp_path):
+    """Сценарий на отдельной SQLite в tmp_path: asyncio.run(with_database(run, rows))
+
+    run(database) выполняется после создания таблиц и сохранения вакансий rows,
+    engine закрывается в любом случае.
+    """
+    from src.core.database import Database
+
+    databases = itertools.count()
+
+    async def run_with_database(run, rows=()):
+        database = Database(f"sqlite+aiosqlite:///{tmp_path / f'test_{next(databases)}.db'}")
+        await database.create_tables()
+        try:
+            for row in rows:
+                await database.save_vacancy(row)
+            return await run(database)
+        finally:
+            await database.engine.dispose()
+
+    return run_with_database
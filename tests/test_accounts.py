@@ -0,0 +1,117 @@
+"""
+Тест нескольких аккаунтов HH: файл аккаунтов, фильтры, раздача писем по очередям,
+журнал откликов аккаунта и очередность в общем канале отправки
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+import src.services.vacancy_processor as vacancy_processor_module
+from src.core.accounts import AccountError, AccountRegistry, load_accounts, letter_queue
+from src.core.config import settings
+from src.services.fair_share import FairShare
+from src.services.queue_manager import InMemoryQueueManager
+from src.services.vacancy_processor import VacancyProcessor
+
+ACCOUNTS = [
+    {'id': 'anna', 'hh_access_token_env': 'HH_TOKEN_ANNA', 'resume_id': 'r-anna', 'weight': 2,
+     'requests_per_hour': 10, 'keywords': ['Django'], 'contacts': {'contact_name': 'Анна'}},
+    {'id': 'boris', 'hh_access_token': 'token-boris', 'exclude_keywords': ['1С'], 'min_relevance': 0.3},
+]
+
+
+def accounts_file(directory, items):
+    path = directory / f'accounts_{len(list(directory.iterdir()))}.json'
+    path.write_text(json.dumps(items, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_load_accounts_and_filters(monkeypatch, tmp_path):
+    monkeypatch.setenv('HH_TOKEN_ANNA', 'token-anna')
+    monkeypatch.setattr(settings, 'HH_ACCESS_TOKEN', 'token-main')
+    default, anna, boris = load_accounts(accounts_file(tmp_path, ACCOUNTS))
+    assert default.is_default and default.ledger_id is None and default.letter_queue == settings.QUEUE_COVER_LETTERS
+    assert anna.hh_access_token == 'token-anna' and anna.weight == 2 and anna.keywords == ['django']
+    assert anna.letter_queue == letter_queue('anna') == f"{settings.QUEUE_COVER_LETTERS}.anna"
+    assert anna.send_key(' 42 ') == 'anna:42' and default.send_key('42') == '42'
+    assert anna.contact_values()['contact_name'] == 'Анна'
+    assert anna.contact_values()['contact_phone'] == settings.CONTACT_PHONE
+
+    django = {'name': 'Django разработчик', 'description': '', 'relevance': 0.5}
+    accounting = {'name': 'Программист 1С', 'description': '', 'relevance': 0.5}
+    assert anna.matches(django) and not anna.matches(accounting)
+    assert boris.matches(django) and not boris.matches(accounting)
+    assert not boris.matches({**django, 'relevance': 0.1})
+
+    # Без токена основной аккаунт не отправляет, если есть другие
+    monkeypatch.setattr(settings, 'HH_ACCESS_TOKEN', '')
+    assert [account.id for account in load_accounts(accounts_file(tmp_path, ACCOUNTS))] == ['anna', 'boris']
+    assert [account.id for account in load_accounts('')] == ['default']
+
+    for bad in ([{'id': 'Anna Smith'}], [{'id': 'a', 'color': 'red'}], [{'id': 'a'}, {'id': 'a'}],
+                [{'id': 'a', 'weight': 0}], [{'id': 'a', 'contacts': {'contact_fax': '1'}}], {'id': 'a'}):
+        with pytest.raises(AccountError):
+            load_accounts(accounts_file(tmp_path, bad))
+
+
+def test_letter_fan_out_and_account_ledger(monkeypatch, tmp_path, with_database):
+    monkeypatch.setattr(settings, 'HH_ACCESS_TOKEN', 'token-main')
+    registry = AccountRegistry(accounts_file(tmp_path, ACCOUNTS))
+    monkeypatch.setattr(vacancy_processor_module, 'accounts', registry)
+
+    async def run(database):
+        monkeypatch.setattr(vacancy_processor_module, 'db', database)
+        processor = VacancyProcessor()
+        processor.queue_manager = InMemoryQueueManager()
+        await processor.queue_manager.connect()
+        for hh_id, name in (('1', 'Django разработчик'), ('2', 'Программист 1С')):
+            saved = await database.save_vacancy({'hh_id': hh_id, 'name': name})
+            await database.mark_cover_letter_generated(saved.id, 'text')
+            assert await processor.enqueue_for_accounts(
+                {'name': name, 'description': '', 'relevance': 0.5},
+                {'vacancy_id': hh_id, 'vacancy_name': name, 'company': 'C', 'cover_letter': 'text'})
+        queued = {name: processor.queue_manager.broker.get_queue(name).qsize()
+                  for name in registry.letter_queues()}
+
+        pending = sorted((account_id, v.hh_id) for account_id, v in await database.get_pending_account_letters())
+        await database.set_account_letter_status('anna', ['1'], 'sent')
+        applied = await database.get_applied_vacancy_ids('anna')
+        applied_times = await database.get_applied_times(0, 'anna')
+        default_applied = await database.get_applied_vacancy_ids()
+        stats = await database.get_account_letter_stats()
+        return queued, pending, applied, len(applied_times), default_applied, stats
+
+    queued, pending, applied, applied_count, default_applied, stats = asyncio.run(with_database(run))
+    assert queued == {settings.QUEUE_COVER_LETTERS: 2, letter_queue('anna'): 1, letter_queue('boris'): 1}
+    assert pending == [('anna', '1'), ('boris', '1')]
+    assert set(applied) == {'1'} and applied_count == 1
+    assert not default_applied
+    assert stats == {'anna': {'sent': 1}, 'boris': {'queued': 1}}
+
+
+def test_fair_share_follows_weights():
+    async def run():
+        fair_share = FairShare({'anna': 2, 'boris': 1}, min_interval=0)
+        order = []
+
+        async def send(account_id, count):
+            for _ in range(count):
+                await fair_share.turn(account_id)
+                order.append(account_id)
+
+        await asyncio.gather(send('anna', 6), send('boris', 6))
+        return order, fair_share.get_stats()
+
+    order, stats = asyncio.run(run())
+    # Пока оба аккаунта готовы, anna получает два хода на один ход boris
+    assert order[:6].count('anna') == 4 and order[:6].count('boris') == 2
+    assert stats == {'granted': {'anna': 6, 'boris': 6}, 'waiting': 0}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,81 @@
+"""
+Тест общего соединения с RabbitMQ (без брокера: connect_robust подменяется)
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.services import amqp_pool as amqp_pool_module
+from src.services.amqp_pool import AMQPConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.is_closed = False
+
+    async def close(self):
+        self.is_closed = True
+
+
+def install_fake_broker(monkeypatch, failures: int = 0):
+    calls = []
+
+    async def fake_connect_robust(url, **kwargs):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        if len(calls) <= failures:
+            raise ConnectionError("broker is down")
+        return FakeConnection()
+
+    monkeypatch.setattr(amqp_pool_module.aio_pika, "connect_robust", fake_connect_robust)
+    monkeypatch.setattr(settings, "RABBITMQ_RETRY_BACKOFF_BASE", 0.001)
+    return calls
+
+
+def test_concurrent_callers_share_one_connection(monkeypatch):
+    calls = install_fake_broker(monkeypatch)
+    pool = AMQPConnectionPool("amqp://test")
+
+    async def scenario():
+        connections = await asyncio.gather(*(pool.get_connection() for _ in range(10)))
+        return len({id(c) for c in connections})
+
+    assert asyncio.run(scenario()) == 1
+    assert len(calls) == 1
+
+
+def test_reconnect_with_backoff_after_failures(monkeypatch):
+    calls = install_fake_broker(monkeypatch, failures=2)
+    pool = AMQPConnectionPool("amqp://test")
+
+    connection = asyncio.run(pool.get_connection(max_retries=3))
+    assert not connection.is_closed and len(calls) == 3
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    install_fake_broker(monkeypatch, failures=10)
+    pool = AMQPConnectionPool("amqp://test")
+
+    try:
+        asyncio.run(pool.get_connection(max_retries=2))
+    except ConnectionError:
+        return
+    assert False, "ожидалась ошибка подключения"
+
+
+def test_closed_connection_is_reopened(monkeypatch):
+    calls = install_fake_broker(monkeypatch)
+    pool = AMQPConnectionPool("amqp://test")
+
+    async def scenario():
+        first = await pool.get_connection()
+        await pool.close()
+        second = await pool.get_connection()
+        return first is not second
+
+    assert asyncio.run(scenario())
+    assert len(calls) == 2
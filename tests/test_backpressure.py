@@ -0,0 +1,70 @@
+"""
+Тест backpressure поиска по глубине очередей
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.services.backpressure import BackpressureController, STATE_NORMAL, STATE_THROTTLED, STATE_PAUSED
+from src.services.send_planner import WorkingHours, send_planner
+
+
+def queue_details(vacancies: int, letters: int = 0) -> dict:
+    return {
+        settings.QUEUE_VACANCIES: {'messages': vacancies, 'consumers': 1},
+        settings.QUEUE_COVER_LETTERS: {'messages': letters, 'consumers': 1},
+    }
+
+
+def test_watermarks_with_hysteresis():
+    controller = BackpressureController()
+    high, low = settings.BACKPRESSURE_VACANCY_HIGH, settings.BACKPRESSURE_VACANCY_LOW
+    middle = (high + low) // 2
+
+    assert controller.evaluate(queue_details(0)).state == STATE_NORMAL
+    assert controller.evaluate(queue_details(middle)).state == STATE_THROTTLED
+
+    paused = controller.evaluate(queue_details(high))
+    assert paused.state == STATE_PAUSED and not paused.search_allowed
+
+    # Между low и high после паузы поиск не возобновляется
+    assert controller.evaluate(queue_details(middle)).state == STATE_PAUSED
+    assert controller.evaluate(queue_details(low)).state == STATE_NORMAL
+
+
+def test_letter_backlog_counts_in_send_hours():
+    controller = BackpressureController()
+    letters = int(settings.BACKPRESSURE_LETTER_HOURS_HIGH * settings.REQUESTS_PER_HOUR)
+
+    decision = controller.evaluate(queue_details(0, letters))
+    assert decision.state == STATE_PAUSED
+
+
+def test_letter_hours_follow_daily_cap_and_working_hours(monkeypatch):
+    monkeypatch.setattr(settings, 'REQUESTS_PER_HOUR', 15)
+    monkeypatch.setattr(settings, 'REQUESTS_PER_DAY', 200)
+    # 200 писем - сутки отправки по суточному лимиту, хотя по часовому это ~13 ч
+    assert BackpressureController().evaluate(queue_details(0, 200)).state == STATE_PAUSED
+
+    # План: 9 рабочих часов в будни - 135 писем в день, 675 в неделю
+    monkeypatch.setattr(settings, 'SENDER_STRATEGY', 'plan')
+    monkeypatch.setattr(send_planner, 'working_hours', WorkingHours(10, 19, [0, 1, 2, 3, 4], 'UTC'))
+    decision = BackpressureController().evaluate(queue_details(0, 100))
+    assert decision.state == STATE_PAUSED and '~24.9 ч' in decision.reason
+
+
+def test_throttled_search_is_smaller_and_slower():
+    controller = BackpressureController()
+    middle = (settings.BACKPRESSURE_VACANCY_HIGH + settings.BACKPRESSURE_VACANCY_LOW) // 2
+
+    decision = controller.evaluate(queue_details(middle))
+    assert decision.per_page < settings.SEARCH_PER_PAGE
+    assert decision.interval > settings.SEARCH_INTERVAL
+
+
+def test_missing_stats_do_not_block_search():
+    decision = BackpressureController().evaluate({})
+    assert decision.search_allowed
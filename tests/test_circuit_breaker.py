@@ -0,0 +1,174 @@
+"""
+Тест предохранителя HH: closed/open/half-open и пауза подписки на время размыкания
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import src.api.hh_responder as hh_responder_module
+import src.workers.sender_worker as sender_worker
+from src.api.hh_responder import HHResponder, APPLY_THROTTLED
+from src.core.circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+from src.core.config import settings
+from src.services.breaker_monitor import BreakerMonitor
+from src.services.idempotency import IdempotencyGuard, STAGE_SEND
+from src.services.queue_manager import InMemoryQueueManager
+from src.services.send_scheduler import OUTCOME_REQUEUE
+
+
+def make_breaker(open_seconds=0.05, max_open_seconds=1.0):
+    return CircuitBreaker("test", failure_threshold=3, open_seconds=open_seconds, max_open_seconds=max_open_seconds)
+
+
+def test_429_opens_then_single_probe_closes():
+    breaker = make_breaker()
+    breaker.record_response(429, retry_after='0.1')
+    assert breaker.state == STATE_OPEN and not breaker.allow_request()
+    assert 0.05 < breaker.remaining() <= 0.1  # Retry-After длиннее паузы по умолчанию
+
+    time.sleep(0.11)
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # Пока идет пробный запрос, остальные ждут
+
+    breaker.record_response(201)
+    assert breaker.state == STATE_CLOSED and breaker.allow_request()
+
+
+def test_403_threshold_captcha_and_backoff():
+    breaker = make_breaker()
+    # Отказ в отклике по существу - не троттлинг
+    for value in ('already_applied', 'test_required', 'letter_required', 'vacancy_archived'):
+        breaker.record_response(403, json.dumps({'errors': [{'type': 'negotiations', 'value': value}]}))
+    assert breaker.state == STATE_CLOSED and breaker.get_stats()['failures'] == 0
+    breaker.record_response(403, '<html>Forbidden</html>')
+    breaker.record_response(403)
+    breaker.record_response(200)  # Успех сбрасывает счетчик
+    breaker.record_response(403)
+    breaker.record_response(403)
+    assert breaker.state == STATE_CLOSED
+    breaker.record_response(403)
+    assert breaker.state == STATE_OPEN
+
+    other = make_breaker()
+    other.record_response(403, '{"errors": [{"type": "captcha_required"}]}')
+    assert other.state == STATE_OPEN
+    time.sleep(0.06)
+    assert other.allow_request()
+    other.record_response(429)  # Проба не прошла - пауза вдвое длиннее
+    assert 0.06 < other.remaining() <= 0.1
+    assert other.trips == 2
+
+    network = make_breaker()
+    for _ in range(5):
+        network.record_response(None)
+        network.record_response(502)
+    assert network.state == STATE_CLOSED
+
+
+def test_refused_probe_defers_application(monkeypatch):
+    breaker = make_breaker()
+    monkeypatch.setattr(hh_responder_module, 'hh_breaker', breaker)
+    breaker.record_response(429)
+    time.sleep(0.06)
+    assert breaker.allow_request()  # Пробный запрос ушел раньше (например, проверка вакансии)
+    result = asyncio.run(HHResponder('token', 'resume').send_application('1', 'text'))
+    assert result == APPLY_THROTTLED
+
+
+def test_throttled_letter_is_requeued(monkeypatch, with_database):
+    breaker = make_breaker()
+    monkeypatch.setattr(sender_worker, 'hh_breaker', breaker)
+    monkeypatch.setattr(settings, 'RATE_LIMIT_BACKEND', 'memory')
+    worker = sender_worker.SenderWorker()
+
+    async def throttled(vacancy_id, cover_letter):
+        breaker.record_response(429)
+        return APPLY_THROTTLED
+
+    monkeypatch.setattr(worker.hh_responder, 'send_application', throttled)
+
+    async def run(database):
+        guard = IdempotencyGuard(database=database)
+        monkeypatch.setattr(sender_worker, 'idempotency_guard', guard)
+        cover_data = {'vacancy_id': '400', 'vacancy_name': 'Python Developer', 'company': 'ACME',
+                      'cover_letter': 'text', 'url': 'https://hh.ru/vacancy/400'}
+        outcome = await worker._send_scheduled(cover_data)
+        # Захват снят: письмо отправится при следующей доставке
+        return outcome, await guard.claim(STAGE_SEND, '400')
+
+    outcome, claimed = asyncio.run(with_database(run))
+    assert outcome == OUTCOME_REQUEUE and claimed
+    assert worker.error_count == 0
+
+
+def test_auth_errors_do_not_trip_shared_breaker():
+    breaker = make_breaker()
+    revoked = json.dumps({'errors': [{'type': 'oauth', 'value': 'token_revoked'}]})
+    for _ in range(5):
+        breaker.record_response(403, revoked)
+        breaker.record_response(401)
+    assert breaker.state == STATE_CLOSED and breaker.get_stats()['failures'] == 0
+
+    # Пробный запрос с чужим недействительным токеном не держит half-open
+    breaker.record_response(429)
+    time.sleep(0.06)
+    assert breaker.allow_request() and not breaker.allow_request()
+    breaker.record_response(403, revoked)
+    assert breaker.state == STATE_HALF_OPEN and breaker.allow_request()
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.states = []
+
+    async def save_breaker_state(self, state_id, **values):
+        self.states.append(values['state'])
+
+
+def test_consumers_paused_while_open():
+    async def run():
+        breaker = make_breaker(open_seconds=0.2)
+        database = FakeDatabase()
+        monitor = BreakerMonitor("sender", breaker, database)
+        monitor.attach()
+
+        queue_manager = InMemoryQueueManager()
+        await queue_manager.connect()
+        received, paused = [], []
+
+        async def handler(message):
+            received.append(message.body)
+            await message.ack()
+
+        await queue_manager.consume("letters", handler)
+        watcher = asyncio.create_task(monitor.pause_consumers_while_open(
+            queue_manager, "letters", on_pause=lambda: paused.append(True)))
+        try:
+            await asyncio.sleep(0)
+            breaker.record_response(429)
+            await asyncio.sleep(0.05)
+            await queue_manager.publish("letters", {'n': 1})
+            await asyncio.sleep(0.05)
+            during_open = list(received)
+
+            await asyncio.sleep(0.3)
+            return during_open, received, paused, database.states
+        finally:
+            watcher.cancel()
+            await queue_manager.close()
+
+    during_open, received, paused, states = asyncio.run(run())
+    assert during_open == [] and paused == [True]
+    assert len(received) == 1  # После паузы подписка возобновлена
+    assert states[:3] == [STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
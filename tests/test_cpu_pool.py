@@ -0,0 +1,72 @@
+"""
+Тест пула процессов для CPU-обработки текста вакансий
+"""
+
+import asyncio
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from src.core.config import settings
+from src.services.cpu_pool import CpuPool
+from src.services.text_features import compute_vacancy_features
+
+VACANCIES = [
+    {'name': f'Python разработчик {i}', 'skills': 'Python, FastAPI',
+     'description': f'<p>Вакансия номер {i}: разработка сервисов на Python, PostgreSQL и RabbitMQ.</p>'}
+    for i in range(20)
+]
+
+
+def assert_same_features(left, right):
+    assert len(left) == len(right)
+    for a, b in zip(left, right):
+        assert np.array_equal(a.term_buckets, b.term_buckets)
+        assert np.array_equal(a.term_counts, b.term_counts)
+        assert np.array_equal(a.minhash, b.minhash)
+
+
+def test_pool_matches_inline_and_keeps_order():
+    """Пачки из процессов собираются в исходном порядке и совпадают с расчетом на месте"""
+    async def run():
+        pool = CpuPool(workers=2, executor=ProcessPoolExecutor(max_workers=2))
+        try:
+            return await pool.map(compute_vacancy_features, VACANCIES, batch_size=3)
+        finally:
+            pool.shutdown()
+
+    pooled = asyncio.run(run())
+    assert_same_features(pooled, compute_vacancy_features(VACANCIES))
+
+
+def test_small_input_runs_inline(monkeypatch):
+    """Меньше CPU_POOL_MIN_ITEMS - без пула процессов"""
+    class FailingExecutor:
+        def submit(self, *args, **kwargs):
+            raise AssertionError("пул не должен использоваться")
+
+    monkeypatch.setattr(settings, 'CPU_POOL_MIN_ITEMS', 8)
+    pool = CpuPool(workers=2, executor=FailingExecutor())
+    features = asyncio.run(pool.map(compute_vacancy_features, VACANCIES[:3]))
+    assert_same_features(features, compute_vacancy_features(VACANCIES[:3]))
+    assert asyncio.run(pool.map(compute_vacancy_features, [])) == []
+
+
+def test_disabled_pool_runs_inline(monkeypatch):
+    """CPU_POOL_ENABLED=False - все на месте"""
+    class FailingExecutor:
+        def submit(self, *args, **kwargs):
+            raise AssertionError("пул не должен использоваться")
+
+    monkeypatch.setattr(settings, 'CPU_POOL_ENABLED', False)
+    pool = CpuPool(workers=2, executor=FailingExecutor())
+    features = asyncio.run(pool.map(compute_vacancy_features, VACANCIES))
+    assert len(features) == len(VACANCIES)
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,196 @@
+"""
+Тест генерации писем DeepSeekClient на локальном stub-сервере (без реального API)
+"""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiohttp import web
+from src.core.config import settings
+from src.core.database import Database
+from src.api.deepseek_client import DeepSeekClient, SOURCE_LLM, SOURCE_TEMPLATE
+from src.services.letter_batcher import LetterBatcher
+
+VACANCY = {
+    'hh_id': '1', 'name': 'Python Developer', 'company': 'ООО Ромашка',
+    'description': 'FastAPI, PostgreSQL', 'skills': 'Python', 'url': 'https://hh.ru/vacancy/1',
+}
+
+
+class StubServer:
+    """Отвечает как chat/completions со stream=true; mode задает поведение"""
+
+    def __init__(self, mode: str = "ok", delay: float = 0):
+        self.mode = mode
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.requests = []
+        self.runner = None
+        self.url = None
+
+    async def handler(self, request: web.Request) -> web.StreamResponse:
+        self.requests.append(await request.json())
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.mode == "error":
+                return web.Response(status=500, text="internal error")
+
+            parts = ("Здравствуйте! ", "Мне интересна ваша вакансия.")
+            if self.mode in ("batch", "partial") and "response_format" in self.requests[-1]:
+                user = self.requests[-1]["messages"][-1]["content"]
+                ids = [item["id"] for item in json.loads(user[user.index("["):])]
+                if self.mode == "partial":
+                    ids = ids[:-1]
+                parts = (json.dumps({"letters": [{"id": i, "text": f"Письмо {i}"} for i in ids]}, ensure_ascii=False),)
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for part in parts:
+                await asyncio.sleep(self.delay)
+                chunk = {"choices": [{"delta": {"content": part}}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            usage = {"choices": [], "usage": {"prompt_tokens": 1000, "completion_tokens": 500}}
+            await response.write(f"data: {json.dumps(usage)}\n\n".encode('utf-8'))
+            await response.write(b"data: [DONE]\n\n")
+            return response
+        finally:
+            self.active -= 1
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/chat/completions", self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/chat/completions"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+
+async def generate_with(server_mode: str, delay: float = 0, vacancies: int = 1, concurrency: int = 2):
+    async with StubServer(server_mode, delay) as server:
+        client = DeepSeekClient(api_url=server.url, api_key="test-key", max_concurrency=concurrency)
+        try:
+            results = await asyncio.gather(*(client.generate(VACANCY) for _ in range(vacancies)))
+        finally:
+            await client.close()
+        return results, server, client
+
+
+def test_streaming_generation_counts_tokens_and_cost(monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_USE_LLM", True)
+    (generation,), server, client = asyncio.run(generate_with("ok"))
+
+    assert generation.source == SOURCE_LLM
+    assert generation.text.startswith("Здравствуйте! Мне интересна ваша вакансия.")
+    assert (generation.prompt_tokens, generation.completion_tokens) == (1000, 500)
+    expected_cost = (1000 * settings.DEEPSEEK_PRICE_INPUT_PER_1M + 500 * settings.DEEPSEEK_PRICE_OUTPUT_PER_1M) / 1_000_000
+    assert abs(generation.cost - expected_cost) < 1e-12
+    assert server.requests[0]["stream"] is True
+    assert client.total_cost == generation.cost
+
+
+def test_http_error_falls_back_to_template(monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_USE_LLM", True)
+    (generation,), _, client = asyncio.run(generate_with("error"))
+    assert generation.source == SOURCE_TEMPLATE
+    assert "ООО Ромашка" in generation.text
+    assert client.fallback_letters == 1
+
+
+def test_read_timeout_falls_back_to_template(monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_USE_LLM", True)
+    monkeypatch.setattr(settings, "DEEPSEEK_READ_TIMEOUT", 0.1)
+    (generation,), _, _ = asyncio.run(generate_with("ok", delay=0.5))
+    assert generation.source == SOURCE_TEMPLATE
+
+
+def test_concurrency_is_bounded(monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_USE_LLM", True)
+    results, server, _ = asyncio.run(generate_with("ok", delay=0.05, vacancies=6, concurrency=2))
+    assert all(r.source == SOURCE_LLM for r in results)
+    assert server.max_active == 2
+
+
+async def generate_batch_with(server_mode: str, vacancies: list):
+    async with StubServer(server_mode) as server:
+        client = DeepSeekClient(api_url=server.url, api_key="test-key")
+        try:
+            return await client.generate_batch(vacancies), server, client
+        finally:
+            await client.close()
+
+
+def test_batch_packs_vacancies_into_one_request(monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_USE_LLM", True)
+    vacancies = [{**VACANCY, 'hh_id': str(i)} for i in range(3)] + [{**VACANCY, 'name': 'Бухгалтер', 'description': '', 'skills': ''}]
+    results, server, client = asyncio.run(generate_batch_with("batch", vacancies))
+
+    assert len(server.requests) == 1 and server.requests[0]["response_format"] == {"type": "json_object"}
+    assert [r.text.split("\n")[0] for r in results[:3]] == ["Письмо 0", "Письмо 1", "Письмо 2"]
+    assert results[3] is None
+    # Токены пакета поделены между письмами
+    assert sum(r.prompt_tokens for r in results[:3]) == 1000
+    assert sum(r.completion_tokens for r in results[:3]) == 500
+    assert client.batch_requests == 1
+
+
+def test_batch_missing_letters_are_generated_one_by_one(monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_USE_LLM", True)
+    vacancies = [{**VACANCY, 'hh_id': str(i)} for i in range(3)]
+    results, server, _ = asyncio.run(generate_batch_with("partial", vacancies))
+
+    assert len(server.requests) == 2  # пакет + одиночный запрос для пропущенной вакансии
+    assert all(r.source == SOURCE_LLM for r in results)
+
+
+def test_batcher_flushes_by_size_and_by_wait():
+    calls = []
+
+    class FakeClient:
+        async def generate_batch(self, vacancies):
+            calls.append(len(vacancies))
+            return [vacancy['hh_id'] for vacancy in vacancies]
+
+    async def run():
+        batcher = LetterBatcher(FakeClient(), max_size=3, max_wait=0.05)
+        full = await asyncio.gather(*(batcher.submit({'hh_id': str(i)}) for i in range(3)))
+        single = await batcher.submit({'hh_id': 'x'})
+        return full, single
+
+    full, single = asyncio.run(run())
+    assert full == ['0', '1', '2'] and single == 'x'
+    assert calls == [3, 1]
+
+
+def test_create_tables_adds_missing_columns():
+    """Существующая таблица без новых колонок дополняется при create_tables"""
+    path = os.path.join(tempfile.mkdtemp(), "columns_test.db")
+
+    async def run():
+        database = Database(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with database.engine.begin() as conn:
+                await conn.exec_driver_sql(
+                    "CREATE TABLE vacancies (id INTEGER PRIMARY KEY, hh_id VARCHAR(50) NOT NULL UNIQUE)"
+                )
+            await database.create_tables()
+            async with database.engine.begin() as conn:
+                rows = await conn.exec_driver_sql("PRAGMA table_info(vacancies)")
+                return {row[1] for row in rows}
+        finally:
+            await database.engine.dispose()
+
+    columns = asyncio.run(run())
+    assert {'letter_source', 'llm_cost', 'cover_letter', 'applied'} <= columns
@@ -0,0 +1,159 @@
+"""
+Тест защиты от повторной обработки сообщений
+"""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Тест работает на временной SQLite и не трогает БД из .env
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(), "idempotency_test.db")
+TEST_DATABASE_URL = f"sqlite+aiosqlite:///{TEST_DB_PATH}"
+os.environ.setdefault("DATABASE_URL", TEST_DATABASE_URL)
+
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.core.database import Database
+from src.services.idempotency import IdempotencyGuard, STAGE_SEND, STAGE_COVER_LETTER
+from src.services.queue_manager import InMemoryMessage
+from src.services.send_scheduler import OUTCOME_FAILED, OUTCOME_SENT, OUTCOME_SKIPPED
+import src.workers.vacancy_worker as vacancy_worker
+import src.workers.sender_worker as sender_worker
+
+logger = get_logger(__name__)
+
+
+async def create_test_database() -> Database:
+    database = Database(TEST_DATABASE_URL)
+    await database.create_tables()
+    return database
+
+
+async def drop_test_database(database: Database) -> None:
+    async with database.engine.begin() as conn:
+        await conn.exec_driver_sql("DELETE FROM processed_messages")
+    await database.engine.dispose()
+
+
+def make_message(payload: dict) -> InMemoryMessage:
+    return InMemoryMessage(json.dumps(payload, ensure_ascii=False).encode('utf-8'), asyncio.Queue())
+
+
+async def claim_complete_release():
+    """Второй захват - дубликат, отметка переживает рестарт, release открывает повтор"""
+    database = await create_test_database()
+    try:
+        guard = IdempotencyGuard(cache_size=10, database=database)
+        first = await guard.claim(STAGE_SEND, "100")
+        racing = await guard.claim(STAGE_SEND, "100")  # конкурент до завершения: IntegrityError
+        await guard.complete(STAGE_SEND, "100")
+
+        restarted = IdempotencyGuard(cache_size=10, database=database)
+        after_restart = await restarted.claim(STAGE_SEND, "100")
+
+        await guard.claim(STAGE_SEND, "101")
+        await guard.release(STAGE_SEND, "101")
+        after_release = await guard.claim(STAGE_SEND, "101")
+
+        duplicates = await database.get_duplicate_stats()
+        return (first and not racing and not after_restart and after_release
+                and guard.get_stats() == {STAGE_SEND: 1}
+                and duplicates.get(STAGE_SEND) == 2)
+    finally:
+        await drop_test_database(database)
+
+
+async def lru_eviction_falls_back_to_db():
+    """Вытесненный из LRU ключ все равно распознается как дубликат через БД"""
+    database = await create_test_database()
+    try:
+        guard = IdempotencyGuard(cache_size=2, database=database)
+        for key in ("1", "2", "3"):
+            await guard.claim(STAGE_COVER_LETTER, key)
+            await guard.complete(STAGE_COVER_LETTER, key)
+
+        evicted = (STAGE_COVER_LETTER, "1") not in guard._completed
+        return evicted and len(guard._completed) == 2 and not await guard.claim(STAGE_COVER_LETTER, "1")
+    finally:
+        await drop_test_database(database)
+
+
+async def redelivered_vacancy_skips_processing(monkeypatch):
+    """Повторная доставка вакансии не вызывает генерацию письма"""
+    database = await create_test_database()
+    calls = []
+
+    async def fake_process_vacancy(vacancy_data):
+        calls.append(vacancy_data['hh_id'])
+        return True
+
+    monkeypatch.setattr(vacancy_worker, "idempotency_guard", IdempotencyGuard(database=database))
+    monkeypatch.setattr(vacancy_worker.vacancy_processor, "process_vacancy", fake_process_vacancy)
+    try:
+        payload = {'hh_id': '200', 'name': 'Python Developer'}
+        await vacancy_worker.process_vacancy_message(make_message(payload))
+        await vacancy_worker.process_vacancy_message(make_message(payload))
+        return calls == ['200']
+    finally:
+        await drop_test_database(database)
+
+
+async def redelivered_letter_skips_send(monkeypatch):
+    """Повторная доставка письма не отправляет отклик, неудачная отправка - не блокирует повтор"""
+    database = await create_test_database()
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKEND", "memory")
+    monkeypatch.setattr(settings, "SENDER_LIVENESS_LOOKAHEAD", 0)
+    worker = sender_worker.SenderWorker()
+    results = [OUTCOME_FAILED, OUTCOME_SENT]
+    calls = []
+
+    async def fake_send(cover_data):
+        calls.append(cover_data['vacancy_id'])
+        return results.pop(0)
+
+    monkeypatch.setattr(settings, "BOT_MODE", "automatic")
+    monkeypatch.setattr(sender_worker, "idempotency_guard", IdempotencyGuard(database=database))
+    monkeypatch.setattr(worker, "process_cover_letter_automatic", fake_send)
+    # В автоматическом режиме письма отправляет диспетчер планировщика
+    dispatcher = asyncio.create_task(worker.scheduler.run())
+    try:
+        payload = {'vacancy_id': '300', 'vacancy_name': 'Python Developer', 'company': 'ACME',
+                   'cover_letter': 'text', 'url': 'https://hh.ru/vacancy/300'}
+        for _ in range(3):
+            await worker.process_message(make_message(payload))
+        # 1-я попытка неудачна (захват снят), 2-я успешна, 3-я - дубликат
+        duplicate = await worker._send_scheduled(dict(payload))
+        return calls == ['300', '300'] and duplicate == OUTCOME_SKIPPED
+    finally:
+        dispatcher.cancel()
+        await drop_test_database(database)
+
+
+def test_claim_complete_release():
+    assert asyncio.run(claim_complete_release())
+
+
+def test_lru_eviction_falls_back_to_db():
+    assert asyncio.run(lru_eviction_falls_back_to_db())
+
+
+def test_redelivered_vacancy_skips_processing(monkeypatch):
+    assert asyncio.run(redelivered_vacancy_skips_processing(monkeypatch))
+
+
+def test_redelivered_letter_skips_send(monkeypatch):
+    assert asyncio.run(redelivered_letter_skips_send(monkeypatch))
+
+
+async def main():
+    logger.info("ТЕСТ ЗАЩИТЫ ОТ ПОВТОРНОЙ ОБРАБОТКИ")
+    logger.info(f"Захват/завершение/снятие: {'ok' if await claim_complete_release() else 'fail'}")
+    logger.info(f"Вытеснение из LRU: {'ok' if await lru_eviction_falls_back_to_db() else 'fail'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
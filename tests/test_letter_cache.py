@@ -0,0 +1,68 @@
+"""
+Тест кэша писем по отпечатку вакансии
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.api.deepseek_client import LetterGeneration, SOURCE_LLM
+from src.services.letter_cache import LetterCache, SOURCE_CACHE, vacancy_fingerprint
+from src.services.vacancy_processor import VacancyProcessor
+
+VACANCY = {'hh_id': '1', 'name': 'Python Developer', 'company': 'Ромашка', 'skills': 'Python, SQL'}
+REPOST = {'hh_id': '2', 'name': 'python  developer!', 'company': 'ромашка', 'skills': 'sql,python'}
+
+
+def test_fingerprint_normalizes_and_includes_template_version(monkeypatch):
+    assert vacancy_fingerprint(VACANCY) == vacancy_fingerprint(REPOST)
+    assert vacancy_fingerprint(VACANCY) != vacancy_fingerprint({**VACANCY, 'skills': 'Go'})
+
+    before = vacancy_fingerprint(VACANCY)
+    monkeypatch.setattr(settings, "LETTER_TEMPLATE_VERSION", settings.LETTER_TEMPLATE_VERSION + 1)
+    assert vacancy_fingerprint(VACANCY) != before
+
+
+def test_hit_personalizes_letter():
+    cache = LetterCache(max_size=10, ttl=60)
+    cache.put(VACANCY, "Команда Ромашка! Вакансия «Python Developer» мне интересна.")
+    assert cache.get(REPOST) == "Команда ромашка! Вакансия «python  developer!» мне интересна."
+
+
+def test_size_and_ttl_eviction():
+    cache = LetterCache(max_size=1, ttl=60)
+    cache.put(VACANCY, "a")
+    cache.put({**VACANCY, 'skills': 'Go'}, "b")
+    assert cache.get(VACANCY) is None and len(cache) == 1
+
+    expired = LetterCache(max_size=10, ttl=-1)
+    expired.put(VACANCY, "a")
+    assert expired.get(VACANCY) is None and len(expired) == 0
+
+
+def test_parallel_reposts_share_one_generation():
+    """Перепубликации, пришедшие одновременно, ждут одну генерацию LLM"""
+    processor = VacancyProcessor()
+    calls = []
+
+    async def fake_generate(vacancy_data):
+        calls.append(vacancy_data['hh_id'])
+        await asyncio.sleep(0.05)
+        return LetterGeneration(text=f"Письмо для {vacancy_data['company']}", source=SOURCE_LLM)
+
+    processor.deepseek.generate = fake_generate
+    processor.batcher.max_wait = 0
+
+    async def run():
+        first = await asyncio.gather(processor.generate_letter(VACANCY), processor.generate_letter(REPOST))
+        later = await processor.generate_letter({**VACANCY, 'hh_id': '3'})
+        return first, later
+
+    (original, repost), later = asyncio.run(run())
+    assert calls == ['1']
+    assert original.source == SOURCE_LLM
+    assert repost.source == SOURCE_CACHE and repost.text == "Письмо для ромашка"
+    assert later.source == SOURCE_CACHE and later.prompt_tokens == 0
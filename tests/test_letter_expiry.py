@@ -0,0 +1,100 @@
+"""
+Тест срока писем: TTL сообщения, пометка просроченных писем в БД
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.services.letter_expiry import LetterExpirySweeper, is_expired, letter_expires_at
+from src.services.queue_manager import QueueManager, queue_arguments
+
+
+class RecordingQueueManager(QueueManager):
+    """Запоминает опубликованные сообщения"""
+
+    def __init__(self):
+        self.published = []
+
+    async def connect(self, max_retries=None):
+        return True
+
+    async def close(self):
+        pass
+
+    async def publish(self, queue_name, payload, priority=0, expiration=None):
+        self.published.append((queue_name, payload, expiration))
+        return True
+
+    async def consume(self, queue_name, callback, prefetch_count=1):
+        pass
+
+    async def pause_consumers(self, queue_name):
+        pass
+
+    async def resume_consumers(self, queue_name):
+        pass
+
+    async def get_queue_details(self):
+        return {}
+
+
+def test_letter_ttl_and_dead_lettering_arguments(monkeypatch):
+    now = datetime.utcnow()
+    vacancy = type('V', (), {'published_at': now - timedelta(hours=10), 'created_at': now})()
+    monkeypatch.setattr(settings, 'LETTER_MAX_AGE_HOURS', 24)
+    expires_at = letter_expires_at(vacancy)
+    assert abs(expires_at - (time.time() + 14 * 3600)) < 60
+    assert not is_expired({'expires_at': expires_at}) and is_expired({'expires_at': expires_at}, expires_at)
+    assert not is_expired({'expires_at': None})
+
+    manager = RecordingQueueManager()
+    letter = {'vacancy_id': '1', 'vacancy_name': 'V', 'company': 'C', 'cover_letter': 'text'}
+    asyncio.run(manager.send_cover_letter_to_queue({**letter, 'expires_at': expires_at}))
+    asyncio.run(manager.send_cover_letter_to_queue(letter))
+    (_, payload, expiration), (_, _, no_expiration) = manager.published
+    assert payload['expires_at'] == expires_at and 14 * 3600 - 60 < expiration <= 14 * 3600
+    assert no_expiration is None
+
+    monkeypatch.setattr(settings, 'RABBITMQ_QUEUE_MAX_PRIORITY', 0)
+    monkeypatch.setattr(settings, 'RABBITMQ_LETTER_DEAD_LETTERING', True)
+    assert queue_arguments(settings.QUEUE_COVER_LETTERS) == {
+        'x-dead-letter-exchange': '', 'x-dead-letter-routing-key': settings.QUEUE_EXPIRED_LETTERS}
+    assert queue_arguments(settings.QUEUE_VACANCIES) is None
+
+
+def test_sweep_marks_stale_letters_and_reviews(monkeypatch, with_database):
+    monkeypatch.setattr(settings, 'LETTER_MAX_AGE_HOURS', 24)
+
+    async def run(database):
+        now = datetime.utcnow()
+        for hh_id, age in (('fresh', 1), ('stale', 48), ('review', 48), ('dlx', 1)):
+            vacancy = await database.save_vacancy({
+                'hh_id': hh_id, 'name': hh_id, 'published_at': now - timedelta(hours=age)})
+            await database.mark_cover_letter_generated(vacancy.id, 'text')
+        await database.add_letter_review({'vacancy_id': 'review', 'cover_letter': 'text'})
+
+        sweeper = LetterExpirySweeper(database)
+        swept = await sweeper.sweep()
+        # Сообщение из очереди просроченных помечается сразу, повторная пометка ничего не меняет
+        marked = await sweeper.mark(['dlx'])
+        again = await sweeper.mark(['dlx', 'stale'])
+
+        pending = [v.hh_id for v in await database.get_pending_cover_letters()]
+        reviews = await database.get_letter_reviews(('expired',))
+        return swept, marked, again, pending, [r.vacancy_id for r in reviews]
+
+    swept, marked, again, pending, expired_reviews = asyncio.run(with_database(run))
+    assert (swept, marked, again) == (2, 1, 0)
+    assert pending == ['fresh']
+    assert expired_reviews == ['review']
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
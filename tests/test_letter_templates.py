@@ -0,0 +1,105 @@
+"""
+Тест шаблонов сопроводительных писем (src/core/letter_templates.py)
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from src.core.config import settings
+from src.core.letter_templates import LetterTemplates, TemplateError, CompiledTemplate, encode_choice
+
+VACANCY = {'hh_id': '42', 'name': 'Python Developer', 'company': 'Ромашка',
+           'search_text': 'python developer сервисы на fastapi'}
+
+
+def write_templates(directory: Path, variants, attractions=None):
+    attractions = attractions or [{"id": "any", "text": "интересные задачи"}]
+    manifest = {"version": 3, "variants": [], "attractions": attractions}
+    for variant_id, (text, weight) in variants.items():
+        (directory / f"{variant_id}.txt").write_text(text, encoding='utf-8')
+        manifest["variants"].append({"id": variant_id, "file": f"{variant_id}.txt", "weight": weight})
+    (directory / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False), encoding='utf-8')
+
+
+def test_default_templates_render(monkeypatch):
+    """Встроенный шаблон: поля подставлены, фраза по правилу, без отступов, повторяемо"""
+    monkeypatch.setattr(settings, "CONTACT_NAME", "Иван Петров")
+    templates = LetterTemplates()
+    choice, text = templates.render(VACANCY)
+
+    assert text.startswith("Уважаемые команда Ромашка!")
+    assert "«Python Developer»" in text and "работа с FastAPI" in text
+    assert "Иван Петров" in text and "{{" not in text
+    assert not any(line.startswith(' ') for line in text.splitlines())
+    assert choice.params == {'company': 'Ромашка', 'vacancy_name': 'Python Developer', 'attraction': 'fastapi'}
+    assert templates.render(VACANCY) == (choice, text)
+
+    # Без совпавших правил фраза из общего набора - одна и та же для одной вакансии
+    plain = {'hh_id': '7', 'name': 'Разработчик', 'company': 'X', 'search_text': 'разработчик'}
+    assert templates.attraction(plain) == templates.attraction(dict(plain))
+    assert not templates.attraction(plain).keywords
+
+
+def test_variants_split_by_weight_and_stable():
+    directory = Path(tempfile.mkdtemp())
+    write_templates(directory, {"a": ("A {{company}}", 1), "b": ("B {{company}}", 3), "off": ("C", 0)})
+    templates = LetterTemplates(str(directory))
+
+    chosen = [templates.choose({'hh_id': str(i), 'company': 'X'}).variant for i in range(2000)]
+    assert set(chosen) == {"a", "b"}
+    assert 0.65 < chosen.count("b") / len(chosen) < 0.85
+    assert chosen == [templates.choose({'hh_id': str(i), 'company': 'X'}).variant for i in range(2000)]
+
+    rendered = templates.render_batch([{'hh_id': '1', 'company': 'Y'}, {'hh_id': '2', 'company': 'Z'}])
+    assert [text[2:] for _, text in rendered] == ['Y', 'Z']
+    assert rendered[0][0].version == 3
+
+
+def test_hot_reload_and_broken_edit_keeps_previous():
+    directory = Path(tempfile.mkdtemp())
+    write_templates(directory, {"main": ("Версия 1 для {{company}}", 1)})
+    templates = LetterTemplates(str(directory), reload_interval=0)
+    assert templates.render({'hh_id': '1', 'company': 'X'})[1] == "Версия 1 для X"
+
+    write_templates(directory, {"main": ("Версия 2, {{company}}!", 1)})
+    assert templates.render({'hh_id': '1', 'company': 'X'})[1] == "Версия 2, X!"
+
+    # Ошибка в правке: воркер продолжает работать на прежних шаблонах
+    (directory / "main.txt").write_text("Версия 3 {{salary}}", encoding='utf-8')
+    assert templates.render({'hh_id': '1', 'company': 'X'})[1] == "Версия 2, X!"
+
+
+def test_stored_reference_renders_same_letter():
+    """Ссылка на шаблон (в БД и очереди) дает тот же текст; удаленный вариант заменяется действующим"""
+    templates = LetterTemplates()
+    choice, text = templates.render(VACANCY)
+    stored = encode_choice(choice)
+
+    assert len(stored.encode('utf-8')) < 100 < len(text.encode('utf-8'))
+    assert templates.render_stored(stored, 'Ромашка', 'Python Developer') == text
+    assert templates.letter_text({'letter_template': stored, 'company': 'Ромашка',
+                                  'vacancy_name': 'Python Developer'}) == text
+    assert templates.letter_text({'cover_letter': 'Письмо LLM', 'letter_template': None}) == 'Письмо LLM'
+
+    directory = Path(tempfile.mkdtemp())
+    write_templates(directory, {"new": ("Новый вариант для {{company}}", 1)})
+    assert LetterTemplates(str(directory)).render_stored(stored, 'Ромашка', '') == "Новый вариант для Ромашка"
+    with pytest.raises(TemplateError):
+        templates.render_stored('не json', 'X', 'Y')
+
+
+def test_unknown_placeholder_rejected():
+    with pytest.raises(TemplateError):
+        CompiledTemplate("Привет, {{salary}}", "bad.txt")
+    with pytest.raises(TemplateError):
+        LetterTemplates(tempfile.mkdtemp()).templates()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,90 @@
+"""
+Тест схемы и кодека сообщений очередей
+"""
+
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from src.core.config import settings
+from src.services import messages
+from src.services.messages import (
+    SCHEMA_VERSION, CoverLetterMessage, VacancyMessage, MessageSchemaError, MessageUnsupportedError,
+    decode_payload, encode_payload, from_payload, to_payload,
+)
+from src.services.queue_manager import InMemoryMessage
+import src.workers.vacancy_worker as vacancy_worker
+
+VACANCY = {
+    'hh_id': '123', 'name': 'Python Developer', 'company': 'ООО Ромашка',
+    'salary_from': 200000.0, 'salary_to': None, 'salary_currency': 'RUR',
+    'experience': 'От 1 года до 3 лет', 'employment': 'Полная занятость',
+    'description': 'Разработка сервисов на Python. ' * 300, 'skills': 'Python, SQL',
+    'url': 'https://hh.ru/vacancy/123',
+}
+
+
+@pytest.mark.parametrize("codec", ["json", "msgpack"])
+@pytest.mark.parametrize("threshold", [0, 1024])
+def test_roundtrip(monkeypatch, codec, threshold):
+    if codec == "msgpack":
+        pytest.importorskip("msgpack")
+    monkeypatch.setattr(settings, "MESSAGE_CODEC", codec)
+    monkeypatch.setattr(settings, "MESSAGE_COMPRESSION_THRESHOLD", threshold)
+
+    body, content_type, content_encoding = encode_payload(to_payload(from_payload(VacancyMessage, VACANCY)))
+    decoded = from_payload(VacancyMessage, decode_payload(body, content_type, content_encoding))
+
+    assert decoded == VacancyMessage(**VACANCY)
+    if threshold and messages.zstandard is not None:
+        assert content_encoding == "zstd"
+
+
+def test_legacy_json_is_v0():
+    """Сообщения без версии и content_type, опубликованные старым кодом, читаются"""
+    body = json.dumps({'vacancy_id': '1', 'cover_letter': 'Текст', 'company': 'X'}, ensure_ascii=False).encode('utf-8')
+    message = from_payload(CoverLetterMessage, decode_payload(body))
+    assert message.vacancy_id == '1' and message.company == 'X'
+
+
+def test_template_letter_travels_as_reference():
+    """v2: шаблонное письмо - ссылка вместо текста; письма v1 с текстом читаются как раньше"""
+    compact = {'vacancy_id': '1', 'company': 'X', 'letter_template': '{"t":"python_project","v":1,"a":"api"}'}
+    message = from_payload(CoverLetterMessage, to_payload(from_payload(CoverLetterMessage, compact)))
+    assert message.cover_letter == '' and message.letter_template == compact['letter_template']
+
+    legacy = from_payload(CoverLetterMessage, {'vacancy_id': '1', 'cover_letter': 'Текст', 'v': 1})
+    assert legacy.cover_letter == 'Текст' and legacy.letter_template is None
+
+
+def test_schema_errors(monkeypatch):
+    with pytest.raises(MessageSchemaError):
+        decode_payload(b'not json')
+    with pytest.raises(MessageSchemaError):
+        from_payload(CoverLetterMessage, {'vacancy_id': '1'})
+    # Новая схема и незнакомый кодек - не ошибка сообщения: его прочитает обновленный воркер
+    with pytest.raises(MessageUnsupportedError):
+        from_payload(VacancyMessage, {**VACANCY, 'v': SCHEMA_VERSION + 1})
+    monkeypatch.setattr(messages, "msgpack", None)
+    with pytest.raises(MessageUnsupportedError):
+        decode_payload(b'\x80', messages.CONTENT_TYPE_MSGPACK)
+
+
+def test_malformed_message_is_rejected_without_requeue():
+    queue = asyncio.Queue()
+    message = InMemoryMessage(b'not json', queue)
+    rejects = []
+    settle = message.reject
+
+    async def reject(requeue=False):
+        rejects.append(requeue)
+        await settle(requeue)
+
+    message.reject = reject
+    asyncio.run(vacancy_worker.process_vacancy_message(message))
+    # Отклонено без возврата: с x-dead-letter-exchange брокер переложит его в DLQ
+    assert rejects == [False] and queue.empty()
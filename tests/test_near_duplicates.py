@@ -0,0 +1,85 @@
+"""
+Тест поиска перепубликаций вакансий (MinHash + LSH)
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.services.near_duplicates import NearDuplicateIndex
+from src.services.relevance import RelevanceScorer
+from src.services.queue_manager import InMemoryQueueManager
+import src.services.vacancy_searcher as vacancy_searcher
+
+DESCRIPTION = (
+    "<p>Ищем Python-разработчика в команду платежного сервиса. Задачи: разработка микросервисов "
+    "на FastAPI, проектирование схем PostgreSQL, интеграция с брокером RabbitMQ, покрытие кода "
+    "тестами и участие в код-ревью. Мы предлагаем удаленную работу, гибкий график, ДМС и обучение "
+    "за счет компании, а также современный стек и сильную команду инженеров.</p>"
+)
+
+ORIGINAL = {'hh_id': '100', 'name': 'Python разработчик', 'company': 'ООО Платежи',
+            'description': DESCRIPTION, 'skills': 'Python', 'url': 'https://hh.ru/vacancy/100'}
+REPOST = {**ORIGINAL, 'hh_id': '200', 'company': 'Кадровое агентство',
+          'description': DESCRIPTION.replace("ДМС и обучение", "ДМС, спортзал и обучение"),
+          'url': 'https://hh.ru/vacancy/200'}
+OTHER = {'hh_id': '300', 'name': 'Python разработчик', 'company': 'ООО Игры',
+         'description': "Разработка игровых серверов на Python и asyncio, работа в офисе в Москве.",
+         'skills': 'Python', 'url': 'https://hh.ru/vacancy/300'}
+
+
+def test_repost_detected_and_unrelated_vacancy_not(with_database):
+    async def run(database):
+        index = NearDuplicateIndex(database)
+        signature, duplicate_of = await index.check(ORIGINAL)
+        index.add(ORIGINAL['hh_id'], signature)
+        return (await index.check(REPOST))[1], (await index.check(OTHER))[1]
+
+    repost_of, other_of = asyncio.run(with_database(run))
+    assert repost_of == '100'
+    assert other_of is None
+
+
+def test_search_page_flags_repost_and_index_survives_restart(monkeypatch, with_database):
+    async def run(database):
+        monkeypatch.setattr(vacancy_searcher, "db", database)
+        monkeypatch.setattr(vacancy_searcher, "near_duplicate_index", NearDuplicateIndex(database))
+        monkeypatch.setattr(vacancy_searcher, "relevance_scorer", RelevanceScorer(database))
+        monkeypatch.setattr(settings, "RELEVANCE_MIN_SCORE", 0)
+        searcher = vacancy_searcher.VacancySearcher()
+        searcher.queue_manager = InMemoryQueueManager()
+        await searcher.queue_manager.connect()
+
+        result = await searcher._process_vacancies_list([dict(ORIGINAL), dict(REPOST)])
+        repost = await database.get_vacancy_by_hh_id('200')
+
+        restarted = NearDuplicateIndex(database)
+        await restarted.load()
+        queued = searcher.queue_manager.broker.get_queue(settings.QUEUE_VACANCIES).qsize()
+        return result['stats'], repost, len(restarted.signatures), queued
+
+    stats, repost, indexed, queued = asyncio.run(with_database(run))
+    assert stats['near_duplicates'] == 1 and stats['new_saved'] == 1 and queued == 1
+    assert repost.duplicate_of == '100' and repost.processed
+    assert indexed == 2
+    # Описание сохранено обычным текстом, HTML и токены - отдельно
+    assert repost.description_html.startswith('<p>') and '<' not in repost.description
+    assert repost.search_text.startswith('python разработчик python ищем')
+
+
+def test_backfill_signs_old_rows_and_marks_reposts(with_database):
+    async def run(database):
+        for vacancy in (ORIGINAL, OTHER, REPOST):
+            await database.save_vacancy(dict(vacancy))
+        processed, duplicates = await NearDuplicateIndex(database).backfill(batch_size=2)
+        repost = await database.get_vacancy_by_hh_id('200')
+        remaining = await database.get_vacancies_without_minhash()
+        return processed, duplicates, repost, remaining
+
+    processed, duplicates, repost, remaining = asyncio.run(with_database(run))
+    assert (processed, duplicates) == (3, 1)
+    assert repost.duplicate_of == '100'
+    assert remaining == []
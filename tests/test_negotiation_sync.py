@@ -0,0 +1,80 @@
+"""
+Тест синхронизации откликов с HH (/negotiations) и проверки «уже откликались»
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.services.negotiation_sync import NegotiationSync
+
+
+def item(negotiation_id, vacancy_id, state, updated_at):
+    return {
+        'id': negotiation_id,
+        'state': {'id': state},
+        'created_at': '2026-01-10T10:00:00+0300',
+        'updated_at': updated_at,
+        'vacancy': {'id': vacancy_id, 'name': f'Вакансия {vacancy_id}', 'employer': {'name': 'ACME'}},
+    }
+
+
+class FakeResponder:
+    """Отдает заранее заданные страницы /negotiations и запоминает запрошенные"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    async def get_negotiations_page(self, page, per_page=100):
+        self.requested.append(page)
+        return {'items': self.pages[page], 'pages': len(self.pages), 'page': page}
+
+
+def test_sync_marks_manual_applications(with_database):
+    async def run(database):
+        for hh_id in ('1', '2', '3'):
+            await database.save_vacancy({'hh_id': hh_id, 'name': f'V{hh_id}'})
+        responder = FakeResponder([
+            [item('n1', '1', 'response', '2026-01-12T10:00:00+0300')],
+            [item('n2', '2', 'invitation', '2026-01-11T10:00:00+0300'), item('n0', None, 'discard', None)],
+        ])
+        sync = NegotiationSync(responder, database, per_page=2)
+        saved = await sync.sync()
+
+        fresh = NegotiationSync(responder, database)
+        await fresh.load()
+        vacancy = await database.get_vacancy_by_hh_id('2')
+        return saved, sync, fresh, vacancy, await database.get_negotiation_stats()
+
+    saved, sync, fresh, vacancy, stats = asyncio.run(with_database(run))
+    assert saved == 3
+    assert sync.is_applied('1') and sync.is_applied(' 2 ') and not sync.is_applied('3')
+    assert fresh.applied == {'1', '2'}
+    assert vacancy.applied and vacancy.applied_at.hour == 7  # created_at в UTC
+    assert stats == {'response': 1, 'invitation': 1, 'discard': 1}
+
+
+def test_incremental_sync_stops_at_known_updates(with_database):
+    async def run(database):
+        old = [item('n1', '1', 'response', '2026-01-01T10:00:00+0300')]
+        await NegotiationSync(FakeResponder([old]), database).sync()
+
+        responder = FakeResponder([
+            [item('n2', '2', 'invitation', '2026-01-05T10:00:00+0300'),
+             item('n1', '1', 'discard', '2025-12-31T10:00:00+0300')],
+            [item('n9', '9', 'response', '2025-12-01T10:00:00+0300')],
+        ])
+        await NegotiationSync(responder, database).sync()
+        return responder.requested, await database.get_negotiation_stats()
+
+    requested, stats = asyncio.run(with_database(run))
+    assert requested == [0]  # Вторая страница старше прошлой синхронизации
+    assert stats == {'invitation': 1, 'discard': 1}
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
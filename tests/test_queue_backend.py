@@ -0,0 +1,163 @@
+"""
+Тест in-process бэкенда очередей (без RabbitMQ)
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aio_pika.exceptions import MessageProcessError
+from src.core.config import settings
+from src.core.logger import get_logger
+from src.services.messages import VacancyMessage, decode_message, decode_payload
+from src.services.queue_manager import InMemoryQueueManager, InMemoryMessage, create_queue_manager
+
+logger = get_logger(__name__)
+
+
+async def roundtrip_vacancy():
+    """Вакансия проходит через очередь к обработчику"""
+    manager = InMemoryQueueManager()
+    await manager.connect()
+
+    received = []
+    done = asyncio.Event()
+
+    async def handler(message):
+        async with message.process():
+            received.append(decode_message(message, VacancyMessage))
+            done.set()
+
+    await manager.consume(settings.QUEUE_VACANCIES, handler)
+    await manager.send_vacancy_to_queue({'hh_id': '1', 'name': 'Python Developer'})
+
+    await asyncio.wait_for(done.wait(), timeout=1)
+    stats = await manager.get_queue_stats()
+    return received == [VacancyMessage(hh_id='1', name='Python Developer')] and stats[settings.QUEUE_VACANCIES] == 0
+
+
+async def nack_requeues_message():
+    """nack(requeue=True) внутри process(ignore_processed=True) возвращает сообщение в очередь"""
+    manager = InMemoryQueueManager()
+    await manager.connect()
+
+    attempts = []
+    done = asyncio.Event()
+
+    async def handler(message):
+        async with message.process(ignore_processed=True):
+            attempts.append(message.body)
+            if len(attempts) == 1:
+                await message.nack(requeue=True)
+            else:
+                done.set()
+
+    await manager.consume(settings.QUEUE_COVER_LETTERS, handler)
+    await manager.send_cover_letter_to_queue({'vacancy_id': '2', 'cover_letter': 'Здравствуйте!'})
+
+    await asyncio.wait_for(done.wait(), timeout=1)
+    await manager.close()
+    return len(attempts) == 2
+
+
+async def nack_inside_plain_process_fails():
+    """Как в aio_pika: после nack выход из process() без ignore_processed падает на ack"""
+    message = InMemoryMessage(b'{}', asyncio.Queue())
+    try:
+        async with message.process():
+            await message.nack(requeue=True)
+    except MessageProcessError:
+        return True
+    return False
+
+
+async def exception_requeues_when_asked():
+    """Исключение в process(requeue=True) возвращает сообщение с флагом redelivered"""
+    queue = asyncio.Queue()
+    message = InMemoryMessage(b'{}', queue)
+    try:
+        async with message.process(requeue=True):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    return queue.qsize() == 1 and queue.get_nowait().redelivered
+
+
+async def close_stops_consumers():
+    """close() останавливает подписчиков и дожидается сообщений в обработке"""
+    manager = InMemoryQueueManager()
+    await manager.connect()
+    finished = []
+
+    async def handler(message):
+        async with message.process():
+            await asyncio.sleep(0.05)
+            finished.append(message.body)
+
+    await manager.consume(settings.QUEUE_VACANCIES, handler)
+    await manager.send_vacancy_to_queue({'hh_id': '3', 'name': 'Python Developer'})
+    await asyncio.sleep(0.01)
+    await manager.close()
+    return len(finished) == 1 and not manager.consumers and not manager.in_flight
+
+
+def test_higher_priority_delivered_first():
+    async def run():
+        manager = InMemoryQueueManager()
+        await manager.connect()
+        for name, priority in (('low', 0), ('high', 9), ('mid', 5), ('high2', 9)):
+            await manager.publish(settings.QUEUE_VACANCIES, {'name': name}, priority)
+        queue = manager.broker.get_queue(settings.QUEUE_VACANCIES)
+        return [decode_payload(queue.get_nowait().body)['name'] for _ in range(4)]
+
+    assert asyncio.run(run()) == ['high', 'high2', 'mid', 'low']
+
+
+def test_memory_backend_requires_run_all(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_BACKEND", "memory")
+    try:
+        create_queue_manager()
+    except RuntimeError:
+        return
+    assert False, "memory вне run-all должен быть запрещен"
+
+
+def test_unknown_backend_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_BACKEND", "kafka")
+    try:
+        create_queue_manager()
+    except ValueError:
+        return
+    assert False, "неизвестный бэкенд должен быть отклонен"
+
+
+def test_nack_inside_plain_process_fails():
+    assert asyncio.run(nack_inside_plain_process_fails())
+
+
+def test_exception_requeues_when_asked():
+    assert asyncio.run(exception_requeues_when_asked())
+
+
+def test_close_stops_consumers():
+    assert asyncio.run(close_stops_consumers())
+
+
+def test_roundtrip_vacancy():
+    assert asyncio.run(roundtrip_vacancy())
+
+
+def test_nack_requeues_message():
+    assert asyncio.run(nack_requeues_message())
+
+
+async def main():
+    logger.info("ТЕСТ IN-PROCESS ОЧЕРЕДЕЙ")
+    logger.info(f"Доставка вакансии: {'ok' if await roundtrip_vacancy() else 'fail'}")
+    logger.info(f"Повторная доставка после nack: {'ok' if await nack_requeues_message() else 'fail'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
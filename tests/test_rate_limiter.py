@@ -0,0 +1,120 @@
+"""
+Тест ограничителя откликов со скользящими окнами
+"""
+
+import asyncio
+import math
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.services.rate_limiter import RateLimiter, SharedRateLimiter, HOUR, DAY
+from src.services.send_planner import send_planner
+
+T0 = 1_700_000_000.0
+
+
+def test_hourly_window_and_spacing():
+    limiter = RateLimiter(requests_per_hour=3, requests_per_day=100, min_interval=30)
+    assert limiter.next_slot(T0) == T0
+
+    for offset in (0, 40, 80):
+        limiter.record(T0 + offset)
+    # Окно заполнено: слот - когда из часа выйдет первая отправка
+    assert limiter.next_slot(T0 + 100) == T0 + HOUR
+    assert limiter.next_slot(T0 + 100, ignore_spacing=True) == T0 + HOUR
+
+    asyncio.run(limiter.release(T0 + 80))
+    assert limiter.next_slot(T0 + 60) == T0 + 70  # Только пауза после предыдущей
+    assert limiter.next_slot(T0 + 60, ignore_spacing=True) == T0 + 60
+
+
+def test_daily_window():
+    limiter = RateLimiter(requests_per_hour=100, requests_per_day=5, min_interval=0)
+    for hour in range(5):
+        limiter.record(T0 + hour * HOUR)
+    assert limiter.next_slot(T0 + 6 * HOUR) == T0 + DAY
+    # Старые отправки выходят из суток - слоты снова есть
+    assert limiter.next_slot(T0 + DAY + 1) == T0 + DAY + 1
+
+
+def test_zero_limit_pauses_sending():
+    """Явный 0 в лимите аккаунта - пауза, а не лимит по умолчанию"""
+    paused = RateLimiter(requests_per_hour=0, requests_per_day=100, min_interval=0)
+    assert paused.windows[0] == (HOUR, 0)
+    assert math.isinf(paused.next_slot(T0))
+    assert send_planner.slots(paused, T0, DAY, 5) == []
+
+
+def test_log_restored_from_applied_at(with_database):
+    """Перезапуск не обнуляет лимит: журнал строится из vacancies.applied_at"""
+    async def run(database):
+        for index in range(3):
+            vacancy = await database.save_vacancy({'hh_id': str(index), 'name': f'V{index}'})
+            await database.mark_as_applied(vacancy.id)
+        old = await database.save_vacancy({'hh_id': 'old', 'name': 'Old'})
+        await database.mark_as_applied(old.id)
+        async with database.async_session() as session:
+            stale = await session.get(type(old), old.id)
+            stale.applied_at = datetime.utcnow() - timedelta(days=2)
+            await session.commit()
+
+        limiter = RateLimiter(requests_per_hour=3, requests_per_day=100, min_interval=0, database=database)
+        await limiter.load()
+        return limiter
+
+    limiter = asyncio.run(with_database(run))
+    assert len(limiter._log) == 3
+    assert HOUR - 60 < limiter.get_remaining_time() <= HOUR
+
+
+def test_acquire_reserves_slot():
+    async def run():
+        limiter = RateLimiter(requests_per_hour=1, requests_per_day=10, min_interval=0)
+        slot = await limiter.acquire()
+        blocked = limiter.get_remaining_time()
+        await limiter.release(slot)
+        return slot, blocked, limiter.get_remaining_time()
+
+    slot, blocked, after_release = asyncio.run(run())
+    assert abs(slot - time.time()) < 5
+    assert blocked > HOUR - 5 and after_release == 0
+
+
+def test_shared_budget_across_replicas(with_database):
+    """Две реплики отправителя на одной БД делят один часовой лимит"""
+    async def run(database):
+        vacancy = await database.save_vacancy({'hh_id': 'sent', 'name': 'Sent'})
+        await database.mark_as_applied(vacancy.id)
+
+        replicas = [SharedRateLimiter(requests_per_hour=4, requests_per_day=100, min_interval=0,
+                                      database=database, holder=f'replica-{index}') for index in range(2)]
+        for replica in replicas:
+            await replica.load()  # Бюджет создается один раз, отправка из applied_at учтена
+
+        leases = await asyncio.gather(*(replica.acquire(vacancy_id=str(index))
+                                        for index, replica in enumerate(replicas)))
+        leases.append(await replicas[0].acquire())
+        # Окно заполнено: четвертой отправки (с учетом applied_at) больше нет ни у одной реплики
+        blocked = await asyncio.gather(*(asyncio.wait_for(replica.acquire(), 0.5) for replica in replicas),
+                                       return_exceptions=True)
+        await replicas[1].refresh()
+        remaining = replicas[1].get_remaining_time()
+
+        await replicas[0].release(leases[0])
+        freed = await asyncio.wait_for(replicas[1].acquire(), 5)
+        return leases, blocked, remaining, freed
+
+    leases, blocked, remaining, freed = asyncio.run(with_database(run))
+    assert len(set(leases)) == 3 and all(leases)
+    assert all(isinstance(result, asyncio.TimeoutError) for result in blocked)
+    assert remaining > HOUR - 60
+    assert freed not in leases
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,66 @@
+"""
+Тест скоринга релевантности вакансий (TF-IDF на хешированных термах)
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.config import settings
+from src.services.queue_manager import InMemoryQueueManager
+from src.services.relevance import RelevanceScorer
+from src.services.near_duplicates import NearDuplicateIndex
+import src.services.vacancy_searcher as vacancy_searcher
+
+PROFILE = "Python backend FastAPI PostgreSQL asyncio Docker"
+
+PYTHON = {'hh_id': '1', 'name': 'Python backend developer', 'company': 'A',
+          'skills': 'Python, FastAPI, PostgreSQL', 'description': '<p>Пишем сервисы на <b>FastAPI</b> и asyncio</p>',
+          'url': 'https://hh.ru/vacancy/1'}
+GENERIC = {'hh_id': '2', 'name': 'Backend developer', 'company': 'B',
+           'skills': 'Node.js, TypeScript', 'description': 'Сервисы на Node.js и MongoDB',
+           'url': 'https://hh.ru/vacancy/2'}
+ACCOUNTANT = {'hh_id': '3', 'name': 'Бухгалтер', 'company': 'C',
+              'skills': '1С', 'description': 'Ведение учета, отчетность', 'url': 'https://hh.ru/vacancy/3'}
+
+
+def test_page_scores_rank_matches_and_idf_persists(with_database):
+    async def run(database):
+        scorer = RelevanceScorer(database, profile=PROFILE)
+        scores = await scorer.score_page([PYTHON, GENERIC, ACCOUNTANT])
+        doc_freqs, _ = await database.get_idf_table()
+
+        reloaded = RelevanceScorer(database, profile=PROFILE)
+        await reloaded.load()
+        return scores, doc_freqs, scorer, reloaded
+
+    scores, doc_freqs, scorer, reloaded = asyncio.run(with_database(run))
+    assert scores[0] > scores[1] > scores[2] == 0
+    assert sum(doc_freqs.values()) == int(scorer.doc_freq.sum())
+    assert (reloaded.doc_freq == scorer.doc_freq).all()
+
+
+def test_search_page_gates_weak_matches_and_sets_priority(monkeypatch, with_database):
+    monkeypatch.setattr(settings, "RELEVANCE_MIN_SCORE", 0.05)
+
+    async def run(database):
+        monkeypatch.setattr(vacancy_searcher, "db", database)
+        monkeypatch.setattr(vacancy_searcher, "relevance_scorer", RelevanceScorer(database, profile=PROFILE))
+        monkeypatch.setattr(vacancy_searcher, "near_duplicate_index", NearDuplicateIndex(database))
+        searcher = vacancy_searcher.VacancySearcher()
+        searcher.queue_manager = InMemoryQueueManager()
+        await searcher.queue_manager.connect()
+
+        result = await searcher._process_vacancies_list([dict(ACCOUNTANT), dict(PYTHON)])
+        queue = searcher.queue_manager.broker.get_queue(settings.QUEUE_VACANCIES)
+        queued = [queue.get_nowait() for _ in range(queue.qsize())]
+        accountant = await database.get_vacancy_by_hh_id('3')
+        return result['stats'], queued, accountant
+
+    stats, queued, accountant = asyncio.run(with_database(run))
+    assert stats['low_relevance'] == 1 and stats['sent_to_queue'] == 1
+    assert len(queued) == 1 and queued[0].priority > 0
+    # Отсеченная вакансия не восстанавливается в очередь как необработанная
+    assert accountant.processed and accountant.relevance_score == 0
@@ -0,0 +1,121 @@
+"""
+Тест массовой переобработки сохраненных вакансий (main.py reprocess)
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from src.core.config import settings
+from src.services.relevance import RelevanceScorer
+from src.services.queue_manager import InMemoryQueueManager
+from src.services.reprocessor import Reprocessor, ReprocessFilter
+from src.services.vacancy_processor import VacancyProcessor
+from src.api.deepseek_client import LetterGeneration, SOURCE_LLM
+
+
+def vacancy(hh_id, name, description, **extra):
+    return {'hh_id': hh_id, 'name': name, 'company': f'Компания {hh_id}', 'description': description,
+            'skills': '', 'url': f'https://hh.ru/vacancy/{hh_id}', **extra}
+
+
+# Строки, сохраненные до нормализации: описание в HTML, токенов нет
+ROWS = [
+    vacancy('1', 'Python разработчик', '<p>Сервисы на <b>FastAPI</b></p>'),
+    vacancy('2', 'Бухгалтер', '<p>Учет и отчетность</p>'),
+    vacancy('3', 'Django developer', '<p>Веб&nbsp;приложения</p>'),
+    vacancy('4', 'Python backend', '<p>Уже откликнулись</p>', applied=True),
+    vacancy('5', 'Python разработчик', '<p>Перепубликация</p>', duplicate_of='1'),
+]
+
+
+async def make_reprocessor(database, **kwargs):
+    processor = VacancyProcessor()
+    processor.queue_manager = InMemoryQueueManager()
+    await processor.queue_manager.connect()
+    return Reprocessor(processor=processor, database=database,
+                       scorer=RelevanceScorer(database, profile="python fastapi django"), **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def template_letters(monkeypatch):
+    monkeypatch.setattr(settings, "DEEPSEEK_USE_LLM", False)
+    monkeypatch.setattr(settings, "RELEVANCE_MIN_SCORE", 0)
+    monkeypatch.setattr(settings, "CPU_POOL_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_BATCH_MAX_WAIT", 0.01)
+
+
+def test_filter_parsing():
+    vacancy_filter = ReprocessFilter.parse(["applied=false", "min_relevance=0.2", "keyword=Django"])
+    assert vacancy_filter.applied is False and vacancy_filter.min_relevance == 0.2
+    assert vacancy_filter.keyword == 'django'
+    assert vacancy_filter.checkpoint_name() == ReprocessFilter.parse(
+        ["keyword=Django", "min_relevance=0.2", "applied=false"]).checkpoint_name()
+
+    for bad in (["color=red"], ["applied=maybe"], ["since=вчера"], ["applied"]):
+        with pytest.raises(ValueError):
+            ReprocessFilter.parse(bad)
+
+
+def test_reprocess_normalizes_scores_and_regenerates_letters(with_database):
+    async def run(database):
+        # Прежнее письмо LLM вакансии, которая больше не проходит фильтры
+        accountant = await database.get_vacancy_by_hh_id('2')
+        await database.mark_cover_letter_generated(
+            accountant.id, 'Старое письмо', LetterGeneration('Старое письмо', SOURCE_LLM, 100, 50, 0.01))
+        reprocessor = await make_reprocessor(database, enqueue=True)
+        stats = await reprocessor.run(ReprocessFilter.parse([]))
+        usage = await database.get_llm_usage_stats()
+        rows = {hh_id: await database.get_vacancy_by_hh_id(hh_id) for hh_id in '12345'}
+        queued = reprocessor.processor.queue_manager.broker.get_queue(settings.QUEUE_COVER_LETTERS).qsize()
+        checkpoint = await database.get_reprocess_checkpoint(ReprocessFilter.parse([]).checkpoint_name())
+        return stats, rows, queued, checkpoint, usage
+
+    stats, rows, queued, checkpoint, usage = asyncio.run(with_database(run, ROWS))
+
+    # Перепубликация по умолчанию не берется
+    assert stats.scanned == 4 and rows['5'].search_text is None
+    assert stats.letters == 2 and stats.not_python == 1 and queued == 2 == stats.enqueued
+
+    assert rows['1'].description == 'Сервисы на FastAPI' and rows['1'].description_html.startswith('<p>')
+    assert rows['1'].search_text == 'python разработчик сервисы на fastapi'
+    assert rows['3'].description == 'Веб приложения'
+    assert rows['1'].cover_letter_generated and rows['1'].letter_source == 'template'
+    assert rows['1'].letter_variant == 'python_project'
+    # Шаблонное письмо хранится ссылкой, не текстом
+    assert rows['1'].cover_letter is None and '"t":"python_project"' in rows['1'].letter_template
+    assert rows['1'].relevance_score > 0
+    assert rows['2'].processed and not rows['2'].cover_letter_generated
+    # Письмо отфильтрованной вакансии не числится ни в статусе, ни в расходе LLM
+    assert rows['2'].cover_letter is None and rows['2'].letter_source is None and 'llm' not in usage
+
+    # Отклик уже отправлен: новая оценка, письмо не трогаем
+    assert rows['4'].relevance_score is not None and not rows['4'].cover_letter_generated
+    assert checkpoint is None
+
+
+def test_reprocess_resumes_from_checkpoint(with_database):
+    async def run(database):
+        vacancy_filter = ReprocessFilter.parse(["applied=false"])
+        reprocessor = await make_reprocessor(database, batch_size=2)
+
+        def stop_after_first_page(stats):
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            await reprocessor.run(vacancy_filter, on_progress=stop_after_first_page)
+        checkpoint = await database.get_reprocess_checkpoint(vacancy_filter.checkpoint_name())
+
+        resumed = await reprocessor.run(vacancy_filter)
+        return checkpoint, resumed
+
+    checkpoint, resumed = asyncio.run(with_database(run, ROWS))
+    assert checkpoint.processed == 2 and checkpoint.last_id == 2
+    assert resumed.total == 1 and resumed.scanned == 1 and resumed.letters == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,101 @@
+"""
+Тест проверки писем в интерактивном режиме: решения пачкой, отправка через планировщик
+"""
+
+import asyncio
+import os
+import sys
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiohttp.test_utils import TestClient, TestServer
+from src.services.rate_limiter import RateLimiter
+from src.services.review_queue import ReviewQueue
+from src.services.review_web import ReviewServer
+from src.services.send_scheduler import SendScheduler, OUTCOME_SENT
+
+
+def letter(vacancy_id, relevance):
+    return {'vacancy_id': vacancy_id, 'vacancy_name': f'Vacancy {vacancy_id}', 'company': '<Co & Co>',
+            'cover_letter': f'Letter {vacancy_id}', 'url': f'https://hh.ru/vacancy/{vacancy_id}',
+            'relevance': relevance, 'letter_template': None}
+
+
+async def with_review_queue(run, database):
+    """run(review_queue, database, sent) с работающими планировщиком и подачей писем"""
+    limiter = RateLimiter(requests_per_hour=100, requests_per_day=100, min_interval=0)
+    sent = []
+
+    async def send(cover_data):
+        await limiter.acquire()
+        sent.append(cover_data['vacancy_id'])
+        return OUTCOME_SENT
+
+    scheduler = SendScheduler(limiter, send, max_hold=60, lookahead=0)
+    review_queue = ReviewQueue(scheduler, database, capacity=2, poll_interval=0.05)
+    tasks = [asyncio.create_task(scheduler.run()), asyncio.create_task(review_queue.run())]
+    try:
+        return await run(review_queue, database, sent)
+    finally:
+        for task in tasks:
+            task.cancel()
+        scheduler.close()
+
+
+async def wait_for_status(database, vacancy_ids, status):
+    for _ in range(100):
+        reviews = await database.get_letter_reviews((status,))
+        if {review.vacancy_id for review in reviews} >= set(vacancy_ids):
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"{vacancy_ids} не получили статус {status}")
+
+
+def test_batch_approved_letters_are_sent_rejected_are_not(with_database):
+    async def run(review_queue, database, sent):
+        for vacancy_id, relevance in (('1', 0.2), ('2', 0.9), ('3', 0.5), ('4', 0.1)):
+            await review_queue.add(letter(vacancy_id, relevance))
+        # Повторная доставка письма, ожидающего решения, не создает вторую запись
+        await review_queue.add(letter('1', 0.3))
+        assert [review.vacancy_id for review in await review_queue.pending()] == ['2', '3', '1', '4']
+        assert sent == []  # Без решения ничего не уходит
+
+        decided = await review_queue.decide(approve=['1', '2', '3'], reject=['4'])
+        await wait_for_status(database, ['1', '2', '3'], 'sent')
+        # Решение по уже отправленному письму ничего не меняет
+        again = await review_queue.decide(reject=['2'])
+        return decided, again, sent, await database.get_letter_review_stats()
+
+    decided, again, sent, stats = asyncio.run(with_database(partial(with_review_queue, run)))
+    assert decided == {'approved': 3, 'rejected': 1}
+    assert again == {'approved': 0, 'rejected': 0}
+    assert sorted(sent) == ['1', '2', '3']
+    assert stats == {'sent': 3, 'rejected': 1}
+
+
+def test_review_page_and_api_require_token(with_database):
+    async def run(review_queue, database, sent):
+        await review_queue.add(letter('10', 0.7))
+        server = ReviewServer(review_queue, token='secret')
+        async with TestClient(TestServer(server.create_app())) as client:
+            denied = await client.get('/api/reviews')
+            page = await client.get('/', params={'token': 'secret'})
+            html = await page.text()
+            listed = await (await client.get('/api/reviews', headers={'X-Review-Token': 'secret'})).json()
+            decision = await client.post('/decide', params={'token': 'secret'},
+                                         data={'id': '10', 'action': 'approve'}, allow_redirects=False)
+        await wait_for_status(database, ['10'], 'sent')
+        return denied.status, html, listed, decision.status, sent
+
+    denied, html, listed, decision, sent = asyncio.run(with_database(partial(with_review_queue, run)))
+    assert denied == 401
+    assert '&lt;Co &amp; Co&gt;' in html and 'Letter 10' in html
+    assert [item['vacancy_id'] for item in listed['items']] == ['10']
+    assert decision == 303
+    assert sent == ['10']
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,84 @@
+"""
+Тест плана отправки: оценка писем, слоты лимитера и рабочие часы
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.services.rate_limiter import RateLimiter
+from src.services.send_planner import SendPlanner, WorkingHours
+
+MOSCOW = ZoneInfo('Europe/Moscow')
+
+
+def stamp(*args):
+    return datetime(*args, tzinfo=MOSCOW).timestamp()
+
+
+def test_working_hours_move_slot_to_next_open_day():
+    hours = WorkingHours(start=9, end=19, days=[0, 1, 2, 3, 4], tz_name='Europe/Moscow')
+    # 2026-10-16 - пятница
+    assert hours.next_open(stamp(2026, 10, 16, 12, 30)) == stamp(2026, 10, 16, 12, 30)
+    assert hours.next_open(stamp(2026, 10, 16, 7, 0)) == stamp(2026, 10, 16, 9, 0)
+    assert hours.next_open(stamp(2026, 10, 16, 19, 0)) == stamp(2026, 10, 19, 9, 0)
+    assert WorkingHours(start=0, end=24, days=range(7)).next_open(123.0) == 123.0
+
+
+def test_plan_fills_limiter_slots_with_best_letters(with_database):
+    async def run(database):
+        now = datetime.utcnow()
+        vacancies = {
+            # hh_id: (релевантность, зарплата, валюта, работодатель, часов с публикации)
+            '1': (0.7, None, None, 'Slow', 0),
+            '2': (0.5, 300000, 'RUR', 'Hiring', 0),
+            '3': (0.5, None, None, 'Other', 200),
+            '4': (0.3, None, None, 'Other', 0),
+            '5': (0.95, None, None, 'Done', 0),
+        }
+        for hh_id, (relevance, salary, currency, company, age) in vacancies.items():
+            vacancy = await database.save_vacancy({
+                'hh_id': hh_id, 'name': f'V{hh_id}', 'company': company, 'salary_from': salary,
+                'salary_currency': currency, 'published_at': now - timedelta(hours=age),
+            })
+            await database.mark_cover_letter_generated(vacancy.id, 'text')
+            await database.save_relevance_scores({hh_id: relevance})
+        await database.upsert_negotiations([
+            {'id': f'n{index}', 'vacancy_id': f'old{index}', 'vacancy_name': 'Old', 'company': company,
+             'state': state, 'created_at': now, 'updated_at': now, 'synced_at': now}
+            for index, (company, state) in enumerate(
+                [('Hiring', 'invitation'), ('Hiring', 'interview'), ('Slow', 'response'), ('Slow', 'discard')])
+        ])
+        # Отклоненное на проверке письмо в план не попадает
+        await database.add_letter_review({'vacancy_id': '5', 'cover_letter': 'text'})
+        await database.set_letter_review_status(['5'], 'rejected')
+
+        planner = SendPlanner(database, WorkingHours(start=0, end=24, days=range(7)))
+        await planner.load_employers()
+        candidates = await planner.candidates()
+
+        limiter = RateLimiter(requests_per_hour=2, requests_per_day=3, min_interval=600)
+        started = now.replace(tzinfo=timezone.utc).timestamp()
+        planned = planner.plan(candidates, limiter, now=started, horizon_hours=24)
+        return candidates, planned, started, limiter
+
+    candidates, planned, started, limiter = asyncio.run(with_database(run))
+    assert sorted(candidate.vacancy_id for candidate in candidates) == ['1', '2', '3', '4']
+    # Пауза 600 с, два отклика в час, три в сутки
+    assert [send.at - started for send in planned] == [0, 600, 3600]
+    # '2' обгоняет более релевантную '1' зарплатой и приглашениями работодателя,
+    # '3' с той же релевантностью, что у '2', не попадает в план из-за возраста вакансии
+    assert [send.candidate.vacancy_id for send in planned] == ['2', '1', '4']
+    assert planned[0].components['employer'] > planned[1].components['employer']
+    assert planned[2].components['freshness'] > 0.9
+    # План считается на копии журнала
+    assert limiter.next_slot(started) == started
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
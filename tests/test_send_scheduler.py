@@ -0,0 +1,118 @@
+"""
+Тест планировщика отправки: лучшее письмо в каждый слот, без фиксированных пауз
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.services.rate_limiter import RateLimiter
+from src.services.send_scheduler import SendScheduler, OUTCOME_SENT, OUTCOME_REQUEUE, OUTCOME_SKIPPED
+
+
+def letter(vacancy_id, relevance):
+    return {'vacancy_id': vacancy_id, 'relevance': relevance}
+
+
+async def with_scheduler(run, min_interval=0.3, max_hold=60, validate=None, not_before=None):
+    limiter = RateLimiter(requests_per_hour=100, requests_per_day=100, min_interval=min_interval)
+    sent = []
+
+    async def send(cover_data):
+        await limiter.acquire()
+        sent.append((cover_data['vacancy_id'], time.monotonic()))
+        return OUTCOME_SENT
+
+    scheduler = SendScheduler(limiter, send, max_hold=max_hold, validate=validate, lookahead=2,
+                              not_before=not_before)
+    dispatcher = asyncio.create_task(scheduler.run())
+    try:
+        return await run(scheduler, sent)
+    finally:
+        dispatcher.cancel()
+        scheduler.close()
+
+
+def test_best_letter_goes_into_each_slot():
+    async def run(scheduler, sent):
+        started = time.monotonic()
+        first = scheduler.submit(letter('first', 0.1))
+        await asyncio.sleep(0.05)  # Первое письмо уходит сразу, следующий слот через 0.3 с
+        outcomes = [scheduler.submit(letter(vacancy_id, relevance))
+                    for vacancy_id, relevance in (('low', 0.2), ('high', 0.9), ('mid', 0.5))]
+        results = await asyncio.wait_for(asyncio.gather(first, *outcomes), 5)
+        return started, results, sent
+
+    started, results, sent = asyncio.run(with_scheduler(run))
+    assert results == [OUTCOME_SENT] * 4
+    assert [vacancy_id for vacancy_id, _ in sent] == ['first', 'high', 'mid', 'low']
+    assert sent[0][1] - started < 0.2  # Без фиксированной задержки перед отправкой
+    gaps = [b[1] - a[1] for a, b in zip(sent, sent[1:])]
+    assert all(gap >= 0.25 for gap in gaps)
+
+
+def test_letter_held_too_long_is_requeued():
+    async def run(scheduler, sent):
+        scheduler.rate_limiter.record(time.time())  # Слот откроется только через min_interval
+        outcome = await asyncio.wait_for(scheduler.submit(letter('stuck', 0.5)), 5)
+        return outcome, len(scheduler), sent
+
+    outcome, pending, sent = asyncio.run(with_scheduler(run, min_interval=30, max_hold=0.2))
+    assert outcome == OUTCOME_REQUEUE
+    assert pending == 0 and sent == []
+
+
+def test_redelivery_replaces_waiting_copy():
+    async def run(scheduler, sent):
+        scheduler.rate_limiter.record(time.time())
+        old = scheduler.submit(letter('dup', 0.5))
+        new = scheduler.submit(letter('dup', 0.5))
+        return await asyncio.wait_for(old, 1), new.done(), len(scheduler)
+
+    old_outcome, new_done, pending = asyncio.run(with_scheduler(run, min_interval=30))
+    assert old_outcome != OUTCOME_SENT
+    assert not new_done and pending == 1
+
+
+def test_closed_vacancies_dropped_before_their_slot():
+    checked = []
+
+    async def validate(vacancy_ids):
+        checked.append(sorted(vacancy_ids))
+        return {'closed'}
+
+    async def run(scheduler, sent):
+        scheduler.rate_limiter.record(time.time())  # Слот через 0.3 с: есть время проверить письма
+        closed = scheduler.submit(letter('closed', 0.9))
+        alive = scheduler.submit(letter('alive', 0.5))
+        results = await asyncio.wait_for(asyncio.gather(closed, alive), 5)
+        return results, sent
+
+    results, sent = asyncio.run(with_scheduler(run, validate=validate))
+    assert results == [OUTCOME_SKIPPED, OUTCOME_SENT]
+    assert [vacancy_id for vacancy_id, _ in sent] == ['alive']
+    assert ['alive', 'closed'] in checked  # Проверены до открытия слота, одной пачкой
+
+
+
+def test_plan_priority_and_working_window():
+    opens, opens_monotonic = time.time() + 0.3, time.monotonic() + 0.3
+
+    async def run(scheduler, sent):
+        # Оценка плана важнее релевантности; до открытия окна ничего не уходит
+        low = scheduler.submit(letter('relevant', 0.9), priority=0.1)
+        high = scheduler.submit(letter('planned', 0.2), priority=0.8)
+        results = await asyncio.wait_for(asyncio.gather(low, high), 5)
+        return results, sent
+
+    results, sent = asyncio.run(with_scheduler(run, min_interval=0, not_before=lambda slot: max(slot, opens)))
+    assert results == [OUTCOME_SENT, OUTCOME_SENT]
+    assert [vacancy_id for vacancy_id, _ in sent] == ['planned', 'relevant']
+    assert sent[0][1] >= opens_monotonic - 0.05
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,53 @@
+"""
+Тест нормализации описаний вакансий при приеме (HTML -> текст, токены)
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.core.text import build_search_text, html_to_text, search_text_of, text_hash
+from src.services.text_features import compute_vacancy_features
+from src.api.deepseek_client import DeepSeekClient
+from src.core.letter_templates import letter_templates
+
+HTML = ("<p><strong>Ищем</strong>&nbsp;Python-разработчика &amp; DevOps</p>"
+        "<ul><li>FastAPI</li><li>Базы   данных: PostgreSQL</li></ul><br/>Ёлка")
+
+
+def test_html_to_text():
+    """Теги и сущности убраны, блоки - отдельные строки, пробелы схлопнуты"""
+    assert html_to_text(HTML) == ("Ищем Python-разработчика & DevOps\nFastAPI\n"
+                                  "Базы данных: PostgreSQL\nЁлка")
+    assert html_to_text('') == ''
+    assert html_to_text('просто текст') == 'просто текст'
+
+
+def test_features_carry_normalized_text():
+    """Стадия признаков отдает обычный текст и токены, совпадающие с расчетом на месте"""
+    vacancy = {'name': 'Senior Python Developer', 'skills': 'Python, SQL', 'description': HTML}
+    features = compute_vacancy_features([vacancy])[0]
+
+    assert features.description == html_to_text(HTML)
+    assert features.search_text == build_search_text(vacancy['name'], vacancy['skills'], features.description)
+    assert 'amp' not in features.search_text.split() and 'nbsp' not in features.search_text.split()
+    assert 'елка' in features.search_text.split()
+    assert features.text_hash == text_hash(features.search_text)
+
+
+def test_worker_checks_read_search_text():
+    """Проверки воркера читают сохраненные токены; без них - расчет из полей сообщения"""
+    client = DeepSeekClient()
+    stored = {'name': 'Инженер', 'company': 'ООО', 'description': '', 'search_text': 'инженер django'}
+    assert client._is_python_vacancy(stored)
+    assert 'Django' in letter_templates.attraction(stored).text
+
+    legacy = {'name': 'Инженер', 'company': 'ООО', 'skills': '', 'description': '<p>Стек: FastAPI</p>'}
+    assert search_text_of(legacy) == 'инженер стек fastapi'
+    assert 'FastAPI' in letter_templates.attraction(legacy).text
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,48 @@
+"""
+Тест проверки вакансий перед отправкой: закрытые отсеиваются и помечаются в БД
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.services.vacancy_liveness import VacancyLiveness
+
+
+class FakeClient:
+    """Состояния вакансий: True - открыта, False - в архиве, None - ошибка запроса"""
+
+    def __init__(self, states):
+        self.states = states
+        self.requested = []
+
+    async def get_vacancy_state(self, vacancy_id):
+        self.requested.append(vacancy_id)
+        return self.states[vacancy_id]
+
+
+def test_closed_vacancies_are_cached_and_marked(with_database):
+    async def run(database):
+        for hh_id in ('1', '2', '3'):
+            vacancy = await database.save_vacancy({'hh_id': hh_id, 'name': f'V{hh_id}'})
+            await database.mark_cover_letter_generated(vacancy.id, 'text')
+
+        client = FakeClient({'1': True, '2': False, '3': None})
+        liveness = VacancyLiveness(client, database, ttl=60)
+        first = await liveness.find_closed(['1', '2', '3', '2'])
+        second = await liveness.find_closed(['1', '2', '3'])
+        pending = [vacancy.hh_id for vacancy in await database.get_pending_cover_letters()]
+        return first, second, client.requested, pending
+
+    first, second, requested, pending = asyncio.run(with_database(run))
+    assert first == second == {'2'}
+    # Ответы кэшируются, ошибка запроса - нет
+    assert requested == ['1', '2', '3', '3']
+    assert sorted(pending) == ['1', '3']
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
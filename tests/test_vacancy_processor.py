@@ -31,7 +31,11 @@ async def test_deepseek_connection():
     logger.info("DEEPSEEK_API_KEY найден")
 
     # Тестируем подключение
-    if await client.test_connection():
+    try:
+        connected = await client.test_connection()
+    finally:
+        await client.close()
+    if connected:
         logger.info("Подключение к DeepSeek API успешно")
         return True
     else: